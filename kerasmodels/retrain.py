@@ -29,6 +29,13 @@ from keras.models import Sequential
 # for unzipping utility to train a model based on zipped training images
 import zipfile
 
+# for training from the tar shards of render_pipeline.full_run(shard_size=...)
+try:
+    from src.rendering.SceneLib.Shard_Images import ShardReader, ShardSequence, find_shards
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+    from rendering.SceneLib.Shard_Images import ShardReader, ShardSequence, find_shards
+
 # for customizing SGD, rmsprop
 from keras.optimizers import SGD, RMSprop
 
@@ -175,7 +182,7 @@ class KerasInception:
         build the InceptionV3 architecture based on the object instance
         attributes such as number of dense layers, dropout etc
         """
-        class_count = len(next(os.walk(train_dir))[1])
+        class_count = len(list_classes(train_dir))
 
         # base pre-trained model
         base_model = InceptionV3(weights='imagenet', include_top=False)
@@ -226,21 +233,42 @@ class KerasInception:
         my_file = os.path.join(classes_txt_dir, filename)
         print("Writing classes.txt to:\n",my_file,'\n')
         print("Classes found:")
-        for name in os.listdir(train_dir):
-            if not os.path.isfile(name):
-                print(name)
+        classes = list_classes(train_dir)
+        for name in classes:
+            print(name)
 
         # check if file already exists
         if not os.path.isfile(my_file):
-            # write all folder names to txt file
+            # write all class names to txt file
             with open(my_file, "w") as classes_file:
-                for name in os.listdir(train_dir):
-                    # exclude files
-                    if not os.path.isfile(name):
-                        classes_file.write(name)
-                        classes_file.write("\n")
+                for name in classes:
+                    classes_file.write(name)
+                    classes_file.write("\n")
             classes_file.close()
 
+    def flow(self,datagen,directory,batch_size,shuffle=True):
+        """
+        generator of batches of (images, one-hot labels) of a directory,
+        augmented by datagen and resized to input_dimxinput_dim
+        directory: folder with one folder of images per class, or a folder
+            of tar shards (see find_shards), read without extracting them
+        """
+        target_size = (self.input_dim, self.input_dim)
+        shards = find_shards(directory)
+        if shards:
+            # the same augmentation as flow_from_directory, image by image
+            return ShardSequence(shards,
+                    batch_size=batch_size,
+                    target_size=target_size,
+                    shuffle=shuffle,
+                    preprocessing_function=lambda x: datagen.standardize(datagen.random_transform(x)))
+        return datagen.flow_from_directory(
+                directory,
+                target_size=target_size,
+                batch_size=batch_size,
+                class_mode='categorical',
+                shuffle=shuffle)
+
     def unfreeze(self,layers):
         """
         unfreeze a specified number of InceptionV3 layers ard recompile model
@@ -311,23 +339,14 @@ class KerasInception:
         # generator that will read pictures found in train_dir, and
         # indefinitely generate batches of augmented image data and
         # rescales images to target_size, splits them into batches
-        train_generator = train_datagen.flow_from_directory(
-                train_dir,  # this is the target directory
-                target_size=(self.input_dim, self.input_dim),  # all images will be resized to input_dimxinput_dim
-                batch_size=self.batch_size,
-                class_mode='categorical',
-                shuffle=True)
+        train_generator = self.flow(train_datagen, train_dir, self.batch_size)
 
         # augmentation configuration for validation: only rescaling
         validation_datagen = ImageDataGenerator(rescale=1./255)
 
         # generator for validation data
         # similar to above but based on different augmentation function (above)
-        validation_generator = validation_datagen.flow_from_directory(
-                validation_dir,
-                target_size=(self.input_dim, self.input_dim),
-                batch_size=self.batch_size,
-                class_mode='categorical')
+        validation_generator = self.flow(validation_datagen, validation_dir, self.batch_size)
 
 
         # log everything in tensorboard
@@ -409,11 +428,7 @@ class KerasInception:
 
         # generator for test data
         # similar to above but based on different augmentation function (above)
-        test_generator = test_datagen.flow_from_directory(
-                test_dir,
-                target_size=(self.input_dim, self.input_dim),
-                batch_size=16,
-                class_mode='categorical')
+        test_generator = self.flow(test_datagen, test_dir, 16)
 
         score = self.model.evaluate_generator(test_generator)
         print('Test loss:', score[0])
@@ -453,13 +468,39 @@ def get_augmentation_params(augmentation_mode):
         print("UNKNOWN AUGMENTATION PARAMETER! (needs to be 0, 1 or 2)")
         sys.exit(0)
 
+def list_classes(train_dir):
+    """
+    returns the sorted class names of a folder of training images, its
+    subfolders or the classes of its shards
+    """
+    shards = find_shards(train_dir)
+    if shards:
+        return ShardReader(shards).classes
+    return sorted(next(os.walk(train_dir))[1])
+
+def get_train_dir(path_of_zip):
+    """
+    returns the directory of training images of the result of
+    render_pipeline.full_run: the shards of a folder written with
+    shard_size, otherwise the images folder of the unzipped zip file
+    """
+    unzipped_dir = unzip_and_return_path_to_folder(path_of_zip)
+    shards = find_shards(unzipped_dir)
+    if shards:
+        return shards
+    return os.path.join(unzipped_dir, 'images')
+
 def unzip_and_return_path_to_folder(path_to_zip_file):
     """
     utility to unzip files containing training images
     input = path to a zip file
     unzips the file to a folder with the same name
     returns path to this folder
+    a folder of tar shards (see find_shards) is returned as it is, the shards
+    are read without extracting them
     """
+    if os.path.isdir(path_to_zip_file) and find_shards(path_to_zip_file):
+        return path_to_zip_file
 
     maindirname, filename = os.path.split(path_to_zip_file)
 
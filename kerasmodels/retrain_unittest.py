@@ -5,6 +5,11 @@ import numpy as np
 import pathlib
 
 import os
+import shutil
+import tempfile
+
+# retrain puts src on the path
+from rendering.SceneLib.Shard_Images import ShardWriter
 
 file_dir = os.path.dirname(os.path.realpath(__file__))
 
@@ -136,6 +141,38 @@ class TestKerasRetrain(unittest.TestCase):
         # check if significantly better than random
         self.assertTrue( score[1] > 0.6 )
 
+    # tests that a model trains from the tar shards of a render run with
+    # shard_size, which are read without extracting them
+    def test_training_from_shards(self):
+        images_dir = os.path.join(file_dir,'unit_test_images')
+        run_dir = tempfile.mkdtemp()
+        with ShardWriter(os.path.join(run_dir,'shards'),images_dir) as writer:
+            for class_name in sorted(os.listdir(images_dir)):
+                for name in sorted(os.listdir(os.path.join(images_dir,class_name))):
+                    path = os.path.join(images_dir,class_name,name)
+                    with open(path,'rb') as f:
+                        writer.add(path,f.read())
+
+        self.assertEqual(rt.unzip_and_return_path_to_folder(run_dir),run_dir)
+        train_dir = rt.get_train_dir(run_dir)
+        self.assertEqual(train_dir,os.path.join(run_dir,'shards'))
+        self.assertEqual(rt.list_classes(train_dir),rt.list_classes(images_dir))
+
+        model = rt.KerasInception(dense_layers=1,
+                                dropout=0,
+                                dense_dim=1024)
+
+        model.train(train_dir=train_dir,
+                    validation_dir=train_dir,
+                    epochs=1,
+                    steps_per_epoch=32
+                    )
+        self.assertEqual(model.model.output_shape[-1],len(rt.list_classes(images_dir)))
+
+        score = model.evaluate(test_dir=train_dir)
+        self.assertTrue( 0 <= score[1] <= 1 )
+        shutil.rmtree(run_dir)
+
     def test_layers_connected(self):
         train_dir = os.path.join(file_dir,'unit_test_images/')
         validation_dir = os.path.join(file_dir,'unit_test_images/')
@@ -128,9 +128,8 @@ def main():
     # run blender pipeline and produce a zip with all rendered images
     path_of_zip = render_pipeline.full_run(**arguments)
 
-    # load train images from the zip file
-    unzipped_dir = retrain.unzip_and_return_path_to_folder(path_of_zip)
-    train_dir = unzipped_dir + '/images'
+    # load train images from the zip file, or the shards of a run with shard_size
+    train_dir = retrain.get_train_dir(path_of_zip)
 
     # get path for classes.txt
     main_dir, filename = os.path.split(path_of_zip)
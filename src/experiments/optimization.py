@@ -39,6 +39,12 @@ test_dir = '/vol/project/2017/530/g1753002/manhattan_project/test_data/official_
 
 launch_datetime = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
 
+bl_path = '/vol/project/2017/530/g1753002/Blender/blender-2.79-linux-glibc219-x86_64/blender' # for GPU04
+
+# Blender render server shared by all pipeline evaluations, started in
+# bayes_optimization_pipeline so Blender is only launched once
+render_server = None
+
 def evaluate_pipeline(learning_rate,dense_layers,batch_size,dropout,dense_dim,
         num_lamps_mid, num_lamps_scale, lamp_energy_mu, lamp_energy_sigmu,
         camera_loc_phi_sigma, camera_radius_mu,camera_radius_sigmu):
@@ -52,7 +58,6 @@ def evaluate_pipeline(learning_rate,dense_layers,batch_size,dropout,dense_dim,
     adjust_brightness = False
 
 
-    bl_path = '/vol/project/2017/530/g1753002/Blender/blender-2.79-linux-glibc219-x86_64/blender' # for GPU04
     obj_set = os.path.join(workspace, 'object_files','ten_set_model_format') # obj files
 
     # turn float inputs from BO to ints
@@ -101,7 +106,8 @@ def evaluate_pipeline(learning_rate,dense_layers,batch_size,dropout,dense_dim,
         "work_dir": workspace,
         "generate_background": False,
         "background_database": background_database,
-        "blender_attributes": blender_attributes
+        "blender_attributes": blender_attributes,
+        "render_server": render_server
         }
 
 
@@ -200,9 +206,8 @@ def evaluate_cnn(learning_rate,dense_layers,batch_size,dropout,dense_dim):
     log_filename = 'log_bo_cnn_'+launch_datetime+'.csv'
 
 
-    # load train images from one zip file
-    unzipped_dir = retrain.unzip_and_return_path_to_folder(path_of_zip)
-    train_dir = unzipped_dir + '/images'
+    # load train images from one zip file or folder of shards
+    train_dir = retrain.get_train_dir(path_of_zip)
 
     # get path for classes.txt
     main_dir, filename = os.path.split(path_of_zip)
@@ -407,8 +412,14 @@ def bayes_optimization_pipeline(iterations):
             'camera_radius_sigmu': []
             })
 
-    bo = initial_queries(bo)
-    bo = exploration(iterations,bo)
+    global render_server
+    render_server = render_pipeline.BlenderRenderServer(bl_path).start()
+    try:
+        bo = initial_queries(bo)
+        bo = exploration(iterations,bo)
+    finally:
+        render_server.stop()
+        render_server = None
 
 def grid_search():
     logging = True
@@ -1,9 +1,11 @@
+import os
 import bpy
 
 from .BlenderObjects import *
 from .BlenderShapes import *
 from .BlenderLamps import BlenderPoint
 from ..RandomLib import random_render as rnd
+from ..render_quality import quality_settings
 
 
 class BlenderRoom(object):
@@ -72,20 +74,35 @@ class BlenderScene(object):
         self.objects_fixed = []
         self.objects_unfixed = []
 
-    def set_render(self, resolution = 300, samples = 128):
+    def set_render(self, resolution = 300, samples = 128, quality = None):
+        """
+        :param resolution: size of the square render in pixels
+        :param samples: Cycles samples per pixel, ignored with a quality preset
+        :param quality: name of a preset of render_quality.QUALITY_PRESETS
+        :return: the render settings, see render_quality.quality_settings
+        """
+        settings = quality_settings(quality, samples)
         self.data.cycles.film_transparent = True
-        self.data.cycles.max_bounces = 1
+        self.data.cycles.max_bounces = settings['max_bounces']
         self.data.cycles.min_bounces = 1
         self.data.cycles.transparent_max_bounces = 1
         self.data.cycles.transparent_min_bounces = 1
-        self.data.cycles.samples = samples
+        self.data.cycles.samples = settings['samples']
         self.data.cycles.device = 'GPU'
-        self.data.render.tile_x = 512
-        self.data.render.tile_y = 512
+        self.data.render.tile_x = settings['tile_size']
+        self.data.render.tile_y = settings['tile_size']
         self.data.render.resolution_x = resolution
         self.data.render.resolution_y = resolution
         self.data.render.resolution_percentage = 100
         self.data.render.use_persistent_data = True
+        # adaptive sampling only exists in later Cycles versions
+        if hasattr(self.data.cycles, 'use_adaptive_sampling'):
+            self.data.cycles.use_adaptive_sampling = settings['adaptive_threshold'] is not None
+            if settings['adaptive_threshold'] is not None:
+                self.data.cycles.adaptive_threshold = settings['adaptive_threshold']
+        for layer in self.data.render.layers:
+            layer.cycles.use_denoising = settings['denoise']
+        return settings
 
     def render_to_file(self, filepath):
         self.data.render.filepath = filepath
@@ -102,6 +119,11 @@ class BlenderScene(object):
             lamp.delete()
         self.lamps = []
 
+# parameters of a scene that change between the views of a batch, see
+# BlenderRandomScene.views_setup
+VIEW_PARAMS = rnd.VIEW_PARAMS
+
+
 class BlenderRandomScene(BlenderScene):
     """
     Subclass of blender scene. Controls random variables associated with
@@ -113,30 +135,42 @@ class BlenderRandomScene(BlenderScene):
     as change the distribution parameters, namely the set_attribute_distribution
     and set_attribute_distribution_params method.
     """
-    def __init__(self, data):
+    def __init__(self, data, template=False):
         """
         Initialization method. Here are listed all the default distributions
         for each variable. Note that there may be incompatible variable -
         distribution combos, since some distributions are specified over
         vectors.
         :param data: bpy scene data structure
+        :param template: if True, the subjects and their material node trees
+        are created by the first load_subject_from_path and kept as a
+        template, later loads only swap their meshes and texture images
         """
         super(BlenderRandomScene, self).__init__(data)
-        '''light params'''
-        self.num_lamps     = rnd.PScaledUniformDDist(mid=2, scale=0.5)
-        self.lamp_loc      = rnd.UniformShellCoordinateDist()
-        self.lamp_distance = rnd.TruncNormDist(mu=5.0,sigmu=0.0,l=2.0,r=None)
-        self.lamp_energy   = rnd.TruncNormDist(mu=5000.,sigmu=0.3,l=0.0,r=None)
-        self.lamp_size     = rnd.TruncNormDist(mu=5., sigmu=0.3, l=0.0, r=None)
-        '''camera params'''
-        self.camera_loc     = rnd.CompositeShellRingDist(phi_sigma=10.0,normals='YZ')
-        self.camera_radius  = rnd.TruncNormDist(mu=6.0,sigmu=0.3,l=2.0,r=None)
-        self.spin_angle     = rnd.UniformCDist(l=0.0,r=360.0)
-        '''mesh params'''
-        self.subject_size   = rnd.NormDist(mu=8.0,sigma=0.0)
+        self.template = template
+        self.set_default_distributions()
 
         self.max_num_lamps = 0
         self.set_num_lamps(self.num_lamps.r)
+        # parameters sampled by the last scene_setup
+        self.last_sample = {}
+        # parameters of every view of the last views_setup
+        self.last_samples = []
+        # numpy Generator scene_setup samples from, see RandomLib.random_streams.
+        # None samples from the random module
+        self.rng = None
+
+    def set_default_distributions(self):
+        """
+        (Re)sets every random variable to its default distribution, dropping
+        any changes made through set_attribute_distribution(_params).
+        Used when the same scene renders several runs with different
+        attributes.
+        :return: None
+        """
+        # defined outside Blender, so schedules can be sampled without it
+        for attr, distribution in rnd.default_scene_distributions().items():
+            setattr(self, attr, distribution)
 
     def set_num_lamps(self, N):
         if N == self.max_num_lamps:
@@ -146,7 +180,11 @@ class BlenderRandomScene(BlenderScene):
         for i in range(self.max_num_lamps):
             self.add_lamp(BlenderPoint(None))
 
-    def load_subject_from_path(self, obj_path, texture_path, obj_path_bot=None, texture_path_bot=None):
+    def load_subject_from_path(self, obj_path, texture_path, obj_path_bot=None, texture_path_bot=None, pack_textures=False):
+        # a template needs the same subjects (top only or top and bottom)
+        if self.template and self.subject is not None and (obj_path_bot is None) == (self.subject_bot is None):
+            self.swap_subject(obj_path, texture_path, obj_path_bot, texture_path_bot, pack_textures)
+            return
         self.remove_subject()
         obj_top = BlenderImportedShape(obj_path=obj_path, location=(-1,0,-1) ,orientation=(90,1,0,0))
         if obj_path_bot is not None:
@@ -156,7 +194,7 @@ class BlenderRandomScene(BlenderScene):
         self.add_subject(obj_top, obj_bot)
 
         self.subject.set_mesh_bbvol(self.subject_size.sample_param())  # size of original cube
-        self.subject.add_image_texture(texture_path)
+        self.subject.add_image_texture(texture_path, pack=pack_textures)
         # texture appearance are fixed for now
         self.subject.set_diffuse(color=(1, 0, 0, 1), rough=0.1)
         self.subject.set_gloss(rough=0.1)
@@ -165,12 +203,29 @@ class BlenderRandomScene(BlenderScene):
 
         if self.subject_bot is not None:
             self.subject_bot.set_mesh_bbvol(self.subject_size.sample_param())  # size of original cube
-            self.subject_bot.add_image_texture(texture_path_bot)
+            self.subject_bot.add_image_texture(texture_path_bot, pack=pack_textures)
             self.subject_bot.set_diffuse(color=(1, 0, 0, 1), rough=0.1)
             self.subject_bot.set_gloss(rough=0.1)
             self.subject_bot.set_mixer(0.1)
             self.subject_bot.set_location(0., 0., 0.)
 
+    def swap_subject(self, obj_path, texture_path, obj_path_bot=None, texture_path_bot=None, pack_textures=False):
+        """
+        Loads a subject into the subjects of the template: their meshes and
+        texture images are replaced, while the objects, their material node
+        trees, the lamps and the camera are kept
+        """
+        self.subject.replace_mesh(obj_path)
+        self.subject.set_mesh_bbvol(self.subject_size.sample_param())  # size of original cube
+        self.subject.replace_image_texture(texture_path, pack=pack_textures)
+        self.subject.set_location(0., 0., 0.)
+
+        if self.subject_bot is not None:
+            self.subject_bot.replace_mesh(obj_path_bot)
+            self.subject_bot.set_mesh_bbvol(self.subject_size.sample_param())  # size of original cube
+            self.subject_bot.replace_image_texture(texture_path_bot, pack=pack_textures)
+            self.subject_bot.set_location(0., 0., 0.)
+
     def set_attribute_distribution(self, attr, params):
         """
 
@@ -219,23 +274,77 @@ class BlenderRandomScene(BlenderScene):
         distribution.change_param(param, val)
 
     def random_lighting_conditions(self, blender_lamp):
+        self.set_lamp(blender_lamp, self.sample_lamp())
+
+    def distributions(self):
+        """
+        :return: dictionary of attribute name -> distribution of every
+        random variable of the scene
+        """
+        return {name: attr for name, attr in vars(self).items() if hasattr(attr, 'sample_param')}
+
+    def sample_lamp(self):
+        """
+        Samples the parameters of one lamp
+        :return: dictionary with keys 'loc', 'distance', 'energy', 'size'
+        """
+        return rnd.sample_lamp(self.distributions(), self.rng)
+
+    def set_lamp(self, blender_lamp, lamp):
         '''location'''
-        (x,y,z) = self.lamp_loc.sample_param()
-        r = self.lamp_distance.sample_param()
+        (x,y,z) = lamp['loc']
+        r = lamp['distance']
         if r < 0:
             raise ValueError('light distance negative! aborting')
         loc = (r*x, r*y, r*z)
         blender_lamp.set_location(*loc)
         '''energy'''
-        brightness = self.lamp_energy.sample_param()
-        blender_lamp.set_brightness(brightness)
-        size = self.lamp_size.sample_param()
-        blender_lamp.set_size(size)
+        blender_lamp.set_brightness(lamp['energy'])
+        blender_lamp.set_size(lamp['size'])
 
-    def scene_setup(self):
+    def scene_setup(self, params=None):
         """
         To be run before every render. This method performs sampling of all
-        render parameters, and sets the scene up.
+        render parameters, and sets the scene up. The sampled parameters are
+        kept in self.last_sample, a dictionary of attribute name -> list of
+        values sampled from it (e.g. one lamp_energy per active lamp).
+        :param params: parameters of the scene in the format returned by
+        sample_scene, e.g. a row of a render_schedule.RenderSchedule. They
+        are logged as if sampled, and nothing is sampled. Default = None,
+        sample new parameters
+        :return: None
+        """
+        distributions = self.distributions()
+        start = {name: len(attr.log) for name, attr in distributions.items()}
+        if params is None:
+            params = self.sample_scene()
+        else:
+            self.log_scene(params)
+        self.set_scene(params)
+        self.last_sample = {name: attr.log[start[name]:] for name, attr in distributions.items()}
+
+    def sample_scene(self):
+        """
+        Samples the parameters of a scene, see RandomLib.random_render.sample_scene
+        :return: dictionary with keys 'num_lamps', 'lamps' (a list of
+        sample_lamp dictionaries, one per active lamp), 'camera_loc',
+        'camera_radius', 'spin_angle' and 'subject_size'
+        """
+        return rnd.sample_scene(self.distributions(), self.rng)
+
+    def log_scene(self, params):
+        """
+        Logs the parameters of a scene that was not sampled by sample_scene
+        in the distributions, as if they had been sampled
+        :param params: see sample_scene
+        :return: None
+        """
+        rnd.log_scene(self.distributions(), params)
+
+    def set_scene(self, params):
+        """
+        Sets the scene up with the given parameters
+        :param params: see sample_scene
         :return: None
         """
         # **********************  LIGHTS **********************
@@ -244,19 +353,30 @@ class BlenderRandomScene(BlenderScene):
             lamp.turn_off()
 
         # set random lighting conditions
-        self.set_num_lamps(self.num_lamps.r)
-        num_active_lamps = self.num_lamps.sample_param()
-        if num_active_lamps < 0:
+        if params['num_lamps'] < 0:
             raise ValueError('number of lamps negative! aborting')
-        for l in range(num_active_lamps):
-            lamp = self.lamps[l]
-            lamp.turn_on()
-            self.random_lighting_conditions(lamp)
+        self.set_num_lamps(max(self.num_lamps.r, len(params['lamps'])))
+        for l, lamp in enumerate(params['lamps']):
+            blender_lamp = self.lamps[l]
+            blender_lamp.turn_on()
+            self.set_lamp(blender_lamp, lamp)
 
+        # ********************* SUBJECT **********************
+        self.subject.set_mesh_bbvol(params['subject_size'])  # size of original cube
+
+        self.set_view(params)
+
+    def set_view(self, params):
+        """
+        Sets the camera up with the given parameters, and places the subjects
+        in front of it
+        :param params: see sample_scene, only VIEW_PARAMS are used
+        :return: None
+        """
         # **********************  CAMERA **********************
         # random location of camera along shell coordinates
-        (x, y, z) = self.camera_loc.sample_param()
-        r = self.camera_radius.sample_param()
+        (x, y, z) = params['camera_loc']
+        r = params['camera_radius']
         if r < 0:
             raise ValueError('camera distance negative! aborting')
         loc = (r*x, r*y, r*z)
@@ -265,11 +385,7 @@ class BlenderRandomScene(BlenderScene):
         self.camera.face_towards(0.0, 0.0, 0.0)
 
         # randomize spin of camera
-        spin_angle = self.spin_angle.sample_param()
-        self.camera.spin(spin_angle)
-
-        # ********************* SUBJECT **********************
-        self.subject.set_mesh_bbvol(self.subject_size.sample_param())  # size of original cube
+        self.camera.spin(params['spin_angle'])
 
         # if we don't have bottom subject
         if self.subject_bot is None:
@@ -291,12 +407,94 @@ class BlenderRandomScene(BlenderScene):
             self.subject_bot.set_location(0.0,0.0,0.0)
             self.subject.set_location(*loc)
 
-    def render_to_file(self, filepath):
-        """Overrides parent class implementation"""
-        self.scene_setup()
+    def render_to_file(self, filepath, setup=True):
+        """
+        Overrides parent class implementation
+        :param setup: False to render the scene as set up by the last
+        scene_setup instead of sampling a new one
+        """
+        if setup:
+            self.scene_setup()
         self.data.render.filepath = filepath
         bpy.ops.render.render(write_still=True)
 
+    def views_setup(self, n, rows=None, rngs=None):
+        """
+        Sets up a batch of n views of one scene: the lamps and the subject size
+        are those of the first view, and every view only moves the camera (and
+        the subjects, with a bottom subject). The views are keyframed as the
+        frames 1 to n of an animation, so that render_views renders them in one
+        go, and Cycles keeps the scene data between the views.
+        The camera of every view is the camera a render of its own would
+        sample: views after the first sample a whole scene and only keep its
+        VIEW_PARAMS, see RandomLib.random_render.sample_view.
+        Every view is logged as a whole scene, with the shared parameters
+        repeated, and self.last_samples keeps the parameters of every view in
+        the format of self.last_sample.
+        :param n: number of views
+        :param rows: optional list of n scene parameters (see sample_scene),
+        e.g. rows of a render_schedule.RenderSchedule. The shared parameters
+        are those of the first row, the views those of every row
+        :param rngs: optional list of n numpy Generators the views are sampled
+        from, see RandomLib.random_streams. Ignored with rows
+        :return: None
+        """
+        distributions = self.distributions()
+        self.clear_views()
+        self.last_samples = []
+        views = []
+        for k in range(n):
+            start = {name: len(attr.log) for name, attr in distributions.items()}
+            if rows is not None:
+                params = dict(rows[0])
+                params.update((attr, rows[k][attr]) for attr in VIEW_PARAMS)
+                self.log_scene(params)
+            else:
+                if rngs is not None:
+                    self.rng = rngs[k]
+                if k == 0:
+                    params = self.sample_scene()
+                else:
+                    params = rnd.sample_view(distributions, views[0], self.rng)
+            views.append(params)
+            self.last_samples.append({name: attr.log[start[name]:] for name, attr in distributions.items()})
+        self.last_sample = self.last_samples[-1]
+
+        self.set_scene(views[0])
+        for k, params in enumerate(views):
+            self.set_view(params)
+            self.camera.reference.keyframe_insert(data_path='location', frame=k + 1)
+            self.camera.reference.keyframe_insert(data_path='rotation_quaternion', frame=k + 1)
+            for subject in [self.subject, self.subject_bot]:
+                if subject is not None:
+                    subject.reference.keyframe_insert(data_path='location', frame=k + 1)
+        self.data.frame_start = 1
+        self.data.frame_end = n
+
+    def render_views(self, filepaths, frames_folder):
+        """
+        Renders the views set up by views_setup as an animation, and saves
+        view k to filepaths[k]
+        :param filepaths: list of one image path per view
+        :param frames_folder: folder the frames of the animation are rendered
+        to, on the file system of filepaths
+        :return: None
+        """
+        self.data.render.filepath = os.path.join(frames_folder, 'view_')
+        bpy.ops.render.render(animation=True)
+        for k, filepath in enumerate(filepaths):
+            os.replace(self.data.render.frame_path(frame=k + 1), filepath)
+
+    def clear_views(self):
+        """
+        Removes the keyframes of views_setup, so that single renders are set
+        up by scene_setup alone again
+        :return: None
+        """
+        for obj in [self.camera, self.subject, self.subject_bot]:
+            if obj is not None and obj.reference is not None:
+                obj.reference.animation_data_clear()
+
     def clear_logs(self):
         """
         Clears the logs of all sampled parameters
@@ -81,11 +81,13 @@ class BlenderMesh(BlenderObject):
             raise InvalidInputError('mixer factor needs to be normalized!')
         self.nodes['node_mix'].set_fac(factor)
 
-    def add_image_texture(self, image_path, projection='FLAT', mapping='UV'):
+    def add_image_texture(self, image_path, projection='FLAT', mapping='UV', pack=False):
         """
         :param image_path: path to texture image file
         :param projection: defines projection type
         :param mapping: defines coordinate mapping
+        :param pack: if True, the image is packed into the .blend data, so that
+        the image file is no longer needed once loaded
         adds an image texture node and texture coordinate node (required to define mapping of texture)
         """
         if not 'node_imgtex' in self.nodes.keys():
@@ -107,6 +109,8 @@ class BlenderMesh(BlenderObject):
 
         try:
             img = bpy.data.images.load(image_path)
+            if pack:
+                img.pack()
         except:
             return False
 
@@ -116,6 +120,30 @@ class BlenderMesh(BlenderObject):
 
         return True
 
+    def replace_image_texture(self, image_path, pack=False):
+        """
+        :param image_path: path to texture image file
+        :param pack: see add_image_texture
+        swaps the image of the image texture node, keeping the node tree. The
+        previous image is removed from Blender's data once unused
+        """
+        if not 'node_imgtex' in self.nodes.keys():
+            return self.add_image_texture(image_path, pack=pack)
+
+        try:
+            img = bpy.data.images.load(image_path)
+            if pack:
+                img.pack()
+        except:
+            return False
+
+        old_img = self.nodes['node_imgtex'].reference.image
+        if not self.nodes['node_imgtex'].set_image(img):
+            return False
+        if old_img is not None and old_img.users == 0:
+            bpy.data.images.remove(old_img)
+        return True
+
     def toggle_smooth(self):
         for poly in self.reference.data.polygons:
             poly.use_smooth = True
@@ -198,6 +226,34 @@ class BlenderImportedShape(BlenderMesh):
         assert obj_path is not None, "Required keyword argument for importing shape: obj_path=[filepath]"
         bpy.ops.import_scene.obj(filepath=obj_path)
 
+    def replace_mesh(self, obj_path):
+        """
+        :param obj_path: defines path to obj file
+        swaps the mesh data of this object for the mesh of obj_path, keeping
+        the object, its transform and its material. The imported object, the
+        previous mesh and the materials imported with the new mesh are
+        removed from Blender's data
+        """
+        bpy.ops.object.select_all(action='DESELECT')
+        bpy.ops.import_scene.obj(filepath=obj_path)
+        assert len(bpy.context.selected_objects) == 1, "more than one selected objects!"
+        imported = bpy.context.selected_objects[0]
+        bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')
+
+        old_mesh = self.reference.data
+        mesh = imported.data
+        imported_materials = [mat for mat in mesh.materials if mat is not None]
+        mesh.materials.clear()
+        mesh.materials.append(self.material)
+        self.reference.data = mesh
+
+        bpy.data.objects.remove(imported, do_unlink=True)
+        if old_mesh.users == 0:
+            bpy.data.meshes.remove(old_mesh)
+        for mat in imported_materials:
+            if mat.users == 0:
+                bpy.data.materials.remove(mat)
+
 
 
 
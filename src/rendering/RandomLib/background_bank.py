@@ -0,0 +1,172 @@
+"""
+Bank of pre-generated random colour mesh backgrounds.
+
+Random backgrounds are statistically interchangeable, so instead of
+synthesising a new one for every object pose, K backgrounds of one
+resolution are generated once (with random_background.rand_background_batch)
+and stored in a single uint8 .npy file of shape [K,size,size,3]. The file is
+memory mapped when opened, so every merge process shares the same pages
+and only the backgrounds that are actually drawn are read from disk.
+
+Drawn backgrounds are augmented with random flips, rolls and hue rotations,
+which keeps the variety of the final images high with a modest K.
+
+Banks are kept in a folder outside the temporary folders of the rendering
+pipeline, so they are reused by every following run with the same
+resolution.
+"""
+
+import os
+
+import numpy as np
+
+from . import random_background
+from .random_exceptions import BackgroundBankError
+
+# RGB <-> YIQ, hue rotations are rotations of the I,Q plane
+_rgb_to_yiq = np.array([[0.299, 0.587, 0.114],
+                        [0.596, -0.274, -0.322],
+                        [0.211, -0.523, 0.312]])
+_yiq_to_rgb = np.linalg.inv(_rgb_to_yiq)
+
+
+def hue_rotation(degrees):
+    """
+    3x3 matrix rotating the hue of RGB colours, keeping their luma
+    :param degrees: rotation angle in degrees
+    :return: [3,3] array M, apply as rgb.dot(M.T)
+    """
+    theta = np.radians(degrees)
+    rotation = np.array([[1., 0., 0.],
+                         [0., np.cos(theta), -np.sin(theta)],
+                         [0., np.sin(theta), np.cos(theta)]])
+    return _yiq_to_rgb.dot(rotation).dot(_rgb_to_yiq)
+
+
+def bank_path(folder, size):
+    """
+    Path of the bank of size*size backgrounds in folder
+    """
+    return os.path.join(folder, 'background_bank_%dpx.npy' % size)
+
+
+class BackgroundBank:
+    """
+    Memory mapped bank of backgrounds. Pickles as its path, so it can be
+    passed to pool workers, which map the same file.
+    :param path: path to the .npy file of the bank
+    :param augment: whether sample augments the drawn backgrounds
+    :param max_hue_shift: largest hue rotation of the augmentation, in degrees
+    """
+    def __init__(self, path, augment=True, max_hue_shift=30.):
+        self.path = path
+        self.augment = augment
+        self.max_hue_shift = max_hue_shift
+        self._open()
+
+    def _open(self):
+        try:
+            self.backgrounds = np.load(self.path, mmap_mode='r')
+        except (IOError, ValueError) as e:
+            raise BackgroundBankError("Could not open background bank %s: %s" % (self.path, e))
+        if self.backgrounds.ndim != 4 or self.backgrounds.shape[3] != 3 or self.backgrounds.dtype != np.uint8:
+            raise BackgroundBankError("%s is not a background bank" % self.path)
+
+    def __getstate__(self):
+        return {'path': self.path, 'augment': self.augment, 'max_hue_shift': self.max_hue_shift}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def __len__(self):
+        return self.backgrounds.shape[0]
+
+    @property
+    def size(self):
+        """
+        Size of the side of the square backgrounds in pixels
+        """
+        return self.backgrounds.shape[1]
+
+    @classmethod
+    def create(cls, path, count, size, seed=None, batch_size=16, **kwargs):
+        """
+        Generates a bank of count backgrounds of size*size pixels and saves it
+        to path. The bank is written to a temporary file first, so an
+        interrupted run never leaves a truncated bank behind.
+        :param path: path of the .npy file to create
+        :param count: number of backgrounds
+        :param size: size of the side of the square backgrounds in pixels
+        :param seed: seed of the backgrounds, None for a random bank
+        :param batch_size: number of backgrounds generated at once
+        :param kwargs: passed to the BackgroundBank constructor
+        :return: BackgroundBank instance
+        """
+        if count < 1:
+            raise BackgroundBankError("A background bank needs at least one background")
+        rng = np.random.default_rng(seed)
+        tmp_path = path + '.tmp.npy'
+        bank = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(count, size, size, 3))
+        for i in range(0, count, batch_size):
+            n = min(batch_size, count - i)
+            bank[i:i+n] = random_background.rand_background_batch(n, size, rng)
+        bank.flush()
+        del bank
+        os.replace(tmp_path, path)
+        return cls(path, **kwargs)
+
+    @classmethod
+    def open_or_create(cls, folder, count, size, seed=None, **kwargs):
+        """
+        Opens the bank of size*size backgrounds in folder, creating it if it
+        does not exist or holds fewer than count backgrounds
+        :param folder: folder of the banks, created if missing
+        :param count: minimum number of backgrounds
+        :param size: size of the side of the square backgrounds in pixels
+        :param seed: seed used if the bank has to be created
+        :param kwargs: passed to the BackgroundBank constructor
+        :return: BackgroundBank instance
+        """
+        path = bank_path(folder, size)
+        if os.path.isfile(path):
+            try:
+                bank = cls(path, **kwargs)
+                if len(bank) >= count and bank.size == size:
+                    return bank
+            except BackgroundBankError:
+                pass
+        else:
+            os.makedirs(folder, exist_ok=True)
+        print("Generating a bank of %d backgrounds of %dx%d pixels" % (count, size, size))
+        return cls.create(path, count, size, seed, **kwargs)
+
+    def sample(self, rng=np.random):
+        """
+        Draws a background from the bank, augmented if the bank augments
+        :param rng: numpy Generator or RandomState, defaults to the global state
+        :return: [size,size,3] uint8 array
+        """
+        integers = rng.integers if hasattr(rng, 'integers') else rng.randint
+        img = np.asarray(self.backgrounds[integers(0, len(self))])
+        if not self.augment:
+            return img.copy()
+        return self.augment_image(img, rng)
+
+    def augment_image(self, img, rng=np.random):
+        """
+        Randomly flips, rolls and rotates the hue of a background
+        :param img: [size,size,3] uint8 array
+        :param rng: numpy Generator or RandomState
+        :return: [size,size,3] uint8 array
+        """
+        integers = rng.integers if hasattr(rng, 'integers') else rng.randint
+        if rng.uniform() > 0.5:
+            img = img[:, ::-1]
+        if rng.uniform() > 0.5:
+            img = img[::-1]
+        img = np.roll(img, (integers(0, img.shape[0]), integers(0, img.shape[1])), axis=(0, 1))
+        if self.max_hue_shift:
+            M = hue_rotation(rng.uniform(-self.max_hue_shift, self.max_hue_shift))
+            img = np.clip(img.dot(M.T.astype(np.float32)), 0, 255)
+        return img.astype(np.uint8)
@@ -0,0 +1,236 @@
+"""
+Low-discrepancy point sets and a coverage metric of sampled views.
+
+i.i.d. samples cluster and leave gaps, so a small dataset covers the views
+of a product unevenly. The point sets here fill the unit cube [0,1)^d
+evenly instead:
+
+- 'sobol': Sobol sequence, randomized with a linear matrix scramble and a
+  digital shift (up to 8 dims)
+- 'halton': Halton sequence, randomized with a random shift modulo 1
+- 'stratified': Latin hypercube, one sample per stratum of every dimension
+
+Distribution.transform_batch maps such points to samples of a distribution
+by the inverse of its sampling transform, see Distribution.sample_qmc.
+Only numpy is used, so the points can also be drawn inside Blender.
+"""
+import math
+
+import numpy as np
+
+SAMPLING_METHODS = ['iid', 'sobol', 'halton', 'stratified']
+
+_BITS = 32
+
+# primitive polynomials (degree s, coefficients a) and initial direction
+# numbers m of the dimensions 2 to 8 of the Sobol sequence (Joe and Kuo)
+_SOBOL_PARAMS = [(1, 0, [1]),
+                 (2, 1, [1, 3]),
+                 (3, 1, [1, 3, 1]),
+                 (3, 2, [1, 1, 1]),
+                 (4, 1, [1, 1, 3, 3]),
+                 (4, 4, [1, 3, 5, 13]),
+                 (5, 2, [1, 1, 5, 5, 17])]
+
+_PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53]
+
+
+def _direction_numbers(d):
+    """
+    :return: uint64 array [d, _BITS] of the direction numbers of the first
+        d dimensions of the Sobol sequence
+    """
+    V = np.zeros((d, _BITS), dtype=np.uint64)
+    V[0] = [1 << (_BITS - 1 - i) for i in range(_BITS)]
+    for j, (s, a, m) in enumerate(_SOBOL_PARAMS[:d - 1], 1):
+        v = [m[i] << (_BITS - 1 - i) for i in range(s)]
+        for i in range(s, _BITS):
+            x = v[i - s] ^ (v[i - s] >> s)
+            for k in range(1, s):
+                if (a >> (s - 1 - k)) & 1:
+                    x ^= v[i - k]
+            v.append(x)
+        V[j] = v
+    return V
+
+
+def _scramble(V, rng):
+    """
+    Linear matrix scramble (Matousek) of direction numbers: the binary
+    digits of the direction numbers of every dimension are multiplied, over
+    GF(2), by a random lower triangular matrix with a unit diagonal
+    :param V: uint64 array [d, _BITS] of direction numbers
+    :param rng: numpy Generator or the global numpy state
+    :return: uint64 array [d, _BITS] of scrambled direction numbers
+    """
+    d = len(V)
+    weights = np.array([1 << (_BITS - 1 - i) for i in range(_BITS)], dtype=np.uint64)
+    # L[j, i, k]: digit k of a direction number flips its digit i, i > k
+    L = np.tril(rng.random((d, _BITS, _BITS)) >= 0.5, -1).astype(np.uint64)
+    # columns of the matrices as binary fractions, with the unit diagonal
+    columns = (L * weights[None, :, None]).sum(axis=1) | weights[None, :]
+    scrambled = np.zeros_like(V)
+    for k in range(_BITS):
+        on = ((V >> np.uint64(_BITS - 1 - k)) & np.uint64(1)).astype(bool)
+        scrambled ^= np.where(on, columns[:, k:k + 1], np.uint64(0))
+    return scrambled
+
+
+def sobol(n, d, rng=None):
+    """
+    First n points of the d dimensional Sobol sequence, randomized with a
+    linear matrix scramble of its direction numbers (see _scramble) followed
+    by a random digital shift (XOR of every coordinate with a random binary
+    fraction). The scramble is non-singular and lower triangular, so both
+    keep the net structure of the sequence: the first 2^m points still fill
+    every stratum of size 2^-m. This is Matousek's linear matrix scramble,
+    not Owen's nested scramble, which would need a permutation per tree node
+    :param n: number of points
+    :param d: number of dimensions, at most 8
+    :param rng: numpy Generator, None uses the global numpy state
+    :return: array [n, d] of points in [0,1)
+    """
+    if d > len(_SOBOL_PARAMS) + 1:
+        raise ValueError('Sobol points are only available up to {} dimensions'.format(len(_SOBOL_PARAMS) + 1))
+    rng = np.random if rng is None else rng
+    V = _scramble(_direction_numbers(d), rng)
+    index = np.arange(n, dtype=np.uint64)
+    X = np.zeros((n, d), dtype=np.uint64)
+    for bit in range(_BITS):
+        on = ((index >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+        X[on] ^= V[:, bit]
+    shift = (rng.random(d) * 2.0**_BITS).astype(np.uint64)
+    return (X ^ shift) / 2.0**_BITS
+
+
+def halton(n, d, rng=None):
+    """
+    First n points of the d dimensional Halton sequence (radical inverses
+    in the first d primes), randomized by a random shift modulo 1
+    :param n: number of points
+    :param d: number of dimensions, at most 16
+    :param rng: numpy Generator, None uses the global numpy state
+    :return: array [n, d] of points in [0,1)
+    """
+    if d > len(_PRIMES):
+        raise ValueError('Halton points are only available up to {} dimensions'.format(len(_PRIMES)))
+    rng = np.random if rng is None else rng
+    X = np.zeros((n, d))
+    for j, base in enumerate(_PRIMES[:d]):
+        index = np.arange(n)
+        scale = 1.0
+        while np.any(index > 0):
+            scale /= base
+            X[:, j] += (index % base) * scale
+            index //= base
+    return (X + rng.random(d)) % 1.0
+
+
+def stratified(n, d, rng=None):
+    """
+    Latin hypercube: every dimension is split in n strata, each holding
+    exactly one point, and the strata are paired at random
+    :param n: number of points
+    :param d: number of dimensions
+    :param rng: numpy Generator, None uses the global numpy state
+    :return: array [n, d] of points in [0,1)
+    """
+    rng = np.random if rng is None else rng
+    X = np.empty((n, d))
+    for j in range(d):
+        X[:, j] = (rng.permutation(n) + rng.random(n)) / n
+    return X
+
+
+def points(method, n, d, rng=None):
+    """
+    :param method: one of 'sobol', 'halton', 'stratified', or 'iid' for
+        independent uniform points
+    :return: array [n, d] of points in [0,1)
+    """
+    if method not in SAMPLING_METHODS:
+        raise ValueError('Sampling method must be one of {}'.format(SAMPLING_METHODS))
+    if method == 'sobol':
+        return sobol(n, d, rng)
+    if method == 'halton':
+        return halton(n, d, rng)
+    if method == 'stratified':
+        return stratified(n, d, rng)
+    rng = np.random if rng is None else rng
+    return rng.random((n, d))
+
+
+_erfc = np.vectorize(math.erfc, otypes=[float])
+
+
+def norm_cdf(x):
+    """
+    Standard normal cumulative distribution function, elementwise
+    """
+    return 0.5 * _erfc(-np.asarray(x, dtype=float) / math.sqrt(2.0))
+
+
+def norm_ppf(p):
+    """
+    Inverse of norm_cdf, elementwise: Acklam's rational approximation,
+    refined by one Halley step
+    :param p: array of probabilities in [0,1]
+    :return: array of quantiles, -inf and inf at 0 and 1
+    """
+    a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+         3.754408661907416e+00]
+    p = np.asarray(p, dtype=float)
+    x = np.empty_like(p)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        low = p < 0.02425
+        high = p > 1 - 0.02425
+        mid = ~(low | high)
+        q = p[mid] - 0.5
+        r = q * q
+        x[mid] = (((((a[0]*r + a[1])*r + a[2])*r + a[3])*r + a[4])*r + a[5])*q / \
+                 (((((b[0]*r + b[1])*r + b[2])*r + b[3])*r + b[4])*r + 1)
+        for tail, sign in [(low, 1.0), (high, -1.0)]:
+            q = np.sqrt(-2 * np.log(p[tail] if sign > 0 else 1 - p[tail]))
+            x[tail] = sign * (((((c[0]*q + c[1])*q + c[2])*q + c[3])*q + c[4])*q + c[5]) / \
+                      ((((d[0]*q + d[1])*q + d[2])*q + d[3])*q + 1)
+        x[p <= 0] = -np.inf
+        x[p >= 1] = np.inf
+        finite = np.isfinite(x)
+        e = norm_cdf(x[finite]) - p[finite]
+        u = e * math.sqrt(2 * math.pi) * np.exp(x[finite]**2 / 2)
+        x[finite] = x[finite] - u / (1 + x[finite] * u / 2)
+    return x
+
+
+def view_coverage(directions, reference, angle=10.0):
+    """
+    Coverage of the views of a product: the fraction of reference
+    directions, e.g. a large sample of the camera distribution, within
+    angle degrees of one of the sampled directions. Also returns the
+    covering angle, the largest angle from a reference direction to the
+    nearest sampled direction: evenly spread views cover the reference with
+    a smaller angle.
+    :param directions: array [n,3] of sampled unit vectors
+    :param reference: array [m,3] of reference unit vectors
+    :param angle: angle in degrees within which a reference is covered
+    :return: dictionary with keys 'coverage', 'covering_angle', 'angle', 'views'
+    """
+    directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+    reference = np.asarray(reference, dtype=float).reshape(-1, 3)
+    if len(directions) == 0:
+        return {'coverage': 0.0, 'covering_angle': 180.0, 'angle': angle, 'views': 0}
+    nearest = np.empty(len(reference))
+    for start in range(0, len(reference), 1024):
+        cos = reference[start:start + 1024].dot(directions.T)
+        nearest[start:start + 1024] = cos.max(axis=1)
+    nearest = np.degrees(np.arccos(np.clip(nearest, -1.0, 1.0)))
+    return {'coverage': float(np.mean(nearest <= angle)),
+            'covering_angle': float(nearest.max()),
+            'angle': angle,
+            'views': len(directions)}
@@ -3,6 +3,8 @@ Script to create metaballs structures encoded as arrays.
 Metaballs structures used for background generation.  
 """
 
+from functools import lru_cache
+
 import numpy as np
 
 def norm(x,y,p):
@@ -18,6 +20,12 @@ def norm(x,y,p):
     """
     #the constant factor is to ensure that norm is never 0 as it is used 
     # as divisor
+    # the common norms are computed without np.power, which is slow for
+    # non integer exponents; the results are the same
+    if np.ndim(p) == 0 and p == 1:
+        return np.abs(x) + np.abs(y) + 1e-08
+    if np.ndim(p) == 0 and p == 2:
+        return np.sqrt(np.square(x) + np.square(y)) + 1e-08
     n = np.power(np.power(np.abs(x),p) + np.power(np.abs(y),p), 1./p)+1e-08
     return n
 
@@ -47,25 +55,99 @@ class ball:
         return self.radius/norm(x-self.x0, y-self.y0, self.norm)
 
 
+class Balls:
+    """
+    Structure of arrays representation of a set of 2D balls: the radii,
+    centres and normalisation factors of all balls are stored as arrays,
+    so that the inverse distances to all of them are computed at once.
+    :param radius: array of radii
+    :param x0: array of x coordinates of the centres
+    :param y0: array of y coordinates of the centres
+    :param norm: array of normalisation factors
+    """
+    def __init__(self, radius, x0, y0, norm):
+        self.radius = np.asarray(radius, dtype=float)
+        self.x0 = np.asarray(x0, dtype=float)
+        self.y0 = np.asarray(y0, dtype=float)
+        self.norm = np.asarray(norm, dtype=float)
+
+    @classmethod
+    def from_balls(cls, balls):
+        """
+        Creates a Balls instance from a list of ball class instances
+        :param balls: list of ball instances
+        :return: Balls instance
+        """
+        return cls([b.radius for b in balls], [b.x0 for b in balls],
+                   [b.y0 for b in balls], [b.norm for b in balls])
+
+    def __len__(self):
+        return len(self.radius)
+
+    def inverse_distance(self, x, y):
+        """
+        Calculates the inverse distance from each point to each ball centre.
+        x and y only need to broadcast together, e.g. a row of x coordinates
+        and a collumn of y coordinates for a whole grid, in which case the
+        powers are taken on the row and collumn only.
+        :param x: array of x coordinates of the points
+        :param y: array of y coordinates of the points
+        :return: array of shape [n_balls, *broadcast(x, y).shape], entry
+            [i, ...] is the inverse distance of the points to ball i scaled
+            by its radius
+        """
+        shape = (len(self),) + (1,)*max(np.ndim(x), np.ndim(y))
+        dx = x - self.x0.reshape(shape)
+        dy = y - self.y0.reshape(shape)
+        inverse = np.empty(np.broadcast(dx, dy).shape)
+        # balls sharing a normalisation factor are evaluated together with a
+        # scalar power, which numpy computes much faster than elementwise powers
+        for p in np.unique(self.norm):
+            same = np.flatnonzero(self.norm == p)
+            inverse[same] = self.radius[same].reshape((-1,) + shape[1:])/norm(dx[same], dy[same], p)
+        return inverse
+
+
+@lru_cache(maxsize=16)
+def coordinate_grid(rows, cols):
+    """
+    X and Y coordinates of a rows*cols array as a row and a collumn that
+    broadcast to the full grid, memoized per (rows, cols).
+    :param rows: int number of rows
+    :param cols: int number of collumns
+    :return (X, Y): read only arrays of shape [1, cols] and [rows, 1],
+        X[0,j] = j and Y[i,0] = i
+    """
+    X = np.arange(cols, dtype=float).reshape(1, cols)
+    Y = np.arange(rows, dtype=float).reshape(rows, 1)
+    X.flags.writeable = False
+    Y.flags.writeable = False
+    return X, Y
+
+
 def sum_inverse_distance(x,y,balls):
     """
     For a given ball and array of points calculates the inverse distance
     of each point to each ball and sums values for each point together. This
     produce an array of the same size as the input x,y arrays
     :param x: array of x coordinates of individual points
-    :param y: array of y coordinates of individual points
-    :balls: array of ball class instances
+    :param y: array of y coordinates of individual points, must have the
+        same shape as x or broadcast with it
+    :balls: Balls instance or array of ball class instances
     :return f: array of sums of inverse distances of each point to all balls
         respectively (e.g. f[0] is sum of all inverse distances of 
         point x[0],y[0])
     """
-    if(x.shape!=y.shape):
+    try:
+        shape = np.broadcast(x, y).shape
+    except ValueError:
         raise IndexError("The x and y parameters don't have the same shape")
-    
-    f = np.zeros(x.shape)
-    for ball in balls:
-        f += ball.inverse_distance(x,y)
-    return f
+
+    if not isinstance(balls, Balls):
+        balls = Balls.from_balls(balls)
+    if len(balls) == 0:
+        return np.zeros(shape)
+    return balls.inverse_distance(x,y).sum(axis=0)
 
 
 def metaball(rows, cols, balls, thres):
@@ -76,25 +158,13 @@ def metaball(rows, cols, balls, thres):
     treshold.
     :param rows: int number of rows
     :param cols: int number of collumns
-    :param balls: array of ball class instances
+    :param balls: Balls instance or array of ball class instances
     :param thres: threshold for the inverse distance
     :return filled: boolean array of the specified size with True for entries
         which coordinate representation inverse distance was larger than 
         treshold
     """
-    # create arrays of X,Y coordinates
-    Y = np.linspace(0,rows-1,rows)
-    Y = np.reshape(Y,(rows,1))
-    Ystack = []
-    for i in range(cols):
-        Ystack.append(Y)
-    Y = np.hstack(Ystack)
-
-    X = np.linspace(0,cols-1,cols)
-    Xstack = []
-    for i in range(rows):
-        Xstack.append(X)
-    X = np.vstack(Xstack)
+    X, Y = coordinate_grid(rows, cols)
 
     # compute the sum_inverse_distance over the coordinates, using numpy matrix operations
     f = sum_inverse_distance(X,Y,balls)
@@ -102,7 +172,7 @@ def metaball(rows, cols, balls, thres):
     return filled
 
 
-def random_metaball(row, col, n_balls, size):
+def random_metaball(row, col, n_balls, size, rng=np.random):
     """
     Returns a metaball images with specified size (row, col), number of 
     balls present. The amount of metaball features present can be controlled
@@ -112,26 +182,66 @@ def random_metaball(row, col, n_balls, size):
     :param col: number of collumns of returned image
     :param n_balls: number of balls to generate
     :param size: treshold for point being included in a metaball
+    :param rng: numpy Generator or RandomState, defaults to the global state
     :return metaball: returns a row*col array image of metaball features
     """
-    centre_x = np.random.randint(0,col)
-    centre_y = np.random.randint(0,row)
+    integers = rng.integers if hasattr(rng, 'integers') else rng.randint
+    centre_x = integers(0,col)
+    centre_y = integers(0,row)
     sigma_x = np.round(col/10.0)
     sigma_y = np.round(row/10.0)
     min_ball_radius = col/(15*n_balls)
     max_ball_radius = col/(10*n_balls)
 
-    # generate balls
-    Balls = []
+    # generate balls, sampled in the same order as one ball at a time
+    # so that a given seed still gives the same metaballs
+    radius, X0, Y0, norms = np.zeros([4, n_balls])
     for i in range(n_balls):
-        x = np.round(np.random.normal(centre_x, sigma_x))
-        y = np.round(np.random.normal(centre_y, sigma_y))
-        x = min(max(x,0),col-1)
-        y = min(max(y,0),row-1)
-        radius = np.random.uniform(min_ball_radius, max_ball_radius)
+        x = np.round(rng.normal(centre_x, sigma_x))
+        y = np.round(rng.normal(centre_y, sigma_y))
+        X0[i] = min(max(x,0),col-1)
+        Y0[i] = min(max(y,0),row-1)
+        radius[i] = rng.uniform(min_ball_radius, max_ball_radius)
+        norms[i] = integers(1,3)
+
+    return metaball(row, col, Balls(radius, X0, Y0, norms), size)
 
-        norm = np.random.randint(1,3)
 
-        Balls.append(ball(radius, x, y, norm))
+def random_metaball_batch(n, row, col, n_balls, sizes, rng=np.random):
+    """
+    Batched version of random_metaball. Returns n metaball images, with the
+    balls of all images sampled at once and their inverse distances summed
+    over the whole stack with array operations.
+    :param n: number of images
+    :param row: number of rows of the returned images
+    :param col: number of collumns of the returned images
+    :param n_balls: number of balls to generate per image
+    :param sizes: treshold for point being included in a metaball, either
+        a single value or an array of n values, one per image
+    :param rng: numpy Generator or RandomState, defaults to the global state
+    :return metaball: returns a n*row*col boolean array of metaball features
+    """
+    integers = rng.integers if hasattr(rng, 'integers') else rng.randint
+    centre_x = integers(0, col, size=(n, 1))
+    centre_y = integers(0, row, size=(n, 1))
+    sigma_x = np.round(col/10.0)
+    sigma_y = np.round(row/10.0)
+    min_ball_radius = col/(15*n_balls)
+    max_ball_radius = col/(10*n_balls)
+
+    # generate balls, one row per image
+    x = np.clip(np.round(rng.normal(centre_x, sigma_x, size=(n, n_balls))), 0, col-1)
+    y = np.clip(np.round(rng.normal(centre_y, sigma_y, size=(n, n_balls))), 0, row-1)
+    radius = rng.uniform(min_ball_radius, max_ball_radius, size=(n, n_balls))
+    p = integers(1, 3, size=(n, n_balls)).astype(float)
+
+    X, Y = coordinate_grid(row, col)
+    f = np.zeros([n, row, col])
+    for i in range(n_balls):
+        p_i = p[:, i, None, None]
+        dist = np.power(np.power(np.abs(X - x[:, i, None, None]), p_i) +
+                        np.power(np.abs(Y - y[:, i, None, None]), p_i), 1./p_i) + 1e-08
+        f += radius[:, i, None, None]/dist
 
-    return metaball(row, col, Balls, size)
+    thres = np.broadcast_to(np.asarray(sizes, dtype=float), (n,))
+    return f > thres[:, None, None]
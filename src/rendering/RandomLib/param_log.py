@@ -0,0 +1,135 @@
+"""
+Compact logs of sampled parameters.
+
+Every Distribution logs the values it samples. Instead of a python list of
+floats and tuples, a ParamLog keeps them in a preallocated numpy buffer,
+one row per sample: [n] for scalar and [n,3] for coordinate distributions.
+A logged sample costs 8 bytes per component, and the buffer at most doubles
+that when it grows.
+
+The logs of a render run are saved as columns of a .npz file, one array per
+attribute, see save_logs. load_logs reads them back, and also reads the
+randomvars_dump.json files written before.
+"""
+import json
+import os
+
+import numpy as np
+
+
+class ParamLog(object):
+    """
+    Growable typed buffer of logged samples. The dtype (int64 or float64)
+    and the width (1 for scalars, 3 for coordinates) are set by the first
+    logged value; integer logs become float logs if a float is logged.
+    Indexing and slicing return python values, as the former lists did.
+    :param capacity: number of samples preallocated
+    """
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.buffer = None
+        self.n = 0
+        self.scalar = True
+
+    def _allocate(self, value):
+        self.scalar = value.ndim == 0
+        dtype = np.int64 if value.dtype.kind in 'iub' else np.float64
+        width = () if self.scalar else value.shape
+        self.buffer = np.empty((self.capacity,) + width, dtype=dtype)
+
+    def _reserve(self, values):
+        """
+        Makes room for the rows of values, converting the buffer to float
+        if values are not integers
+        """
+        if self.buffer is None:
+            self._allocate(values[0] if len(values) else values)
+        if self.buffer.dtype.kind == 'i' and values.dtype.kind not in 'iub':
+            self.buffer = self.buffer.astype(np.float64)
+        if self.n + len(values) > len(self.buffer):
+            capacity = max(2 * len(self.buffer), self.n + len(values))
+            buffer = np.empty((capacity,) + self.buffer.shape[1:], dtype=self.buffer.dtype)
+            buffer[:self.n] = self.buffer[:self.n]
+            self.buffer = buffer
+
+    def append(self, val):
+        value = np.asarray(val)
+        self._reserve(value[None])
+        self.buffer[self.n] = value
+        self.n += 1
+
+    def extend(self, values):
+        """
+        Logs every row of an array of samples
+        """
+        values = np.asarray(values)
+        if len(values) == 0:
+            return
+        self._reserve(values)
+        self.buffer[self.n:self.n + len(values)] = values
+        self.n += len(values)
+
+    def truncate(self, n):
+        """
+        Drops the samples logged after the first n
+        """
+        self.n = min(self.n, n)
+
+    def values(self):
+        """
+        :return: array of the logged samples, a view of the buffer
+        """
+        if self.buffer is None:
+            return np.empty(0)
+        return self.buffer[:self.n]
+
+    def _python(self, value):
+        value = value.tolist()
+        return value if self.scalar else tuple(value)
+
+    def __getitem__(self, index):
+        values = self.values()[index]
+        if isinstance(index, slice):
+            return [self._python(v) for v in values]
+        return self._python(values)
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield self[i]
+
+    def tolist(self):
+        """
+        :return: the logged samples in the former list format, floats for
+            scalars and tuples for coordinates
+        """
+        return self[:]
+
+
+def save_logs(path, logs):
+    """
+    Saves logs as columns of a .npz file, atomically
+    :param path: path of the .npz file
+    :param logs: dictionary of attribute name -> ParamLog or array
+    """
+    columns = {}
+    for name, log in logs.items():
+        columns[name] = log.values() if isinstance(log, ParamLog) else np.asarray(log)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, **columns)
+    os.replace(tmp, path)
+
+
+def load_logs(path):
+    """
+    Reads the logs saved by save_logs, or a randomvars_dump.json
+    :param path: path of the .npz or .json file
+    :return: dictionary of attribute name -> array of the logged samples
+    """
+    if path.endswith('.json'):
+        with open(path) as f:
+            return {name: np.array(values) for name, values in json.load(f).items()}
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
@@ -15,17 +15,18 @@ from PIL import Image
 
 base_path = 'D:\\old_files\\aaaaa\\Anglie\\imperial\\2017-2018\\group_project\\OcadoLobster\\data\\resized_background\\random_back\\'
 
-def random_color(L):
+def random_color(L, rng=np.random):
     """
     Creates a 3D array of [L,L,3] of single colour
     :param L: size of 2D sqaure image in pixels.
+    :param rng: numpy Generator or RandomState, defaults to the global state
     """
     img = np.ones([L,L,3])
     for i in range(3):
-        img[:,:,i] = np.random.uniform()*img[:,:,i]
+        img[:,:,i] = rng.uniform()*img[:,:,i]
     return img
 
-def mix(img1, img2, size):
+def mix(img1, img2, size, rng=np.random):
     """
     Given two images and desired size, it will merge the images together
     by masking metaball shaped parts of one image with metaball shaped sections
@@ -33,58 +34,121 @@ def mix(img1, img2, size):
     :param img1: 3D array[size,size,3] of pixel values
     :param img2: 3D array[size,size,3] of pixel values
     :param size: size of the input images and the output image [size, size,3]
+    :param rng: numpy Generator or RandomState, defaults to the global state
     """
     mask = np.zeros([size, size, 3])
-    ball_size = np.random.uniform(0.1,0.5)
+    ball_size = rng.uniform(0.1,0.5)
 
-    mask[:,:,0] = metaballs.random_metaball(size,size,4,ball_size)
+    mask[:,:,0] = metaballs.random_metaball(size,size,4,ball_size,rng)
     mask[:,:,1] = mask[:,:,0]
     mask[:,:,2] = mask[:,:,0]
 
     return img1*(1-mask) + img2*mask
 
-def random_brightness(img):
+def random_brightness(img, rng=np.random):
     """
     randomly adjust mean brightness of an image, capping all values
     between 0 and 1
     :param img: image array
+    :param rng: numpy Generator or RandomState, defaults to the global state
     :return: image array
     """
-    brightness = np.random.uniform(0,1.0)
+    brightness = rng.uniform(0,1.0)
     img_bright = np.mean(img)
     mul = brightness/img_bright
     img *= img*mul
     img[img>1.0] = 1.0
     return img
 
-def random_image(size):
+def random_image(size, rng=np.random):
     """
     Returns a 3D array [size,size,3] of random colour, created either
     as a uniform colour sheet or random mesh. The decision which image to
     create is made randomly.
     :param size: size of the 2D square image in pixels
+    :param rng: numpy Generator or RandomState, defaults to the global state
     :return: [size,size,3] array of floats, easily convertible to image format
     """
-    r = np.random.uniform()
+    r = rng.uniform()
     if r>0.5:
-        return random_color(size)
-    return random_brightness(turbulence.turbulence_rgb(size))
+        return random_color(size, rng)
+    return random_brightness(turbulence.turbulence_rgb(size, rng=rng), rng)
 
-def rand_background(N, size):
+def rand_background(N, size, rng=np.random):
     """
     Function that inforporates all the above functions to create a background
     image that has random metaball variations but overall neighbour to
     neighbour variance of pixels is small.
     :param N: number of mixing stages. The higher, the more random the image
     :param size: size of the 2D square image
+    :param rng: numpy Generator or RandomState, defaults to the global state.
+        With a Generator of random_streams, a background depends only on
+        the seed and keys of its stream
     :return T: a [size,size,3] array representing a complete image
     """
-    T = random_image(size)
+    T = random_image(size, rng)
     for i in range(N):
-        T2 = random_image(size)
-        T = mix(T,T2,size)
+        T2 = random_image(size, rng)
+        T = mix(T,T2,size,rng)
     return T
 
+def random_image_batch(n, size, rng=np.random):
+    """
+    Batched version of random_image. Each of the n images is, independently,
+    either a uniform colour sheet or a random mesh with random brightness.
+    :param n: number of images
+    :param size: size of the 2D square images in pixels
+    :param rng: numpy Generator or RandomState, defaults to the global state
+    :return: [n,size,size,3] array of floats
+    """
+    img = np.empty([n, size, size, 3])
+    colour = rng.uniform(size=n) > 0.5
+    img[colour] = rng.uniform(size=(np.count_nonzero(colour), 1, 1, 3))
+
+    mesh = ~colour
+    n_mesh = np.count_nonzero(mesh)
+    if n_mesh:
+        turb = turbulence.turbulence_rgb_batch(n_mesh, size, rng)
+        # same adjustment as random_brightness, per image
+        brightness = rng.uniform(0, 1.0, size=n_mesh)
+        mul = brightness/turb.mean(axis=(1, 2, 3))
+        turb *= turb*mul[:, None, None, None]
+        img[mesh] = np.minimum(turb, 1.0)
+    return img
+
+def rand_background_batch(n, size, rng=None, stages=None):
+    """
+    Batched version of rand_background, creating n backgrounds at once.
+    All noise, smoothing and metaball masks are computed over the whole
+    batch with array operations, which is considerably faster than calling
+    rand_background n times.
+    :param n: number of images
+    :param size: size of the 2D square images
+    :param rng: numpy Generator or RandomState, a new Generator is created
+        if None
+    :param stages: number of mixing stages per image, int or array of n
+        ints. If None, drawn from [2,4) as in generate_images
+    :return: a [n,size,size,3] uint8 array of images
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if stages is None:
+        integers = rng.integers if hasattr(rng, 'integers') else rng.randint
+        stages = integers(2, 4, size=n)
+    stages = np.broadcast_to(np.asarray(stages), (n,))
+
+    T = random_image_batch(n, size, rng)
+    for i in range(stages.max() if n else 0):
+        # only images that still have mixing stages left get mixed
+        idx = np.flatnonzero(stages > i)
+        T2 = random_image_batch(len(idx), size, rng)
+        ball_size = rng.uniform(0.1, 0.5, size=len(idx))
+        mask = metaballs.random_metaball_batch(len(idx), size, size, 4, ball_size, rng)
+        mask = mask[..., None]
+        T[idx] = np.where(mask, T2, T[idx])
+
+    return np.clip(T*256, 0, 255).astype(np.uint8)
+
 def generate_images( save_as,pixels=300, range_min=0, range_max=10,):
     """
     Function for generation of multiple and images. It also allows the images
@@ -4,3 +4,15 @@ class ImprobableError(Exception):
     """
     def __init__(self, message):
         self.message = message
+
+
+class BackgroundBankError(Exception):
+    """
+    Error to call when a background bank is missing, invalid or does not
+    match the requested resolution
+    """
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return repr(self.message)
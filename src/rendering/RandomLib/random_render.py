@@ -5,35 +5,41 @@ its child classes define the logic, pased on the desired distribution.
 """
 
 import numpy as np
-import random
 import math
 from .random_exceptions import ImprobableError
+from .random_streams import as_stream
+from .param_log import ParamLog
+from . import low_discrepancy as ld
 
-def random_color():
+def random_color(rng=None):
     """
     utility function for random color, returns a 3-tuple, each element in [0,1]
+    :param rng: numpy Generator, see random_streams. None uses the random module
     :return: 3-tuple representing a color
     """
-    return random.random(), random.random(), random.random()
+    rng = as_stream(rng)
+    return float(rng.random()), float(rng.random()), float(rng.random())
 
-def random_shell_coords(radius):
+def random_shell_coords(radius, rng=None):
     """
     given a shell radius, return a random shell coordinate centred around (0,0,0)
     :param radius: radius of shell
+    :param rng: numpy Generator, see random_streams. None uses the random module
     :return: 3-tuple shell coordinate
     """
     
     if(radius<0):
         raise ValueError("Cannot have negative radius")
-    theta = math.radians(random.uniform(0.0, 360.0))
-    phi = math.radians(random.uniform(0.0, 360.0))
+    rng = as_stream(rng)
+    theta = math.radians(rng.uniform(0.0, 360.0))
+    phi = math.radians(rng.uniform(0.0, 360.0))
     x = radius * math.cos(theta) * math.sin(phi)
     y = radius * math.sin(theta) * math.sin(phi)
     z = radius * math.cos(phi)
     return x, y, z
 
 
-def random_cartesian_coords(mux, muy, muz, sigma, lim):
+def random_cartesian_coords(mux, muy, muz, sigma, lim, rng=None):
     """
     given a centre (mux, muy, muz), a standard deviation sigma, and a cube width lim,
     generate a gaussian-distributed random coordinate within the cube centered at (mux,muy,muz)
@@ -42,17 +48,19 @@ def random_cartesian_coords(mux, muy, muz, sigma, lim):
     :param muz: z centre
     :param sigma: standard deviation
     :param lim: cube limit width
+    :param rng: numpy Generator, see random_streams. None uses the random module
     :return: 3-tuple gaussian random coordinate
     """
     if(sigma<0 or lim<0):
         raise ValueError("Cannot have negative sigma and cube width lim")
     
-    x = min(random.gauss(mux, sigma), lim)
-    y = min(random.gauss(muy, sigma), lim)
-    z = min(random.gauss(muz, sigma), lim)
+    rng = as_stream(rng)
+    x = min(float(rng.normal(mux, sigma)), lim)
+    y = min(float(rng.normal(muy, sigma)), lim)
+    z = min(float(rng.normal(muz, sigma)), lim)
     return x, y, z
 
-def sample_trunc_norm(mu, sigma, a = None , b = None, tol=1e06):
+def sample_trunc_norm(mu, sigma, a = None , b = None, tol=1e06, rng=None):
     """
     Sample from a truncated normal distribution. The distribution of x is
     normal conditional on a<=x<=b. a = None means a = -inf, b = None means
@@ -61,8 +69,10 @@ def sample_trunc_norm(mu, sigma, a = None , b = None, tol=1e06):
     :param sigma: standard deviation of the normal
     :param a: lower bound, None means -infinity
     :param b: upper bound, None means infinity
+    :param rng: numpy Generator, see random_streams. None uses the random module
     :return: x, a sample
     """
+    rng = as_stream(rng)
     x = None
     if not(a is None or b is None) and a > b:
         raise ValueError('Lower bound greater than upper bound!')
@@ -70,11 +80,123 @@ def sample_trunc_norm(mu, sigma, a = None , b = None, tol=1e06):
     while((x is None) or ((a is not None) and (x < a)) or ((b is not None) and (x > b))):
         if count > tol:
             raise ImprobableError('rejected samples has exceeded {}!'.format(tol))
-        x = random.gauss(mu, sigma)
+        x = float(rng.normal(mu, sigma))
         count += 1
     return x
 
-def random_shell_coords_cons(radius, phi_sigma):
+def sample_trunc_norm_batch(mu, sigma, n, a = None, b = None, tol=1e06, rng=None):
+    """
+    Vectorized version of sample_trunc_norm, drawing n samples at once by
+    rejection: normal samples are drawn in arrays sized by the acceptance
+    rate seen so far, and those outside [a,b] are dropped.
+    :param mu: mean of the normal
+    :param sigma: standard deviation of the normal
+    :param n: number of samples
+    :param a: lower bound, None means -infinity
+    :param b: upper bound, None means infinity
+    :param tol: ImprobableError is raised once more than tol samples are
+        rejected per accepted sample, as sample_trunc_norm does
+    :param rng: numpy Generator or RandomState, None uses the global numpy state
+    :return: array of n samples
+    """
+    if not(a is None or b is None) and a > b:
+        raise ValueError('Lower bound greater than upper bound!')
+    rng = _batch_stream(rng)
+    low = -np.inf if a is None else a
+    high = np.inf if b is None else b
+
+    samples = np.empty(n)
+    filled = 0
+    draws = 0
+    accepted = 0
+    while filled < n:
+        if accepted:
+            size = int(1.2*(n - filled)*draws/accepted) + 1
+        else:
+            size = max(n - filled, 2*draws)
+        size = min(size, 1 << 20)
+        x = rng.normal(mu, sigma, size)
+        x = x[(x >= low) & (x <= high)]
+        draws += size
+        accepted += len(x)
+        x = x[:n - filled]
+        samples[filled:filled + len(x)] = x
+        filled += len(x)
+        if filled < n and draws > tol and accepted*tol < draws:
+            raise ImprobableError('rejected samples has exceeded {} per sample!'.format(tol))
+    return samples
+
+def trunc_norm_ppf(u, mu, sigma, a = None, b = None):
+    """
+    Inverse transform of the truncated normal distribution of
+    sample_trunc_norm: maps u in [0,1] to the quantiles of the normal
+    restricted to [a,b], so evenly spread u give evenly spread samples
+    :param u: array of points in [0,1]
+    :param mu: mean of the normal
+    :param sigma: standard deviation of the normal
+    :param a: lower bound, None means -infinity
+    :param b: upper bound, None means infinity
+    :return: array of samples, of the shape of u
+    """
+    if not(a is None or b is None) and a > b:
+        raise ValueError('Lower bound greater than upper bound!')
+    u = np.asarray(u, dtype=float)
+    if sigma == 0:
+        return np.full(u.shape, float(mu))
+    low = 0.0 if a is None else ld.norm_cdf((a - mu) / sigma)
+    high = 1.0 if b is None else ld.norm_cdf((b - mu) / sigma)
+    p = np.clip(low + u * (high - low), 1e-15, 1 - 1e-15)
+    x = mu + sigma * ld.norm_ppf(p)
+    return np.clip(x, -np.inf if a is None else a, np.inf if b is None else b)
+
+def _unit_points(u):
+    """
+    Points of the unit cube as an array [n, dims], also for an array [n]
+    of one dimensional points
+    """
+    u = np.asarray(u, dtype=float)
+    return u.reshape(len(u), -1)
+
+def _batch_stream(rng):
+    """
+    numpy Generator or RandomState the batch samplers draw from
+    """
+    return np.random if rng is None else rng
+
+def _integers(rng, low, high, size):
+    """
+    Random integers in [low, high) from either a numpy Generator or a
+    RandomState
+    """
+    if hasattr(rng, 'integers'):
+        return rng.integers(low, high, size)
+    return rng.randint(low, high, size)
+
+def _integer_strata(u, l, r):
+    """
+    Integers of [l, r] of the points u in [0,1), which is split in r-l+1
+    equal strata
+    """
+    return np.minimum(l + np.floor(u*(r - l + 1)).astype(np.int64), r)
+
+def _ring_coords(theta, phi, normal='Z'):
+    """
+    Unit vectors of the angles theta and phi (in degrees), on the ring with
+    the given normal
+    :return: array of shape [n,3]
+    """
+    theta = np.radians(theta)
+    phi = np.radians(phi)
+    x = np.cos(theta) * np.sin(phi)
+    y = np.sin(theta) * np.sin(phi)
+    z = np.cos(phi)
+    if normal == 'X':
+        return np.stack([-z, y, x], axis=1)
+    if normal == 'Y':
+        return np.stack([x, z, -y], axis=1)
+    return np.stack([x, y, z], axis=1)
+
+def random_shell_coords_cons(radius, phi_sigma, rng=None):
     """
     Returns a cartesian coordinates of a point on the surface of sphere defined 
     by radius (given), theta angle (drawn from uniform distribution 
@@ -82,6 +204,7 @@ def random_shell_coords_cons(radius, phi_sigma):
     centered at 90° with sigma of the distribution given.
     :param radius: radius of the sphere
     :param phi_sigma: standard devitaion of the phi distribution
+    :param rng: numpy Generator, see random_streams. None uses the random module
     :return: (x,y,z) cartesian coordinates of random point on the surface of 
             a sphere
     """
@@ -89,8 +212,9 @@ def random_shell_coords_cons(radius, phi_sigma):
     if (radius < 0 or phi_sigma < 0):
         raise ValueError("Cannot have negative radius or sigma values!")
 
-    theta = math.radians(random.uniform(0.0, 360.0))
-    phi = math.radians(sample_trunc_norm(90.0, phi_sigma, 0.0, 180.0))
+    rng = as_stream(rng)
+    theta = math.radians(rng.uniform(0.0, 360.0))
+    phi = math.radians(sample_trunc_norm(90.0, phi_sigma, 0.0, 180.0, rng=rng))
     x = radius * np.cos(theta) * np.sin(phi)
     y = radius * np.sin(theta) * np.sin(phi)
     z = radius * np.cos(phi)
@@ -111,21 +235,74 @@ def check_required_kwargs(kwarg_dict, kw_list):
 class Distribution(object):
     """
     Base class for distribution classes. This provides a required interface:
-    A sample_param() must be provided based on the sampling algorithm of the
-    distribution. log_param can be called to log sampled values.
+    A sample_param(rng=None) must be provided based on the sampling algorithm
+    of the distribution, drawing from the numpy Generator rng (see
+    random_streams) or, if rng is None, from the random module.
+    sample_batch(n, rng=None) draws n samples at once as a numpy array, of
+    shape [n] for scalar and [n,3] for coordinate distributions. If rng is
+    None, it draws from the global numpy state.
+    log_param can be called to log sampled values, they are kept in
+    self.log, a ParamLog.
+    Distributions with an inverse transform set dims, the number of uniform
+    variables a sample is made of, and map points of the unit cube to
+    samples with transform_batch(u). sample_qmc(n, method) draws these
+    points from a low-discrepancy point set, see low_discrepancy.
     """
+    dims = None
+
     def __init__(self, **kwargs):
-        self.log = []
+        self.log = ParamLog()
         pass
 
-    def sample_param(self):
+    def sample_param(self, rng=None):
         return NotImplementedError
 
+    def sample_batch(self, n, rng=None):
+        """
+        Draws n samples one at a time with sample_param. Overridden by the
+        distributions that sample whole arrays at once
+        :param n: number of samples
+        :param rng: numpy Generator, None uses the random module
+        :return: array of n samples
+        """
+        return np.array([self.sample_param(rng) for i in range(n)])
+
+    def transform_batch(self, u):
+        """
+        Maps points of the unit cube to samples by the inverse of the
+        sampling transform of the distribution, and logs them
+        :param u: array [n, self.dims] of points in [0,1)
+        :return: array of n samples, as returned by sample_batch
+        """
+        raise NotImplementedError('{} has no inverse transform'.format(type(self).__name__))
+
+    def sample_qmc(self, n, method='sobol', rng=None):
+        """
+        Draws n samples from a low-discrepancy point set: evenly spread
+        samples cover the distribution with fewer samples than i.i.d. ones
+        :param n: number of samples
+        :param method: one of low_discrepancy.SAMPLING_METHODS, 'iid' is
+            sample_batch
+        :param rng: numpy Generator randomizing the point set, None uses
+            the global numpy state
+        :return: array of n samples
+        """
+        if method == 'iid':
+            return self.sample_batch(n, rng)
+        return self.transform_batch(ld.points(method, n, self.dims, rng))
+
     def log_param(self, val):
         self.log.append(val)
 
+    def log_batch(self, values):
+        """
+        Logs every sample of an array returned by sample_batch, as
+        log_param would have logged them one by one
+        """
+        self.log.extend(values)
+
     def clear_log(self):
-        self.log = []
+        self.log = ParamLog()
 
     def give_param(self):
         return NotImplementedError
@@ -139,6 +316,8 @@ class TruncNormDist(Distribution):
     x is normal conditional on a<=x<=b. a = None means a = -inf, b = None means
     b = inf
     """
+    dims = 1
+
     def __init__(self, mu, sigmu, l=None, r=None, **kwargs):
         """
         :param mu: Mean of truncated normal
@@ -159,15 +338,37 @@ class TruncNormDist(Distribution):
         super(TruncNormDist, self).__init__(**kwargs)
 
 
+    def sample_batch(self, n, rng=None):
+        """
+        Vectorized sampling, see sample_trunc_norm_batch
+        :param n: number of samples
+        :param rng: numpy Generator, None uses the global numpy state
+        :return: array of n samples
+        """
+        y = sample_trunc_norm_batch(self.mu, self.sigmu*np.abs(self.mu), n, self.l, self.r, rng=rng)
+        self.log_batch(y)
+        return y
+
+    def transform_batch(self, u):
+        """
+        Inverse transform, see trunc_norm_ppf
+        :param u: array [n,1] of points in [0,1)
+        :return: array of n samples
+        """
+        y = trunc_norm_ppf(_unit_points(u)[:, 0], self.mu, self.sigmu*np.abs(self.mu), self.l, self.r)
+        self.log_batch(y)
+        return y
+
     def give_param(self):
         return {"dist": "TruncNormDist", "mu": self.mu, "sigmu": self.sigmu, "l": self.l, "r": self.r}
         
-    def sample_param(self):
+    def sample_param(self, rng=None):
         """
         Implementation of abstract method sample_param
+        :param rng: numpy Generator, None uses the random module
         :return: sample from this specified distribution
         """
-        y = sample_trunc_norm(self.mu, self.sigmu*np.abs(self.mu), self.l, self.r)
+        y = sample_trunc_norm(self.mu, self.sigmu*np.abs(self.mu), self.l, self.r, rng=rng)
         self.log_param(y)
         return y
     
@@ -191,6 +392,8 @@ class NormDist(Distribution):
     """
     Regular normal distribution
     """
+    dims = 1
+
     def __init__(self, mu, sigma, **kwargs):
         """
         :param mu: mean
@@ -203,15 +406,37 @@ class NormDist(Distribution):
         self.sigma = sigma
         super(NormDist, self).__init__(**kwargs)
 
-    def sample_param(self):
+    def sample_param(self, rng=None):
         """
         Implementation of abstract method sample_param
+        :param rng: numpy Generator, None uses the random module
         :return: sample from this specified distribution
         """
-        y = random.gauss(self.mu, self.sigma)
+        y = float(as_stream(rng).normal(self.mu, self.sigma))
         self.log_param(y)
         return y
 
+    def sample_batch(self, n, rng=None):
+        """
+        Vectorized sampling
+        :param n: number of samples
+        :param rng: numpy Generator, None uses the global numpy state
+        :return: array of n samples
+        """
+        y = _batch_stream(rng).normal(self.mu, self.sigma, n)
+        self.log_batch(y)
+        return y
+
+    def transform_batch(self, u):
+        """
+        Inverse transform
+        :param u: array [n,1] of points in [0,1)
+        :return: array of n samples
+        """
+        y = trunc_norm_ppf(_unit_points(u)[:, 0], self.mu, self.sigma)
+        self.log_batch(y)
+        return y
+
     def give_param(self):
         return {"dist": "NormDist","mu": self.mu, "sigma": self.sigma}
 
@@ -235,6 +460,8 @@ class UniformCDist(Distribution):
     """
     Continuous uniform distribution on an interval
     """
+    dims = 1
+
     def __init__(self, l, r, **kwargs):
         """
         :param l: Lower bound of distribution
@@ -247,17 +474,43 @@ class UniformCDist(Distribution):
             raise ValueError('Lower bound greater than upper bound!')
         super(UniformCDist, self).__init__(**kwargs)
 
-    def sample_param(self):
+    def sample_param(self, rng=None):
         """
         Implementation of abstract method sample_param
+        :param rng: numpy Generator, None uses the random module
         :return: sample from this specified distribution
         """
         if self.l > self.r:
             raise ValueError('Lower bound greater than upper bound!')
-        y = random.uniform(self.l, self.r)
+        y = float(as_stream(rng).uniform(self.l, self.r))
         self.log_param(y)
         return y
 
+    def sample_batch(self, n, rng=None):
+        """
+        Vectorized sampling
+        :param n: number of samples
+        :param rng: numpy Generator, None uses the global numpy state
+        :return: array of n samples
+        """
+        if self.l > self.r:
+            raise ValueError('Lower bound greater than upper bound!')
+        y = _batch_stream(rng).uniform(self.l, self.r, n)
+        self.log_batch(y)
+        return y
+
+    def transform_batch(self, u):
+        """
+        Inverse transform
+        :param u: array [n,1] of points in [0,1)
+        :return: array of n samples
+        """
+        if self.l > self.r:
+            raise ValueError('Lower bound greater than upper bound!')
+        y = self.l + _unit_points(u)[:, 0]*(self.r - self.l)
+        self.log_batch(y)
+        return y
+
     def give_param(self):
         return {"dist": "UniformCDist", "l": self.l, "r": self.r}
 
@@ -278,6 +531,8 @@ class UniformDDist(Distribution):
     """
     Uniform discrete distribution on the interval of integers
     """
+    dims = 1
+
     def __init__(self, l, r, **kwargs):
         """
         :param l: Lower bound of distribution
@@ -290,17 +545,43 @@ class UniformDDist(Distribution):
             raise ValueError('Lower bound greater than upper bound!')
         super(UniformDDist, self).__init__(**kwargs)
 
-    def sample_param(self):
+    def sample_param(self, rng=None):
         """
         Implementation of abstract method sample_param
+        :param rng: numpy Generator, None uses the random module
         :return: sample from this specified distribution
         """
         if self.l > self.r:
             raise ValueError('Lower bound greater than upper bound!')
-        y = random.randint(self.l, self.r)
+        y = int(as_stream(rng).integers(self.l, self.r + 1))
         self.log_param(y)
         return y
 
+    def sample_batch(self, n, rng=None):
+        """
+        Vectorized sampling
+        :param n: number of samples
+        :param rng: numpy Generator, None uses the global numpy state
+        :return: integer array of n samples
+        """
+        if self.l > self.r:
+            raise ValueError('Lower bound greater than upper bound!')
+        y = _integers(_batch_stream(rng), self.l, self.r + 1, n)
+        self.log_batch(y)
+        return y
+
+    def transform_batch(self, u):
+        """
+        Inverse transform: [0,1) is split in one stratum per integer
+        :param u: array [n,1] of points in [0,1)
+        :return: integer array of n samples
+        """
+        if self.l > self.r:
+            raise ValueError('Lower bound greater than upper bound!')
+        y = _integer_strata(_unit_points(u)[:, 0], self.l, self.r)
+        self.log_batch(y)
+        return y
+
     def give_param(self):
         return {"dist": "UniformDDist", "l": self.l, "r": self.r}
 
@@ -322,6 +603,8 @@ class PScaledUniformDDist(Distribution):
     Uniform discrete distribution on the natural numbers (non-negative integers),
     specifiable by a midpoint and a scaled range of the midpoint
     """
+    dims = 1
+
     def __init__(self, mid, scale, **kwargs):
         """
         :param mid: midpoint of the distribution
@@ -338,17 +621,43 @@ class PScaledUniformDDist(Distribution):
         self.r = int(np.round(mid + (mid * scale)))
         super(PScaledUniformDDist, self).__init__(**kwargs)
 
-    def sample_param(self):
+    def sample_param(self, rng=None):
         """
         Implementation of abstract method sample_param
+        :param rng: numpy Generator, None uses the random module
         :return: sample from this specified distribution
         """
         if self.l > self.r:
             raise ValueError('Lower bound greater than upper bound!')
-        y = random.randint(np.round(self.l), np.round(self.r))
+        y = int(as_stream(rng).integers(int(np.round(self.l)), int(np.round(self.r)) + 1))
         self.log_param(y)
         return y
 
+    def sample_batch(self, n, rng=None):
+        """
+        Vectorized sampling
+        :param n: number of samples
+        :param rng: numpy Generator, None uses the global numpy state
+        :return: integer array of n samples
+        """
+        if self.l > self.r:
+            raise ValueError('Lower bound greater than upper bound!')
+        y = _integers(_batch_stream(rng), int(np.round(self.l)), int(np.round(self.r)) + 1, n)
+        self.log_batch(y)
+        return y
+
+    def transform_batch(self, u):
+        """
+        Inverse transform: [0,1) is split in one stratum per integer
+        :param u: array [n,1] of points in [0,1)
+        :return: integer array of n samples
+        """
+        if self.l > self.r:
+            raise ValueError('Lower bound greater than upper bound!')
+        y = _integer_strata(_unit_points(u)[:, 0], int(np.round(self.l)), int(np.round(self.r)))
+        self.log_batch(y)
+        return y
+
     def give_param(self):
         return {"dist": "PScaledUniformDDist", "mid": self.mid, "scale": self.scale}
 
@@ -387,6 +696,8 @@ class ShellRingCoordinateDist(Distribution):
     phi_sigma. Normal is one of 'X', 'Y' or 'Z'. In the limit of phi_sigma
     goes towards infinity, this will look like phi is sampled unifromly
     """
+    dims = 2
+
     def __init__(self, phi_sigma, normal, **kwargs):
         """
         :param phi_sigma: 'width' of spherical ring
@@ -401,14 +712,15 @@ class ShellRingCoordinateDist(Distribution):
         self.theta = UniformCDist(l=0.0, r=360.0)
         self.phi = TruncNormDist(mu=90.0,sigmu=self.phi_sigma/90.0,l=0.0,r=180.0)
 
-    def sample_param(self):
+    def sample_param(self, rng=None):
         """
         Implementation of abstract method sample_param
+        :param rng: numpy Generator, None uses the random module
         :return: sample from this specified distribution (a triple)
         """        
         # sample phi and theta
-        theta = math.radians(self.theta.sample_param())
-        phi = math.radians(self.phi.sample_param())
+        theta = math.radians(self.theta.sample_param(rng))
+        phi = math.radians(self.phi.sample_param(rng))
 
         x = np.cos(theta) * np.sin(phi)
         y = np.sin(theta) * np.sin(phi)
@@ -425,6 +737,31 @@ class ShellRingCoordinateDist(Distribution):
 
         return coords
 
+    def sample_batch(self, n, rng=None):
+        """
+        Vectorized sampling
+        :param n: number of samples
+        :param rng: numpy Generator, None uses the global numpy state
+        :return: array of shape [n,3], one triple per row
+        """
+        theta = self.theta.sample_batch(n, rng)
+        phi = self.phi.sample_batch(n, rng)
+        coords = _ring_coords(theta, phi, self.normal)
+        self.log_batch(coords)
+        return coords
+
+    def transform_batch(self, u):
+        """
+        Inverse transform: theta from the first, phi from the second
+        coordinate of u
+        :param u: array [n,2] of points in [0,1)
+        :return: array of shape [n,3], one triple per row
+        """
+        u = _unit_points(u)
+        coords = _ring_coords(self.theta.transform_batch(u[:, 0]), self.phi.transform_batch(u[:, 1]), self.normal)
+        self.log_batch(coords)
+        return coords
+
     def give_param(self):
         return {"dist": "ShellRingCoordinateDist", "phi_sigma": self.phi_sigma, "normal": self.normal}
 
@@ -458,6 +795,8 @@ class CompositeShellRingDist(Distribution):
     specified as 'X', 'Y', 'Z', or any lexical combination of 2 or 3 of
     those, e.g. 'YZ', 'XZ' or 'XYZ'
     """
+    dims = 2
+
     def __init__(self, phi_sigma, normals, **kwargs):
         """
         :param phi_sigma: the same phi_sigma for every ring
@@ -474,17 +813,54 @@ class CompositeShellRingDist(Distribution):
             self.distributions.append(ShellRingCoordinateDist(phi_sigma=self.phi_sigma, normal=normal))
         self.distribution_select = UniformDDist(l=0,r=len(self.distributions)-1)
 
-    def sample_param(self):
+    def sample_param(self, rng=None):
         """
         Implementation of abstract method sample_param
+        :param rng: numpy Generator, None uses the random module
         :return: sample from this specified distribution (a triple)
         """
-        selection = self.distribution_select.sample_param()
+        selection = self.distribution_select.sample_param(rng)
         selected_distribution = self.distributions[selection]
-        coords = selected_distribution.sample_param()
+        coords = selected_distribution.sample_param(rng)
         self.log_param(coords)
         return coords
 
+    def sample_batch(self, n, rng=None):
+        """
+        Vectorized sampling: the ring of every sample is selected at once,
+        then each ring samples all of its triples at once
+        :param n: number of samples
+        :param rng: numpy Generator, None uses the global numpy state
+        :return: array of shape [n,3], one triple per row
+        """
+        selection = self.distribution_select.sample_batch(n, rng)
+        coords = np.empty((n, 3))
+        for i, distribution in enumerate(self.distributions):
+            selected = selection == i
+            coords[selected] = distribution.sample_batch(np.count_nonzero(selected), rng)
+        self.log_batch(coords)
+        return coords
+
+    def transform_batch(self, u):
+        """
+        Inverse transform: the first coordinate of u selects the ring and,
+        rescaled within the stratum of the ring, gives theta. The second
+        gives phi. Evenly spread points are so evenly spread over all rings
+        :param u: array [n,2] of points in [0,1)
+        :return: array of shape [n,3], one triple per row
+        """
+        u = _unit_points(u)
+        rings = len(self.distributions)
+        t = u[:, 0]*rings
+        selection = np.minimum(np.floor(t).astype(np.int64), rings - 1)
+        self.distribution_select.log_batch(selection)
+        coords = np.empty((len(u), 3))
+        for i, distribution in enumerate(self.distributions):
+            selected = selection == i
+            coords[selected] = distribution.transform_batch(np.stack([t[selected] - i, u[selected, 1]], axis=1))
+        self.log_batch(coords)
+        return coords
+
     def give_param(self):
         return {"dist": "CompositeShellRingDist", "phi_sigma": self.phi_sigma, "normals": self.normals}
 
@@ -523,6 +899,8 @@ class UniformShellCoordinateDist(Distribution):
     about 30.0 gives an approxiamtely radially uniform distribution about
     the sphere
     """
+    dims = 2
+
     def __init__(self, **kwargs):
         """
         :param kwargs: kwargs to be passed on to parent class
@@ -531,13 +909,14 @@ class UniformShellCoordinateDist(Distribution):
         self.phi = TruncNormDist(mu=90.0,sigmu=30.0/90.0,l=0.0,r=180.0)
         super(UniformShellCoordinateDist, self).__init__(**kwargs)
         
-    def sample_param(self):
+    def sample_param(self, rng=None):
         """
         Implementation of abstract method sample_param
+        :param rng: numpy Generator, None uses the random module
         :return: sample from this specified distribution (a triple)
         """
-        theta = math.radians(self.theta.sample_param())
-        phi = math.radians(self.phi.sample_param())
+        theta = math.radians(self.theta.sample_param(rng))
+        phi = math.radians(self.phi.sample_param(rng))
 
         x = np.cos(theta) * np.sin(phi)
         y = np.sin(theta) * np.sin(phi)
@@ -546,9 +925,125 @@ class UniformShellCoordinateDist(Distribution):
         self.log_param(coords)
         return coords
     
+    def sample_batch(self, n, rng=None):
+        """
+        Vectorized sampling
+        :param n: number of samples
+        :param rng: numpy Generator, None uses the global numpy state
+        :return: array of shape [n,3], one triple per row
+        """
+        theta = self.theta.sample_batch(n, rng)
+        phi = self.phi.sample_batch(n, rng)
+        coords = _ring_coords(theta, phi)
+        self.log_batch(coords)
+        return coords
+
+    def transform_batch(self, u):
+        """
+        Inverse transform: theta from the first, phi from the second
+        coordinate of u
+        :param u: array [n,2] of points in [0,1)
+        :return: array of shape [n,3], one triple per row
+        """
+        u = _unit_points(u)
+        coords = _ring_coords(self.theta.transform_batch(u[:, 0]), self.phi.transform_batch(u[:, 1]))
+        self.log_batch(coords)
+        return coords
+
     def give_param(self):
         return {"dist": "UniformShellCoordinateDist"}
 
+def default_scene_distributions():
+    """
+    Default distributions of the random variables of a scene, see
+    BlenderAPI.BlenderScene.BlenderRandomScene
+    :return: dictionary of attribute name -> Distribution
+    """
+    return {
+        # light params
+        'num_lamps': PScaledUniformDDist(mid=2, scale=0.5),
+        'lamp_loc': UniformShellCoordinateDist(),
+        'lamp_distance': TruncNormDist(mu=5.0, sigmu=0.0, l=2.0, r=None),
+        'lamp_energy': TruncNormDist(mu=5000., sigmu=0.3, l=0.0, r=None),
+        'lamp_size': TruncNormDist(mu=5., sigmu=0.3, l=0.0, r=None),
+        # camera params
+        'camera_loc': CompositeShellRingDist(phi_sigma=10.0, normals='YZ'),
+        'camera_radius': TruncNormDist(mu=6.0, sigmu=0.3, l=2.0, r=None),
+        'spin_angle': UniformCDist(l=0.0, r=360.0),
+        # mesh params
+        'subject_size': NormDist(mu=8.0, sigma=0.0),
+    }
+
+# parameters of a scene that change between the views of a batch, see
+# BlenderAPI.BlenderScene.BlenderRandomScene.views_setup
+VIEW_PARAMS = ['camera_loc', 'camera_radius', 'spin_angle']
+
+def sample_lamp(distributions, rng=None):
+    """
+    Samples the parameters of one lamp
+    :param distributions: dictionary of attribute name -> Distribution, as
+        returned by default_scene_distributions
+    :param rng: numpy Generator, None uses the random module
+    :return: dictionary with keys 'loc', 'distance', 'energy', 'size'
+    """
+    return {'loc': distributions['lamp_loc'].sample_param(rng),
+            'distance': distributions['lamp_distance'].sample_param(rng),
+            'energy': distributions['lamp_energy'].sample_param(rng),
+            'size': distributions['lamp_size'].sample_param(rng)}
+
+def sample_scene(distributions, rng=None):
+    """
+    Samples the parameters of a scene, in the same order as they have
+    always been sampled
+    :param distributions: see sample_lamp
+    :param rng: numpy Generator, None uses the random module
+    :return: dictionary with keys 'num_lamps', 'lamps' (a list of
+        sample_lamp dictionaries, one per active lamp), 'camera_loc',
+        'camera_radius', 'spin_angle' and 'subject_size'
+    """
+    params = {'num_lamps': distributions['num_lamps'].sample_param(rng)}
+    params['lamps'] = [sample_lamp(distributions, rng) for l in range(params['num_lamps'])]
+    for attr in ['camera_loc', 'camera_radius', 'spin_angle', 'subject_size']:
+        params[attr] = distributions[attr].sample_param(rng)
+    return params
+
+def log_scene(distributions, params):
+    """
+    Logs the parameters of a scene that was not sampled by sample_scene
+    in the distributions, as if they had been sampled
+    :param distributions: see sample_lamp
+    :param params: see sample_scene
+    :return: None
+    """
+    distributions['num_lamps'].log_param(params['num_lamps'])
+    for lamp in params['lamps']:
+        distributions['lamp_loc'].log_param(lamp['loc'])
+        distributions['lamp_distance'].log_param(lamp['distance'])
+        distributions['lamp_energy'].log_param(lamp['energy'])
+        distributions['lamp_size'].log_param(lamp['size'])
+    for attr in ['camera_loc', 'camera_radius', 'spin_angle', 'subject_size']:
+        distributions[attr].log_param(params[attr])
+
+def sample_view(distributions, scene, rng=None):
+    """
+    Samples another view of a scene. A whole scene is sampled from rng, as
+    a render of its own would be, and only its VIEW_PARAMS are kept: the
+    camera of the view is the camera of that render. The other parameters
+    are those of scene, and the view is logged as a whole scene with them
+    :param distributions: see sample_lamp
+    :param scene: parameters of the scene, see sample_scene
+    :param rng: numpy Generator, None uses the random module
+    :return: parameters of the view, see sample_scene
+    """
+    start = {name: len(distribution.log) for name, distribution in distributions.items()}
+    sampled = sample_scene(distributions, rng)
+    for name, distribution in distributions.items():
+        distribution.log.truncate(start[name])
+    params = dict(scene)
+    params.update((attr, sampled[attr]) for attr in VIEW_PARAMS)
+    log_scene(distributions, params)
+    return params
+
 def DistributionFactory(**params):
     check_required_kwargs(params, ['dist'])
     return {
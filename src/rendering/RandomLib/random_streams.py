@@ -0,0 +1,84 @@
+"""
+Seeded, independent random streams.
+
+Every random choice of a run is drawn from a numpy Generator derived from
+the seed of the run and keys naming what is sampled, e.g. a product and the
+index of one of its renders, or a product and the name of one of its
+images:
+
+    rng = stream(seed, 'Liberte', 12)     # stream of render12 of Liberte
+    x = distribution.sample_param(rng)
+
+A stream depends only on the seed and its keys, not on what was sampled
+before it or in which process, so runs split over any number of workers
+sample exactly what a serial run does.
+
+Code given no stream keeps using the global random state: the random module
+for RandomLib.random_render and np.random for the backgrounds and offsets.
+"""
+import random
+import zlib
+
+import numpy as np
+
+
+def _entropy(key):
+    if isinstance(key, str):
+        return zlib.crc32(key.encode('utf-8'))
+    key = int(key)
+    if key < 0:
+        raise ValueError('Stream keys must be strings or non-negative integers')
+    return key
+
+
+def stream_seed(seed, *keys):
+    """
+    Derives the seed of a stream from the seed of the run and its keys
+    :param seed: non-negative integer seed of the run
+    :param keys: strings or non-negative integers naming the stream
+    :return: 32 bit integer seed
+    """
+    entropy = [_entropy(seed)] + [_entropy(key) for key in keys]
+    return int(np.random.SeedSequence(entropy).generate_state(1)[0])
+
+
+def stream(seed, *keys):
+    """
+    :param seed: non-negative integer seed of the run
+    :param keys: strings or non-negative integers naming the stream
+    :return: numpy Generator of the stream, see stream_seed
+    """
+    return np.random.default_rng(stream_seed(seed, *keys))
+
+
+class GlobalStream(object):
+    """
+    The subset of the numpy Generator interface used by RandomLib, drawn
+    from the global state of the random module. Used when no stream is
+    given, so that seeding the random module behaves as it always did.
+    """
+    def random(self):
+        return random.random()
+
+    def uniform(self, low=0.0, high=1.0):
+        return random.uniform(low, high)
+
+    def normal(self, loc=0.0, scale=1.0):
+        return random.gauss(loc, scale)
+
+    def integers(self, low, high):
+        """
+        :return: random integer in [low, high)
+        """
+        return random.randrange(low, high)
+
+
+global_stream = GlobalStream()
+
+
+def as_stream(rng=None):
+    """
+    :param rng: numpy Generator, or None for the global random module
+    :return: rng, or global_stream if rng is None
+    """
+    return global_stream if rng is None else rng
@@ -9,9 +9,15 @@ import shutil
 import fnmatch
 import zipfile
 import uuid
+from contextlib import ExitStack
 import bpy
 #import rendering.BlenderAPI as bld
 from . import BlenderAPI as bld
+from .render_cache import RenderCache
+from .model_cache import validate_and_extract_model
+from .RandomLib.random_streams import stream
+from .RandomLib.param_log import save_logs
+from .render_log import RenderLog, INFO, DEBUG
 
 def finds(patterns, list):
     results = []
@@ -25,18 +31,6 @@ def find(pattern, list):
             result.append(item)
     return result
 
-def validate_and_extract_model(model):
-    if not (len(model.namelist()) == 4 or len(model.namelist()) == 2):
-        raise ValueError('model file not correct format!')
-    if len(model.namelist()) == 4:
-        if not set(['Bot.jpg', 'Bot.obj', 'Top.obj', 'Top.jpg']) == set(model.namelist()):
-            raise ValueError('model file not correct format!')
-        return ['Bot.obj', 'Bot.jpg', 'Top.obj', 'Top.jpg']
-    if len(model.namelist()) == 2:
-       if not (len(find('*.jpg', model.namelist()))==1 and len(find('*.obj', model.namelist()))==1):
-           raise ValueError('model file not correct format!')
-       return find('*.obj', model.namelist()) + find('*.jpg', model.namelist())
-
 class RenderInterface(object):
     """
     Provides a high-level interface to the rendering engine (and the background
@@ -46,20 +40,40 @@ class RenderInterface(object):
     the specified subject, with respect to the distributions on the random
     variables involved.
     """
-    def __init__(self, num_images=None, resolution=300, samples=128):
+    def __init__(self, num_images=None, resolution=300, samples=128, render_cache=None, log=None, model_cache=None,
+                 scene_template=False, quality=None):
         """
         :param num_images: number of images to render on render_all()
+        :param render_cache: optional RenderCache, renders of poses it already
+        holds are copied from it instead of rendered again
+        :param log: optional RenderLog, Blender output and messages go to it.
+        Default: a RenderLog redirecting to blender_render.log. Using it as a
+        context manager around a session redirects the output only once
+        :param model_cache: optional ModelCache, .model files are extracted
+        into it once instead of into a temporary folder on every load
+        :param scene_template: if True, the subjects and their materials are
+        created once and loading a model only swaps meshes and textures, see
+        BlenderRandomScene
+        :param quality: optional name of a quality preset, see render_quality.
+        With a preset, samples is ignored
         """
         self.num_images = num_images
         self.scene = None
-        self.setup_blender(resolution, samples)
+        self.render_cache = render_cache
+        self.model_cache = model_cache
+        # hash of the loaded model file, part of the render cache key
+        self.model_hash = None
         self.logfile = 'blender_render.log'
+        self.log = log if log is not None else RenderLog(self.logfile)
+        self.setup_blender(resolution, samples, scene_template, quality)
 
-    def setup_blender(self, resolution=300, samples=128):
+    def setup_blender(self, resolution=300, samples=128, scene_template=False, quality=None):
         """
         To be called on the first time blender is launched. Performs clean-up and
         setup of the scene, and instantiates the BlenderRandomScene class that
         controls all rendering
+        :param scene_template: see __init__
+        :param quality: see __init__
         :return: None
         """
         C = bpy.context
@@ -68,48 +82,57 @@ class RenderInterface(object):
             C.user_preferences.addons['cycles'].preferences.compute_device_type = 'CUDA'
             C.user_preferences.addons['cycles'].preferences.devices[0].use = True
         except:
-            print("Warning: CUDA device not detected, using CPU instead!", file=sys.stderr)
+            self.log.warning("Warning: CUDA device not detected, using CPU instead!")
 
         # instantiate scene
-        self.scene = bld.BlenderRandomScene(bpy.data.scenes[0])
+        self.scene = bld.BlenderRandomScene(bpy.data.scenes[0], template=scene_template)
         # delete the initial cube
         cube = bld.BlenderCube(reference=bpy.data.objects['Cube'])
         cube.delete()
         # Fetch the camera and lamp
         cam = bld.BlenderCamera(bpy.data.objects['Camera'])
-        self.scene.set_render(resolution, samples)
+        self.set_render(resolution, samples, quality)
         self.scene.add_camera(cam)
 
-    def load_subject(self, obj_path, texture_path, output_file, obj_path_bot=None, texture_path_bot=None):
+    def set_render(self, resolution=300, samples=128, quality=None):
+        """
+        Changes the render resolution and number of Cycles samples
+        :param resolution: size of the square render in pixels
+        :param samples: number of Cycles samples per pixel
+        :param quality: optional name of a quality preset, see
+        render_quality. With a preset, samples is ignored
+        :return: None
+        """
+        self.render_quality = self.scene.set_render(resolution, samples, quality)
+        # part of the render cache key, the same as before presets without one
+        if quality is None:
+            self.render_settings = (resolution, samples)
+        else:
+            self.render_settings = (resolution, self.render_quality['samples'], quality)
+
+    def load_subject(self, obj_path, texture_path, output_file, obj_path_bot=None, texture_path_bot=None,
+                     pack_textures=False):
         """
         Loads a single subject into the RandomScene
         :param obj_path:
         :param texture_path:
         :param output_file:
+        :param pack_textures: if True, textures are packed into Blender's data
+        and their files can be removed after loading
         :return:
         """
 
-        # begin output redirection
-        open(self.logfile, 'a').close()
-        old = os.dup(1)
-        sys.stdout.flush()
-        os.close(1)
-        os.open(self.logfile, os.O_WRONLY)
-
-        print("RENDER INTERFACE: Loading subjects {}, {}".format(obj_path, obj_path_bot), file=sys.stderr)
-        print("RENDER INTERFACE: Loading textures {}, {}".format(texture_path, texture_path_bot), file=sys.stderr)
-        self.output_file = output_file
-        self.scene.load_subject_from_path(
-            obj_path=obj_path, texture_path=texture_path, obj_path_bot=obj_path_bot, texture_path_bot=texture_path_bot)
-        print("RENDER INTERFACE: Finish loading subjects! ", file=sys.stderr)
-        print("\n", file=sys.stderr)
-
-        # end output redirection
-        os.close(1)
-        os.dup(old)
-        os.close(old)
-
-    def load_subjects(self, obj_path, texture_path, obj_path_bot, texture_path_bot, output_file):
+        with self.log.redirect():
+            self.model_hash = None
+            self.log.info("RENDER INTERFACE: Loading subjects {}, {}".format(obj_path, obj_path_bot))
+            self.log.info("RENDER INTERFACE: Loading textures {}, {}".format(texture_path, texture_path_bot))
+            self.output_file = output_file
+            self.scene.load_subject_from_path(
+                obj_path=obj_path, texture_path=texture_path, obj_path_bot=obj_path_bot, texture_path_bot=texture_path_bot,
+                pack_textures=pack_textures)
+            self.log.info("RENDER INTERFACE: Finish loading subjects! \n")
+
+    def load_subjects(self, obj_path, texture_path, obj_path_bot, texture_path_bot, output_file, pack_textures=False):
         """
         Loads two subjects into the RandomScene
         :param obj_path:
@@ -117,43 +140,47 @@ class RenderInterface(object):
         :param obj_path_bot:
         :param texture_path_bot:
         :param output_file:
+        :param pack_textures: see load_subject
         :return:
         """
-        # begin output redirection
-        open(self.logfile, 'a').close()
-        old = os.dup(1)
-        sys.stdout.flush()
-        os.close(1)
-        os.open(self.logfile, os.O_WRONLY)
-
-        print("BLENDER RENDER INTERFACE: Loading subjects from : \n {}, \n {}".format(obj_path, obj_path_bot) , file=sys.stderr)
-        print("BLENDER RENDER INTERFACE: Loading textures from : \n {}, \n {}".format(texture_path, texture_path_bot), file=sys.stderr)
-        self.output_file = output_file
-        self.scene.load_subject_from_path(
-            obj_path=obj_path, texture_path=texture_path, obj_path_bot=obj_path_bot, texture_path_bot=texture_path_bot)
-        print("BLENDER RENDER INTERFACE: Finish loading subjects! ", file=sys.stderr)
-        print("\n", file=sys.stderr)
-
-        # end output redirection
-        os.close(1)
-        os.dup(old)
-        os.close(old)
+        with self.log.redirect():
+            self.model_hash = None
+            self.log.info("BLENDER RENDER INTERFACE: Loading subjects from : \n {}, \n {}".format(obj_path, obj_path_bot))
+            self.log.info("BLENDER RENDER INTERFACE: Loading textures from : \n {}, \n {}".format(texture_path, texture_path_bot))
+            self.output_file = output_file
+            self.scene.load_subject_from_path(
+                obj_path=obj_path, texture_path=texture_path, obj_path_bot=obj_path_bot, texture_path_bot=texture_path_bot,
+                pack_textures=pack_textures)
+            self.log.info("BLENDER RENDER INTERFACE: Finish loading subjects! \n")
 
     def load_from_model(self, model_path, output_file):
-
+        """
+        Loads the subjects of a .model file. With a model cache, the model is
+        extracted once and later loads read the extracted files. Without one,
+        it is extracted into a temporary folder that is removed after loading.
+        Textures are packed into Blender's data, so the loaded subject does
+        not depend on the extracted files.
+        :param model_path: path to the .model file
+        :param output_file: folder of the renders
+        """
         self.output_file = output_file
+        self.model_hash = None
         # check the model file
         if not model_path.lower().endswith('.model'):
             raise ValueError('file extension not wrong!')
 
-        with zipfile.ZipFile(model_path, 'r') as model:
-            files = validate_and_extract_model(model)
-            # attempt to create a non-existent folder
-            temp = os.path.join(output_file, str(uuid.uuid4()))
-            if os.path.isdir(temp):
-                raise ValueError('unique ID not unique!')  # Fatal
-            os.mkdir(temp)
-            model.extractall(temp)
+        if self.model_cache is not None:
+            temp, files, model_hash = self.model_cache.extract(model_path)
+        else:
+            model_hash = None
+            with zipfile.ZipFile(model_path, 'r') as model:
+                files = validate_and_extract_model(model)
+                # attempt to create a non-existent folder
+                temp = os.path.join(output_file, str(uuid.uuid4()))
+                if os.path.isdir(temp):
+                    raise ValueError('unique ID not unique!')  # Fatal
+                os.mkdir(temp)
+                model.extractall(temp)
 
         error_reading_file = False
         if len(files) == 4:
@@ -162,41 +189,96 @@ class RenderInterface(object):
             top_obj_path = os.path.join(temp, files[2])
             top_texture_path = os.path.join(temp, files[3])
             try:
-                self.load_subjects(top_obj_path, top_texture_path, bot_obj_path, bot_texture_path, output_file)
+                self.load_subjects(top_obj_path, top_texture_path, bot_obj_path, bot_texture_path, output_file,
+                                   pack_textures=True)
             except :
                 error_reading_file = True
         elif len(files) == 2:
             obj_path = os.path.join(temp, files[0])
             texture_path = os.path.join(temp, files[1])
             try:
-                self.load_subject(obj_path, texture_path, output_file)
+                self.load_subject(obj_path, texture_path, output_file, pack_textures=True)
             except:
                 error_reading_file = True
 
-        # this is really ugly, but it does the job - rendering it for the first
-        # time loads the image into Blender's memory, removing the need to
-        # have a persistent texture file
-        if not error_reading_file:
-            # start output redirection
-            open(self.logfile, 'a').close()
-            old = os.dup(1)
-            sys.stdout.flush()
-            os.close(1)
-            os.open(self.logfile, os.O_WRONLY)
-            # render
-            self.scene.render_to_file(os.path.join(temp, 'pre-render.png'))
-            # end output redirection
-            os.close(1)
-            os.dup(old)
-            os.close(old)
-        # we can now clean house
-        shutil.rmtree(temp)
+        # the textures are packed, we can now clean house
+        if self.model_cache is None:
+            shutil.rmtree(temp)
 
         if error_reading_file:
             raise IOError("Error reading model file contents!")
+        if self.render_cache is not None:
+            self.model_hash = model_hash if model_hash is not None else RenderCache.hash_file(model_path)
         return
 
 
+    def render_one(self, render, dry_run, seed, schedule, use_cache):
+        """
+        Sets up and renders render<render>, see render_all
+        :return: True if the render came from the render cache
+        """
+        render_path = os.path.join(self.output_file, 'render%d.png' % render)
+        params = None
+        if schedule is not None:
+            params = schedule.scene(render)
+        elif seed is not None:
+            self.scene.rng = stream(seed, render)
+        self.scene.scene_setup(params)
+        if dry_run:
+            return False
+        if use_cache:
+            key = RenderCache.key(self.model_hash, self.render_settings, self.scene.last_sample)
+            if self.render_cache.get(key, render_path):
+                return True
+            self.scene.render_to_file(render_path, setup=False)
+            self.render_cache.put(key, render_path)
+        else:
+            self.scene.render_to_file(render_path, setup=False)
+        return False
+
+    def render_views(self, renders, dry_run, seed, schedule, use_cache):
+        """
+        Sets up the renders as views of one scene and renders them in one
+        animation, see render_all and BlenderRandomScene.views_setup. If the
+        render cache holds every view, nothing is rendered
+        :param renders: indices of the renders
+        :return: list of one boolean per render, True if it came from the
+        render cache
+        """
+        render_paths = [os.path.join(self.output_file, 'render%d.png' % k) for k in renders]
+        # the frames are rendered apart from the renders, so an interrupted
+        # batch leaves no extra images in the product folder
+        frames_folder = os.path.join(self.output_file, 'views')
+        rows = None
+        rngs = None
+        if schedule is not None:
+            rows = [schedule.scene(k) for k in renders]
+        elif seed is not None:
+            rngs = [stream(seed, k) for k in renders]
+        self.scene.views_setup(len(renders), rows=rows, rngs=rngs)
+        try:
+            if dry_run:
+                return [False] * len(renders)
+            keys = None
+            cached = [False] * len(renders)
+            if use_cache:
+                keys = [RenderCache.key(self.model_hash, self.render_settings, sample)
+                        for sample in self.scene.last_samples]
+                cached = [self.render_cache.get(key, path) for key, path in zip(keys, render_paths)]
+                if all(cached):
+                    return cached
+            os.makedirs(frames_folder, exist_ok=True)
+            self.scene.render_views(render_paths, frames_folder)
+            if use_cache:
+                for key, path, hit in zip(keys, render_paths, cached):
+                    if not hit:
+                        self.render_cache.put(key, path)
+            # every view was rendered again
+            return [False] * len(renders)
+        finally:
+            self.scene.clear_views()
+            shutil.rmtree(frames_folder, ignore_errors=True)
+
     def change_output_file(self, new_output_file):
         self.output_file = new_output_file
 
@@ -244,48 +326,99 @@ class RenderInterface(object):
         """
         self.scene.set_attribute_distribution(attr, params)
 
-    def render_all(self, dump_logs=False, visualize=False, verb=1, progress=False, dry_run=True):
+    def reset_distributions(self):
+        """
+        Resets all distributions of the scene to their defaults, see
+        BlenderRandomScene.set_default_distributions
+        :return: None
+        """
+        self.scene.set_default_distributions()
+
+    def set_blender_attributes(self, blender_attributes):
+        """
+        Applies a dictionary of blender attributes, in the format passed to
+        render_pipeline.generate_poses, to the scene
+        :param blender_attributes: dict with keys 'attribute_distribution_params'
+        and 'attribute_distribution'
+        :return: None
+        """
+        for param in blender_attributes.get('attribute_distribution_params', []):
+            self.log.info(str(param))
+            self.set_attribute_distribution_params(param[0], param[1], param[2])
+
+        for dist in blender_attributes.get('attribute_distribution', []):
+            self.log.info(str(dist))
+            self.set_attribute_distribution(dist[0], dist[1])
+
+    def render_all(self, dump_logs=False, visualize=False, verb=1, progress=False, dry_run=True, start_index=0, seed=None, schedule=None,
+                   batch_views=1):
+        """
+        Renders self.num_images images of the loaded subject to self.output_file
+        :param start_index: index of the first render, images are saved as
+        render<start_index + i>.png. Used when the renders of one product are
+        split over several Blender processes
+        :param seed: if given, the pose of render<k> is sampled from the random
+        stream (seed, k), see RandomLib.random_streams. The poses are then the
+        same however the renders are split over processes, and are sampled
+        again by a later run with the same seed. With a render cache these are
+        then served from the cache. The hits and misses are dumped to
+        stats/render_cache.json with the other logs
+        :param schedule: optional render_schedule.RenderSchedule of the
+        product. render<k> is set up with row k of the schedule instead of
+        sampling, seed is then ignored
+        :param verb: 1 logs the time of every render at INFO level, other
+        values at DEBUG level. Below 2 the Blender output goes to the log file.
+        The time, Cycles samples and quality preset of every render are also
+        dumped to stats/render_log.jsonl, see render_log.read_records
+        :param batch_views: number of views rendered per scene. Above 1, the
+        renders are set up in batches of batch_views views sharing the lamps
+        and the subject size of the first, and every batch is rendered as one
+        animation, see BlenderRandomScene.views_setup. The camera of render<k>
+        is still sampled from stream (seed, k) or row k of the schedule. The
+        time of a batch is split evenly over its renders
+        """
+        use_cache = self.render_cache is not None and self.model_hash is not None
+        if use_cache:
+            self.render_cache.reset_stats()
 
         if dry_run:
-            print("BLENDER RENDER INTERFACE : DRY RUN MODE \n")
+            self.log.info("BLENDER RENDER INTERFACE : DRY RUN MODE \n")
 
-        print("BLENDER RENDER INTERFACE : Rendering {} images to {} \n ".
-              format(self.num_images, self.output_file), file=sys.stderr)
+        self.log.info("BLENDER RENDER INTERFACE : Rendering {} images to {} \n ".
+                      format(self.num_images, self.output_file))
 
         if progress:
             import progressbar
             bar = progressbar.ProgressBar(redirect_stdout=True, max_value=self.num_images)
 
-        if verb < 2:
-            # begin output redirection
-            open(self.logfile, 'a').close()
-            old = os.dup(1)
-            sys.stdout.flush()
-            os.close(1)
-            os.open(self.logfile, os.O_WRONLY)
-
-        for i in range(self.num_images):
-            start = time.time()
-            # **********************  RENDER N SAVE **********************
-            render_path = os.path.join(self.output_file, 'render%d.png' % i)
-            if dry_run:
-                self.scene.scene_setup()
-                continue
-            self.scene.render_to_file(render_path)
-            end = time.time()
-
-            if verb == 1:
-                print('BLENDER RENDER INTERAFCE : Rendered image {} of {}. Elapsed time: {:.3f}s'.
-                      format(i, self.num_images, end-start), file=sys.stderr)
-
-            if progress:
-                bar.update(i)
-
-        if verb < 2:
-            # end output redirection
-            os.close(1)
-            os.dup(old)
-            os.close(old)
+        self.log.clear_records()
+        with ExitStack() as redirection:
+            if verb < 2:
+                # no-op if the session already redirects the output
+                redirection.enter_context(self.log.redirect())
+
+            for i in range(0, self.num_images, batch_views):
+                start = time.time()
+                # **********************  RENDER N SAVE **********************
+                renders = [start_index + j for j in range(i, min(i + batch_views, self.num_images))]
+                if batch_views > 1:
+                    cached = self.render_views(renders, dry_run, seed, schedule, use_cache)
+                else:
+                    cached = [self.render_one(renders[0], dry_run, seed, schedule, use_cache)]
+                if dry_run:
+                    continue
+                end = time.time()
+
+                for k, hit in zip(renders, cached):
+                    self.log.record(render=k, seconds=(end - start) / len(renders), cached=hit,
+                                    samples=self.render_quality['samples'], quality=self.render_quality['quality'])
+                self.log.log(INFO if verb == 1 else DEBUG,
+                             'BLENDER RENDER INTERAFCE : Rendered image {} of {}. Elapsed time: {:.3f}s'.
+                             format(i + len(renders) - 1, self.num_images, end-start))
+
+                if progress:
+                    bar.update(i + len(renders) - 1)
+        self.scene.rng = None
 
         logs = self.scene.retrieve_logs()
         params = self.scene.give_params()
@@ -295,14 +428,17 @@ class RenderInterface(object):
 
         if dump_logs:
             import json
-            dump_file = os.path.join(self.output_file, 'stats', 'randomvars_dump.json')
-            with open(dump_file, "w+") as f:
-                json.dump(logs, f, sort_keys=True, indent=4, separators=(',', ': '))
+            # one column per attribute, see RandomLib.param_log
+            save_logs(os.path.join(self.output_file, 'stats', 'randomvars_dump.npz'), logs)
             dump_file = os.path.join(self.output_file, 'stats', 'randomparams_dump.json')
             with open(dump_file, "w+") as f:
                 json.dump(params, f, sort_keys=True, indent=4, separators=(',', ': '))
+            if use_cache:
+                self.render_cache.dump_stats(os.path.join(self.output_file, 'stats', 'render_cache.json'))
+            self.log.dump_records(os.path.join(self.output_file, 'stats', 'render_log.jsonl'))
 
         if visualize:
-            print("Warning: Visualizing Stats is Deprecated. Another script will be added to visualize it separately!", file=sys.stderr)
+            self.log.warning("Warning: Visualizing Stats is Deprecated. Another script will be added to visualize it separately!")
 
+        self.log.flush()
         return logs
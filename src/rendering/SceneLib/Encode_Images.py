@@ -0,0 +1,256 @@
+"""
+Encoders used to write the final images of the rendering pipeline.
+
+Every final image used to be written with
+PIL.Image.save(..., "JPEG", quality=80, optimize=True, progressive=True).
+The optimize and progressive passes roughly double the encoding time, so the
+encoding backend can be chosen per run:
+
+    'pil':        PIL JPEG with optimize and progressive, the original format
+    'pil_fast':   PIL JPEG without optimize and progressive
+    'simplejpeg': libjpeg-turbo through simplejpeg, if installed
+    'cv2':        libjpeg(-turbo) through OpenCV, if installed
+    'png':        lossless PNG with fast compression
+    'raw':        uncompressed binary PPM
+
+Every encoder keeps EncodingStats of the images it wrote, with the time
+spent encoding and writing them and their size.
+
+Instead of files, the images can be written to a sink, any object with an
+add(path, data) method such as Shard_Images.ShardWriter. Copies of the
+encoder sent to worker processes buffer the encoded images, which are handed
+to the sink when the worker copies are collected in the main process.
+"""
+import copy
+import importlib.util
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+
+class EncoderError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class EncodingStats(object):
+    """
+    Number of images written, total seconds spent encoding and writing them
+    and their total size in bytes
+    """
+    def __init__(self, images=0, seconds=0., bytes=0):
+        self.images = images
+        self.seconds = seconds
+        self.bytes = bytes
+
+    def add(self, seconds, nbytes):
+        self.images += 1
+        self.seconds += seconds
+        self.bytes += nbytes
+
+    def merge(self, other):
+        """
+        Adds the stats of other, e.g. of an encoder used in a worker process
+        """
+        self.images += other.images
+        self.seconds += other.seconds
+        self.bytes += other.bytes
+
+    def summary(self):
+        """
+        :return: dictionary of the totals and per image averages
+        """
+        per_image = max(self.images, 1)
+        return {'images': self.images,
+                'seconds': round(self.seconds, 3),
+                'bytes': self.bytes,
+                'ms_per_image': round(1000*self.seconds/per_image, 3),
+                'bytes_per_image': int(round(self.bytes/per_image))}
+
+
+def _as_image(image):
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image, mode='RGB')
+    return image
+
+
+def _as_array(image):
+    return np.ascontiguousarray(np.asarray(image.convert('RGB') if isinstance(image, Image.Image) else image))
+
+
+class ImageEncoder(object):
+    """
+    Base class of the encoders. Subclasses implement encode.
+    :param quality: JPEG quality, ignored by lossless encoders
+    """
+    name = None
+    extension = None
+
+    def __init__(self, quality=80):
+        self.quality = quality
+        self.stats = EncodingStats()
+        # sink the images are added to instead of being written to files
+        self.sink = None
+        # list of (path, data) kept by worker copies of an encoder with a sink
+        self.buffer = None
+
+    def __getstate__(self):
+        # the sink stays in the main process, copies buffer the images instead
+        state = self.__dict__.copy()
+        if state['sink'] is not None:
+            state['sink'] = None
+            state['buffer'] = []
+        return state
+
+    def encode(self, image):
+        """
+        :param image: PIL image or [H,W,3] uint8 array
+        :return: the encoded image as bytes
+        """
+        raise NotImplementedError
+
+    def save(self, image, path):
+        """
+        Encodes image and writes it to path, recording the time and size
+        :param image: PIL image or [H,W,3] uint8 array
+        :param path: full path of the file, including the extension
+        :return: number of bytes written
+        """
+        start = time.time()
+        data = self.encode(image)
+        if self.buffer is not None:
+            self.buffer.append((path, data))
+        elif self.sink is not None:
+            self.sink.add(path, data)
+        else:
+            with open(path, 'wb') as f:
+                f.write(data)
+        self.stats.add(time.time() - start, len(data))
+        return len(data)
+
+    def fresh(self):
+        """
+        Copy of this encoder with empty stats, for a single task that hands
+        the copy back to the caller, see collect
+        """
+        clone = copy.copy(self)
+        clone.stats = EncodingStats()
+        if self.sink is not None or self.buffer is not None:
+            clone.sink = None
+            clone.buffer = []
+        return clone
+
+    def collect(self, worker):
+        """
+        Adds the stats of a copy returned by a task to the stats of this
+        encoder and hands the images it buffered to the sink
+        :param worker: copy of this encoder made by fresh
+        """
+        self.stats.merge(worker.stats)
+        for path, data in worker.buffer or []:
+            if self.buffer is not None:
+                self.buffer.append((path, data))
+            else:
+                self.sink.add(path, data)
+
+
+class PILEncoder(ImageEncoder):
+    name = 'pil'
+    extension = '.jpg'
+
+    def __init__(self, quality=80, optimize=True, progressive=True):
+        super(PILEncoder, self).__init__(quality)
+        self.optimize = optimize
+        self.progressive = progressive
+
+    def encode(self, image):
+        buffer = io.BytesIO()
+        _as_image(image).save(buffer, "JPEG", quality=self.quality, optimize=self.optimize, progressive=self.progressive)
+        return buffer.getvalue()
+
+
+class PILFastEncoder(PILEncoder):
+    name = 'pil_fast'
+
+    def __init__(self, quality=80):
+        super(PILFastEncoder, self).__init__(quality, optimize=False, progressive=False)
+
+
+class SimpleJPEGEncoder(ImageEncoder):
+    name = 'simplejpeg'
+    extension = '.jpg'
+
+    def encode(self, image):
+        import simplejpeg
+        return simplejpeg.encode_jpeg(_as_array(image), quality=self.quality, colorspace='RGB')
+
+
+class CV2Encoder(ImageEncoder):
+    name = 'cv2'
+    extension = '.jpg'
+
+    def encode(self, image):
+        import cv2
+        ok, data = cv2.imencode('.jpg', _as_array(image)[:, :, ::-1], [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise EncoderError("OpenCV could not encode the image")
+        return data.tobytes()
+
+
+class PNGEncoder(ImageEncoder):
+    name = 'png'
+    extension = '.png'
+
+    def encode(self, image):
+        buffer = io.BytesIO()
+        _as_image(image).save(buffer, "PNG", compress_level=1)
+        return buffer.getvalue()
+
+
+class RawEncoder(ImageEncoder):
+    name = 'raw'
+    extension = '.ppm'
+
+    def encode(self, image):
+        array = _as_array(image)
+        header = 'P6\n%d %d\n255\n' % (array.shape[1], array.shape[0])
+        return header.encode('ascii') + array.tobytes()
+
+
+# backend name -> (encoder factory, module it needs)
+encoders = {'pil': (PILEncoder, None),
+            'pil_fast': (PILFastEncoder, None),
+            'simplejpeg': (SimpleJPEGEncoder, 'simplejpeg'),
+            'cv2': (CV2Encoder, 'cv2'),
+            'png': (PNGEncoder, None),
+            'raw': (RawEncoder, None)}
+
+
+def available_encoders():
+    """
+    :return: names of the backends that can be used in this environment
+    """
+    return [name for name, (_, module) in sorted(encoders.items())
+            if module is None or importlib.util.find_spec(module) is not None]
+
+
+def get_encoder(encoder='pil', quality=80):
+    """
+    Returns an encoder instance
+    :param encoder: backend name (see the module docstring) or an
+        ImageEncoder instance, which is returned as is
+    :param quality: JPEG quality
+    :return: ImageEncoder instance
+    """
+    if isinstance(encoder, ImageEncoder):
+        return encoder
+    if encoder not in encoders:
+        raise EncoderError("Unknown encoder {}, use one of {}".format(encoder, sorted(encoders)))
+    if encoder not in available_encoders():
+        raise EncoderError("Encoder {} needs the {} module, which is not installed".format(encoder, encoders[encoder][1]))
+    return encoders[encoder][0](quality=quality)
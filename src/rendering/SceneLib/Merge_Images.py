@@ -12,10 +12,15 @@ that of the object pose.
 """
 import os
 import random
+import json
+import hashlib
+import multiprocessing
 from PIL import Image
 import time
 import numpy as np
 from resizeimage import resizeimage
+from .Encode_Images import get_encoder
+from ..RandomLib.random_streams import stream, stream_seed
 
 Image_height = 360
 Image_width = 360
@@ -30,7 +35,7 @@ class ImageError(Exception):
          return repr(self.value)
 
 
-def add_random_offset_foreground(foreground_image, pad_ratio=0.0):
+def add_random_offset_foreground(foreground_image, pad_ratio=0.0, rng=np.random):
     """
     Function that adds a translation to the object pose, before merging
     with the background. An occlusion is also introduced by allowing part
@@ -47,6 +52,8 @@ def add_random_offset_foreground(foreground_image, pad_ratio=0.0):
         foreground_image (PIL image): An object pose to be translated
         pad_ratio (float): Additional padding around the original image.
                         Introduced for the purpose of occlusion. See above.
+        rng: numpy Generator or RandomState the offset is drawn from,
+                        defaults to the global state
                         
     Returns:
         Translated Image (PIL image):
@@ -70,8 +77,9 @@ def add_random_offset_foreground(foreground_image, pad_ratio=0.0):
     h = y1 - y0
     dw_max = padded_size[1] - w
     dh_max = padded_size[0] - h
-    dw = np.random.randint(0, dw_max)
-    dh = np.random.randint(0, dh_max)
+    integers = rng.integers if hasattr(rng, 'integers') else rng.randint
+    dw = integers(0, dw_max)
+    dh = integers(0, dh_max)
 
     fg_arr_pad = np.zeros(shape=(padded_size[0], padded_size[1], 4), dtype=fg_arr.dtype)
     # compute the foreground bb's in the padded image
@@ -90,7 +98,7 @@ def add_random_offset_foreground(foreground_image, pad_ratio=0.0):
 
     return Image.fromarray(fg_arr_new), ((x0_new,x1_new),(y0_new,y1_new))
 
-def add_background(foreground_name, background_name, save_as, adjust_brightness = False, n_of_pixels = 300):
+def add_background(foreground_name, background_name, save_as, adjust_brightness = False, n_of_pixels = 300, encoder = 'pil', rng = np.random):
     """
     Function that give an RGBA and any image file merges them into one.
     It ensures that the final image is of the specified size. 
@@ -107,6 +115,10 @@ def add_background(foreground_name, background_name, save_as, adjust_brightness
         adjust_brigtness (boolean): Whether the brigthness of the background
             should be adjusted to match on average the brightness of the 
             foreground image. Default = False
+        encoder (string or ImageEncoder): Encoder the final image is
+            written with, see Encode_Images. Default = 'pil'
+        rng: numpy Generator or RandomState the offset of the foreground is
+            drawn from, defaults to the global state
             
     Return:
         bbox (integer tuple): (x0,x1),(y0,y1) the bounding box around the 
@@ -114,7 +126,7 @@ def add_background(foreground_name, background_name, save_as, adjust_brightness
     """
     try:
         foreground=Image.open(foreground_name)
-        foreground, bbox = add_random_offset_foreground(foreground, pad_ratio=0.1)
+        foreground, bbox = add_random_offset_foreground(foreground, pad_ratio=0.1, rng=rng)
     except:
         print("Invalid foreground images, skipping", foreground_name)
         raise ImageError(("Invalid foreground images, skipping", foreground_name))   
@@ -126,6 +138,22 @@ def add_background(foreground_name, background_name, save_as, adjust_brightness
         print("Invalid background image skipping", background_name)
         raise ImageError(("Invalid background image skipping", background_name))
     
+    background = fit_background(background, n_of_pixels)
+    return paste_foreground(foreground, background, save_as, bbox, adjust_brightness, n_of_pixels, encoder)
+
+
+def fit_background(background, n_of_pixels = 300):
+    """
+    Resize and crop a background to n_of_pixels*n_of_pixels.
+    Raises ImageError if the background is too small.
+
+    Args:
+        background (PIL image): the background image
+        n_of_pixels (int): size of the side of the final square image
+
+    Return:
+        background (PIL image): the background of the right size
+    """
     bc_size = background.size
     if(n_of_pixels > bc_size[0] or n_of_pixels > bc_size[1]):
         print("Background too small to be resized") 
@@ -134,7 +162,29 @@ def add_background(foreground_name, background_name, save_as, adjust_brightness
     elif(n_of_pixels < bc_size[0] or n_of_pixels < bc_size[1]):
         background = resizeimage.resize_cover(background, [n_of_pixels, n_of_pixels])
     #else means it has exactly the correct size, do nothing   
-    
+    return background
+
+
+def paste_foreground(foreground, background, save_as, bbox, adjust_brightness = False, n_of_pixels = 300, encoder = 'pil'):
+    """
+    Second half of add_background: adjusts the brightness of a background
+    of the right size, pastes the already translated foreground onto it
+    and saves the final image.
+
+    Args:
+        foreground (PIL image): translated RGBA object pose
+        background (PIL image): background of n_of_pixels*n_of_pixels
+        save_as (string): Complete path of the final image
+        bbox (integer tuple): bounding box of the translated foreground
+        adjust_brigtness (boolean): see add_background
+        n_of_pixels (int): size of the side of the final square image
+        encoder (string or ImageEncoder): see add_background
+
+    Return:
+        bbox (integer tuple): (x0,x1),(y0,y1) the bounding box around the
+                    foreground object .
+    """
+    bc_size = background.size
     fg_size = foreground.size
     
     if(n_of_pixels != fg_size[0] or n_of_pixels != fg_size[1]):
@@ -191,11 +241,11 @@ def add_background(foreground_name, background_name, save_as, adjust_brightness
         """        
 
     background.paste(foreground, (0, 0), foreground)
-    background.save(save_as, "JPEG", quality=80, optimize=True, progressive=True)
+    get_encoder(encoder).save(background, save_as)
     return bbox
 
 
-def merge_images(foreground, background):
+def merge_images(foreground, background, rng=np.random):
     """                          
     Merges two PIL images. 
     Arguments:
@@ -203,17 +253,467 @@ def merge_images(foreground, background):
                 image to have alpha channel so that the background is visible
         background (PIL image): Image to be used as background. 
                 Does not have to have alpha channel
+        rng: numpy Generator or RandomState the offset of the foreground
+                is drawn from, defaults to the global state
                 
     Return:
         background (PIL image): Final merged image
         bbox (integer tuple): (x0,x1),(y0,y1) the bounding box around the 
                     foreground object .
     """
-    foreground, bbox = add_random_offset_foreground(foreground, pad_ratio=0.1)
+    foreground, bbox = add_random_offset_foreground(foreground, pad_ratio=0.1, rng=rng)
     background.paste(foreground, (0, 0), foreground)
     return background, bbox
                
-def generate_for_all_objects(objects_folder, background_folder, final_folder, adjust_brightness = False, n_of_pixels = 300):
+def subject_bbox(alpha):
+    """
+    Bounding box of the non transparent pixels of an alpha channel, from
+    its row and collumn projections.
+
+    Arguments:
+        alpha (array): [H,W] alpha channel
+
+    Returns:
+        (x0, x1, y0, y1): inclusive bounds of the subject
+    """
+    rows = np.flatnonzero(alpha.any(axis=1))
+    cols = np.flatnonzero(alpha.any(axis=0))
+    if len(rows) == 0:
+        raise ImageError("The object pose is fully transparent")
+    return cols[0], cols[-1], rows[0], rows[-1]
+
+
+def brightness_factor(foreground, background):
+    """
+    Factor matching the mean brightness of a background to that of the
+    object pose, bounded to [0.5, 1.5], as computed by add_background.
+    Fully transparent black pixels of the pose do not count, so the pose
+    can be given cropped to its subject.
+
+    Arguments:
+        foreground (array): [h,w,4] RGBA object pose
+        background (array): [H,W,3] background
+
+    Returns:
+        factor (float)
+    """
+    frgdnumber = np.count_nonzero(foreground.any(axis=2))
+    frgdsum = foreground[:, :, :3].sum(dtype=np.int64)
+    bcgdnumber = background.shape[0]*background.shape[1]
+    bcgdsum = background.sum(dtype=np.float64)
+    factor = (frgdsum/frgdnumber)/(bcgdsum/bcgdnumber)
+    return min(max(factor, 0.5), 1.5)
+
+
+def composite(foreground, background, adjust_brightness = False, pad_ratio = 0.1, rng = np.random):
+    """
+    Array native version of add_random_offset_foreground followed by
+    pasting onto the background (see merge_images and add_background).
+    The subject is cut out with its alpha bounding box and blended straight
+    into its slice of the background with premultiplied alpha; the
+    brightness adjustment is a single pass over the background.
+    No intermediate PIL image or padded canvas is created.
+
+    The random offset is drawn exactly as in add_random_offset_foreground,
+    so for a given random state the subject lands at the same position and
+    the same bbox is returned. Pixel values can differ from the PIL path
+    by a rounding step.
+
+    Arguments:
+        foreground (array): [H,W,4] uint8 RGBA object pose
+        background (array): [H,W,3] uint8 background of the same size
+        adjust_brigtness (boolean): Whether the brigthness of the background
+            should be adjusted to match the foreground. Default = False
+        pad_ratio (float): Additional padding around the original image,
+            see add_random_offset_foreground
+        rng: numpy Generator or RandomState, defaults to the global state
+
+    Returns:
+        composite (array): [H,W,3] uint8 final image
+        bbox (integer tuple): (x0,x1),(y0,y1) the bounding box around the
+                    foreground object
+    """
+    H, W = foreground.shape[:2]
+    if background.shape[:2] != (H, W):
+        raise ImageError("Resolution of the object pose given does not match the background")
+    x0, x1, y0, y1 = subject_bbox(foreground[:, :, 3])
+    w = x1 - x0
+    h = y1 - y0
+
+    # determine range of motion
+    pad_c = int(np.round(pad_ratio*W))
+    pad_r = int(np.round(pad_ratio*H))
+    integers = rng.integers if hasattr(rng, 'integers') else rng.randint
+    dw = integers(0, W + 2*pad_c - w)
+    dh = integers(0, H + 2*pad_r - h)
+
+    # position of the subject in the final image, clipped to the frame
+    top = dh - pad_r
+    left = dw - pad_c
+    r0, r1 = max(top, 0), min(top + h + 1, H)
+    c0, c1 = max(left, 0), min(left + w + 1, W)
+
+    visible = r0 < r1 and c0 < c1
+    subject = foreground[y0 + r0 - top:y0 + r1 - top, x0 + c0 - left:x0 + c1 - left]
+
+    # background, with the brightness adjustment done in a single pass.
+    # As in add_background, only the visible part of the subject counts
+    if adjust_brightness and visible:
+        factor = np.float32(brightness_factor(subject, background))
+        out = np.rint(np.minimum(background*factor, 255)).astype(np.uint8)
+    else:
+        out = background.copy()
+
+    # only the slice under the subject is blended
+    if visible:
+        alpha = subject[:, :, 3:]*np.float32(1/255.)
+        region = out[r0:r1, c0:c1]*(1 - alpha)
+        region += subject[:, :, :3]*alpha
+        out[r0:r1, c0:c1] = np.rint(region)
+
+    bbox = ((int(min(max(0, left), W-1)), int(min(max(0, left + w + 1), W-1))),
+            (int(min(max(0, top), H-1)), int(min(max(0, top + h + 1), H-1))))
+    return out, bbox
+
+
+def subject_bboxes(alpha):
+    """
+    Vectorized subject_bbox over a stack of alpha channels.
+
+    Arguments:
+        alpha (array): [n,H,W] alpha channels
+
+    Returns:
+        bboxes (array): [n,4] int array of inclusive bounds x0, x1, y0, y1
+    """
+    rows = alpha.any(axis=2)
+    cols = alpha.any(axis=1)
+    if not rows.any(axis=1).all():
+        raise ImageError("An object pose is fully transparent")
+    H, W = alpha.shape[1:]
+    return np.stack([cols.argmax(axis=1), W - 1 - cols[:, ::-1].argmax(axis=1),
+                     rows.argmax(axis=1), H - 1 - rows[:, ::-1].argmax(axis=1)], axis=1)
+
+
+def random_offsets(bboxes, size, pad_ratio = 0.1, rng = np.random):
+    """
+    Random positions of the subjects in the final images, drawn as in
+    add_random_offset_foreground and composite, image after image, so the
+    same random state gives the same positions as compositing one by one.
+
+    Arguments:
+        bboxes (array): [n,4] subject bounds x0, x1, y0, y1 (subject_bboxes)
+        size (tuple): (H, W) of the images
+        pad_ratio (float): see add_random_offset_foreground
+        rng: numpy Generator or RandomState, defaults to the global state
+
+    Returns:
+        offsets (array): [n,2] int array, (top, left) of each subject
+    """
+    H, W = size
+    pad_c = int(np.round(pad_ratio*W))
+    pad_r = int(np.round(pad_ratio*H))
+    integers = rng.integers if hasattr(rng, 'integers') else rng.randint
+    offsets = np.empty((len(bboxes), 2), dtype=int)
+    for i, (x0, x1, y0, y1) in enumerate(bboxes):
+        dw = integers(0, W + 2*pad_c - (x1 - x0))
+        dh = integers(0, H + 2*pad_r - (y1 - y0))
+        offsets[i] = dh - pad_r, dw - pad_c
+    return offsets
+
+
+def composite_batch(foregrounds, backgrounds, offsets, factors = None, adjust_brightness = False):
+    """
+    Batched version of composite: merges a stack of object poses with a
+    stack of backgrounds. Every subject is moved so that the top left
+    corner of its bounding box is at its offset, parts moved outside of the
+    frame are cut off.
+
+    Bounding boxes and placements are computed over the whole stack at
+    once. The subjects are then blended into their slices of the
+    backgrounds one after the other: with a different offset per image,
+    slicing is much cheaper than gathering the moved subjects of the whole
+    stack. Given the offsets drawn by random_offsets, the result
+    is exactly that of calling composite on every image.
+
+    Arguments:
+        foregrounds (array): [n,H,W,4] uint8 RGBA object poses
+        backgrounds (array): [n,H,W,3] uint8 backgrounds
+        offsets (array): [n,2] (top, left) of the subjects in the final
+            images, e.g. from random_offsets
+        factors (array): [n] brightness factors of the backgrounds.
+            Default = None, computed as in add_background if
+            adjust_brightness, no adjustment otherwise
+        adjust_brightness (boolean): see factors
+
+    Returns:
+        composites (array): [n,H,W,3] uint8 final images
+        bboxes (array): [n,4] int bounding boxes x0, x1, y0, y1 of the
+            subjects in the final images
+    """
+    n, H, W = foregrounds.shape[:3]
+    if backgrounds.shape[:3] != (n, H, W):
+        raise ImageError("The object poses and backgrounds do not have the same shape")
+    x0, x1, y0, y1 = subject_bboxes(foregrounds[..., 3]).T
+    top, left = np.asarray(offsets, dtype=int).T
+
+    # visible part of every subject in the final image
+    r0, r1 = np.maximum(top, 0), np.minimum(top + y1 - y0 + 1, H)
+    c0, c1 = np.maximum(left, 0), np.minimum(left + x1 - x0 + 1, W)
+    visible = (r0 < r1) & (c0 < c1)
+    subjects = [foregrounds[i, y0[i] + r0[i] - top[i]:y0[i] + r1[i] - top[i],
+                               x0[i] + c0[i] - left[i]:x0[i] + c1[i] - left[i]] for i in range(n)]
+
+    if factors is None and adjust_brightness:
+        factors = np.ones(n)
+        for i in np.flatnonzero(visible):
+            factors[i] = brightness_factor(subjects[i], backgrounds[i])
+    composites = backgrounds.copy()
+    if factors is not None:
+        # image by image, each background stays in cache for the blend below
+        factors = np.asarray(factors, dtype=np.float32)
+        for i in range(n):
+            composites[i] = np.rint(np.minimum(backgrounds[i]*factors[i], 255))
+
+    for i in np.flatnonzero(visible):
+        alpha = subjects[i][:, :, 3:]*np.float32(1/255.)
+        region = composites[i, r0[i]:r1[i], c0[i]:c1[i]]*(1 - alpha)
+        region += subjects[i][:, :, :3]*alpha
+        composites[i, r0[i]:r1[i], c0[i]:c1[i]] = np.rint(region)
+
+    bboxes = np.stack([np.clip(left, 0, W-1), np.clip(left + x1 - x0 + 1, 0, W-1),
+                       np.clip(top, 0, H-1), np.clip(top + y1 - y0 + 1, 0, H-1)], axis=1)
+    return composites, bboxes
+
+
+def image_seed(seed, name):
+    """
+    Derive the seed of a single image from the seed of the run and the name
+    of the image. Every image gets its own random stream, independent of the
+    order or the process in which the images are merged, which keeps serial
+    and parallel runs reproducible.
+
+    Arguments:
+        seed (int): seed of the whole run
+        name (string): name identifying the image, e.g. its file name
+
+    Returns:
+        seed (int): 32 bit seed for this image, see
+            RandomLib.random_streams.stream_seed
+    """
+    return stream_seed(seed, name)
+
+
+def run_seed(seed=None):
+    """
+    Return seed if given, otherwise draw a new run seed from numpy
+    """
+    if seed is None:
+        return int(np.random.randint(0, 2**31 - 1))
+    return seed
+
+
+def map_images(function, tasks, workers=1):
+    """
+    Apply function to every task, in a process pool if workers > 1.
+    The results are returned in the order of tasks.
+    """
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(workers) as pool:
+            return pool.map(function, tasks, chunksize=max(1, len(tasks)//(4*workers)))
+    return [function(task) for task in tasks]
+
+
+def _add_background_task(task):
+    """
+    Process pool entry point of generate_for_all_objects.
+    The background is either a file name or a BackgroundIndex position.
+    Returns the bounding box and the copy of the encoder that wrote the
+    image, which holds its stats (and the image, when the encoder has a
+    sink), to be collected by the caller.
+    """
+    foreground_name, background, save_as, adjust_brightness, n_of_pixels, seed, background_index, encoder = task
+    rng = stream(seed)
+    encoder = get_encoder(encoder).fresh()
+    if background_index is None:
+        bbox = add_background(foreground_name, background, save_as, adjust_brightness, n_of_pixels, encoder, rng)
+    else:
+        bbox = add_indexed_background(foreground_name, background_index, background, save_as, adjust_brightness, n_of_pixels, encoder, rng)
+    return bbox, encoder
+
+
+def add_indexed_background(foreground_name, background_index, position, save_as, adjust_brightness = False, n_of_pixels = 300, encoder = 'pil', rng = np.random):
+    """
+    Same as add_background, with the background taken from a
+    BackgroundIndex instead of being opened, validated and resized.
+
+    Args:
+        foregroun_name (string): The name of the RGBA image
+        background_index (BackgroundIndex): index of the background database
+        position (int): position of the background in the index
+        save_as, adjust_brightness, n_of_pixels, encoder, rng: see add_background
+
+    Return:
+        bbox (integer tuple): (x0,x1),(y0,y1) the bounding box around the
+                    foreground object .
+    """
+    if background_index.n_of_pixels != n_of_pixels:
+        raise ImageError("Background index holds %dpx backgrounds, %dpx are needed" % (background_index.n_of_pixels, n_of_pixels))
+    try:
+        foreground=Image.open(foreground_name)
+        foreground, bbox = add_random_offset_foreground(foreground, pad_ratio=0.1, rng=rng)
+    except:
+        print("Invalid foreground images, skipping", foreground_name)
+        raise ImageError(("Invalid foreground images, skipping", foreground_name))
+    background = Image.fromarray(background_index.get(position), mode="RGB")
+    return paste_foreground(foreground, background, save_as, bbox, adjust_brightness, n_of_pixels, encoder)
+
+
+class BackgroundIndex:
+    """
+    Index of a background database for one resolution. Every background
+    is opened, validated and resized once, when the index is built, and
+    stored in a packed uint8 array of shape [K,n_of_pixels,n_of_pixels,3].
+    Invalid or too small images are rejected at that point instead of
+    raising ImageError in the middle of a run.
+
+    The array is saved as a .npy file in a cache folder and memory mapped,
+    together with a .json file listing the indexed and rejected images.
+    The cache is keyed by the database path, the names, sizes and
+    modification times of its files and the resolution, so it is rebuilt
+    whenever the database changes. An index pickles as its path, so pool
+    workers map the same file.
+
+    Args:
+        path (string): path of the .npy file of a built index
+    """
+    def __init__(self, path):
+        self.path = path
+        self._open()
+
+    def _open(self):
+        with open(os.path.splitext(self.path)[0] + '.json') as f:
+            info = json.load(f)
+        self.names = info['names']
+        self.rejected = info['rejected']
+        self.n_of_pixels = info['n_of_pixels']
+        self.backgrounds = np.load(self.path, mmap_mode='r')
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self._open()
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, position):
+        """
+        Returns the background at position as a [n,n,3] uint8 array
+        """
+        return np.array(self.backgrounds[position])
+
+    def choose(self, seed):
+        """
+        Position of a background chosen at random from the seed of an image
+        """
+        return random.Random(seed).randrange(len(self))
+
+    @staticmethod
+    def database_key(background_folder, n_of_pixels):
+        """
+        Hash identifying the content of a background database and resolution
+        """
+        h = hashlib.sha1()
+        h.update(os.path.abspath(background_folder).encode('utf-8'))
+        h.update(str(n_of_pixels).encode('utf-8'))
+        for name in sorted(os.listdir(background_folder)):
+            stat = os.stat(os.path.join(background_folder, name))
+            h.update(('%s:%d:%d;' % (name, stat.st_size, int(stat.st_mtime))).encode('utf-8'))
+        return h.hexdigest()[:16]
+
+    @classmethod
+    def build(cls, background_folder, path, n_of_pixels = 300):
+        """
+        Builds the index of every image in background_folder and saves it to
+        path (a .npy file, the .json file goes next to it)
+
+        Args:
+            background_folder (string): the background database
+            path (string): path of the .npy file
+            n_of_pixels (int): size of the side of the final square images
+
+        Return:
+            BackgroundIndex instance
+        """
+        names = []
+        rejected = []
+        candidates = [name for name in sorted(os.listdir(background_folder))
+                      if os.path.isfile(os.path.join(background_folder, name))]
+        tmp_path = path + '.tmp.npy'
+        packed = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                           shape=(max(len(candidates), 1), n_of_pixels, n_of_pixels, 3))
+        for name in candidates:
+            try:
+                with Image.open(os.path.join(background_folder, name)) as background:
+                    background = fit_background(background, n_of_pixels)
+                    packed[len(names)] = np.asarray(background.convert('RGB'))
+                names.append(name)
+            except ImageError:
+                rejected.append(name)
+            except Exception:
+                print("Invalid background image, not indexed", name)
+                rejected.append(name)
+        if not names:
+            del packed
+            os.remove(tmp_path)
+            raise ImageError("No usable background in " + background_folder)
+        packed.flush()
+        del packed
+        if len(names) < len(candidates):
+            # drop the slots of the rejected images
+            trimmed = np.load(tmp_path, mmap_mode='r')[:len(names)]
+            np.save(path, trimmed)
+            del trimmed
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+            json.dump({'database': os.path.abspath(background_folder), 'n_of_pixels': n_of_pixels,
+                       'names': names, 'rejected': rejected}, f, indent=1)
+        if rejected:
+            print("%d of %d backgrounds rejected while indexing %s" % (len(rejected), len(candidates), background_folder))
+        return cls(path)
+
+    @classmethod
+    def open_or_build(cls, background_folder, n_of_pixels = 300, cache_folder = None):
+        """
+        Opens the cached index of background_folder at this resolution,
+        building it if it is missing or the database has changed
+
+        Args:
+            background_folder (string): the background database
+            n_of_pixels (int): size of the side of the final square images
+            cache_folder (string): folder of the index files, created if
+                missing. Default = None, background_folder + '_index'
+
+        Return:
+            BackgroundIndex instance
+        """
+        if cache_folder is None:
+            cache_folder = os.path.normpath(background_folder) + '_index'
+        os.makedirs(cache_folder, exist_ok=True)
+        key = cls.database_key(background_folder, n_of_pixels)
+        name = '%s_%s_%dpx' % (os.path.basename(os.path.normpath(background_folder)), key, n_of_pixels)
+        path = os.path.join(cache_folder, name + '.npy')
+        if os.path.isfile(path) and os.path.isfile(os.path.join(cache_folder, name + '.json')):
+            return cls(path)
+        return cls.build(background_folder, path, n_of_pixels)
+
+
+def generate_for_all_objects(objects_folder, background_folder, final_folder, adjust_brightness = False, n_of_pixels = 300, workers = 1, seed = None, background_index = None, encoder = 'pil'):
     """
     This function takes every image in objects_folder, merge it
     with a random image from background_folder and saves it in final_folder.
@@ -224,6 +724,18 @@ def generate_for_all_objects(objects_folder, background_folder, final_folder, ad
         objects_folder (string): Folder containing the foreground RGBA images
         background_folder (string): Folder containg background images
         final_folder (string): Folder to which save the final images
+        workers (int): Number of processes merging images. Default = 1
+        seed (int): Seed of the run. The choice of background and the
+            offset of every image are derived from it and the image name,
+            so the result does not depend on workers. Default = None,
+            a seed is drawn from numpy's global random state
+        background_index (BackgroundIndex): If given, the backgrounds are
+            taken from this index of background_folder instead of being
+            opened and resized for every image. Default = None
+        encoder (string or ImageEncoder): Encoder the final images are
+            written with, see Encode_Images. The file extension follows
+            the encoder. If an ImageEncoder is given, the encoding stats
+            of all images are added to its stats. Default = 'pil'
         
     Return:
         all_bbox (Dictionary): Dictionary of bounding boxes (x0,x1),(y0,y1) 
@@ -232,18 +744,35 @@ def generate_for_all_objects(objects_folder, background_folder, final_folder, ad
         
     """
 
-    all_backgrounds = os.listdir(background_folder)
-    all_bbox = {}
-    for object_image in os.listdir(objects_folder):
-        one_object = random.choice(all_backgrounds)
+    if background_index is None:
+        all_backgrounds = sorted(os.listdir(background_folder))
+    seed = run_seed(seed)
+    encoder = get_encoder(encoder)
+    tasks = []
+    names = []
+    for object_image in sorted(os.listdir(objects_folder)):
+        if os.path.isdir(os.path.join(objects_folder, object_image)):
+            continue
         just_name = os.path.splitext(object_image)[0]
-        try:
-            bbox = add_background(objects_folder+"/"+object_image, background_folder+"/"+one_object, final_folder+"/"+just_name+".jpg", adjust_brightness, n_of_pixels)
-            all_bbox[just_name+".jpg"] = bbox
-        except Exception as e:
-            print("The following error occured during background addition:", e)
-            raise e
+        final_name = just_name + encoder.extension
+        one_seed = image_seed(seed, object_image)
+        if background_index is None:
+            one_object = random.Random(one_seed).choice(all_backgrounds)
+            tasks.append((objects_folder+"/"+object_image, background_folder+"/"+one_object, final_folder+"/"+final_name, adjust_brightness, n_of_pixels, one_seed, None, encoder))
+        else:
+            tasks.append((objects_folder+"/"+object_image, background_index.choose(one_seed), final_folder+"/"+final_name, adjust_brightness, n_of_pixels, one_seed, background_index, encoder))
+        names.append(final_name)
+
+    try:
+        results = map_images(_add_background_task, tasks, workers)
+    except Exception as e:
+        print("The following error occured during background addition:", e)
+        raise e
 
+    all_bbox = {}
+    for name, (bbox, worker_encoder) in zip(names, results):
+        all_bbox[name] = bbox
+        encoder.collect(worker_encoder)
     return all_bbox
             
         
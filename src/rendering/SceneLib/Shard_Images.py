@@ -0,0 +1,267 @@
+"""
+Sharded storage of the final images.
+
+Instead of one file per final image, zipped at the end of the run and
+unzipped again before training, the merge stage can write the encoded
+images straight into tar shards of a fixed number of images
+(WebDataset-style: a sample is a member <class>/<name>.<ext>), plus an
+index.json listing the classes, the shards and the position of every image
+in its shard.
+
+The shards are plain tar files, so any tar tool can list or extract them.
+The index gives random access without extracting anything:
+
+    reader = ShardReader(folder)
+    image = reader.image(i)       # PIL image of the i-th sample
+    label = reader.labels[i]      # index of its class in reader.classes
+
+ShardSequence feeds the shards to Keras model.fit_generator like
+flow_from_directory does for a folder of images. kerasmodels/retrain trains
+from it whenever its training folder holds shards (see find_shards).
+"""
+import io
+import json
+import math
+import os
+import tarfile
+
+import numpy as np
+from PIL import Image
+
+try:
+    from keras.utils import Sequence
+except ImportError:
+    # keras is only needed for training, not for writing shards
+    Sequence = object
+
+index_name = 'index.json'
+
+
+def find_shards(path):
+    """
+    :param path: folder written by ShardWriter, or a folder holding one in
+        its 'shards' subfolder, like the folder render_pipeline.full_run
+        returns with shard_size
+    :return: the folder of the shards, None if path holds no shards
+    """
+    for folder in [path, os.path.join(path, 'shards')]:
+        if os.path.isfile(os.path.join(folder, index_name)):
+            return folder
+    return None
+
+
+class ShardError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class ShardWriter(object):
+    """
+    Writes images into tar shards of at most max_images images each.
+    Shards are written under a temporary name and renamed once complete,
+    the index is written by close.
+    :param folder: folder the shards and the index are written to
+    :param root: folder the paths given to add are relative to, e.g. the
+        final images folder with one subfolder per class
+    :param max_images: number of images per shard
+    :param prefix: file name prefix of the shards
+    """
+    def __init__(self, folder, root, max_images=1000, prefix='shard'):
+        if max_images < 1:
+            raise ShardError("A shard must hold at least one image")
+        self.folder = folder
+        self.root = root
+        self.max_images = max_images
+        self.prefix = prefix
+        self.shards = []
+        self.records = []
+        self.tar = None
+        os.makedirs(folder, exist_ok=True)
+
+    def _open_shard(self):
+        name = '%s-%06d.tar' % (self.prefix, len(self.shards))
+        self.tar = tarfile.open(os.path.join(self.folder, name + '.tmp'), 'w', format=tarfile.PAX_FORMAT)
+        self.shards.append({'name': name, 'count': 0})
+
+    def _close_shard(self):
+        self.tar.close()
+        name = os.path.join(self.folder, self.shards[-1]['name'])
+        os.replace(name + '.tmp', name)
+        self.tar = None
+
+    def add(self, path, data):
+        """
+        Adds an encoded image to the current shard
+        :param path: path the image would have been saved to, the member
+            name is its path relative to root
+        :param data: encoded image, bytes
+        :return: None
+        """
+        name = os.path.relpath(path, self.root).replace(os.sep, '/')
+        if name.startswith('../'):
+            raise ShardError("{} is not inside {}".format(path, self.root))
+        if self.tar is None:
+            self._open_shard()
+
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        # the data starts right after the header(s) of the member
+        offset = self.tar.offset + len(info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors))
+        self.tar.addfile(info, io.BytesIO(data))
+        self.records.append([len(self.shards) - 1, name, offset, len(data)])
+
+        self.shards[-1]['count'] += 1
+        if self.shards[-1]['count'] == self.max_images:
+            self._close_shard()
+
+    def __len__(self):
+        return len(self.records)
+
+    def close(self):
+        """
+        Closes the last shard and writes the index
+        :return: path of the index
+        """
+        if self.tar is not None:
+            self._close_shard()
+        classes = sorted(set(name.split('/')[0] for _, name, _, _ in self.records if '/' in name))
+        path = os.path.join(self.folder, index_name)
+        with open(path, 'w') as f:
+            json.dump({'classes': classes, 'shards': self.shards, 'records': self.records}, f)
+        return path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardReader(object):
+    """
+    Random access to the images of a folder written by ShardWriter.
+    A reader pickles as its folder, so it can be sent to worker processes.
+    :param folder: folder of the shards and their index
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self._open()
+
+    def _open(self):
+        index = os.path.join(self.folder, index_name)
+        if not os.path.isfile(index):
+            raise ShardError("No shard index in {}".format(self.folder))
+        with open(index) as f:
+            index = json.load(f)
+        self.classes = index['classes']
+        self.shards = [shard['name'] for shard in index['shards']]
+        self.records = index['records']
+        class_ids = {name: i for i, name in enumerate(self.classes)}
+        self.labels = np.array([class_ids.get(name.split('/')[0], -1) if '/' in name else -1
+                                for _, name, _, _ in self.records], dtype=int)
+        self.files = {}
+
+    def __getstate__(self):
+        return {'folder': self.folder}
+
+    def __setstate__(self, state):
+        self.folder = state['folder']
+        self._open()
+
+    def __len__(self):
+        return len(self.records)
+
+    def name(self, i):
+        """
+        :return: member name of the i-th image, <class>/<file name>
+        """
+        return self.records[i][1]
+
+    def read(self, i):
+        """
+        :return: the encoded i-th image, bytes
+        """
+        shard, _, offset, size = self.records[i]
+        if shard not in self.files:
+            self.files[shard] = open(os.path.join(self.folder, self.shards[shard]), 'rb')
+        f = self.files[shard]
+        f.seek(offset)
+        return f.read(size)
+
+    def image(self, i):
+        """
+        :return: the i-th image, PIL image
+        """
+        image = Image.open(io.BytesIO(self.read(i)))
+        image.load()
+        return image
+
+    def __iter__(self):
+        """
+        Reads the shards sequentially, without using the index
+        :return: generator of (member name, bytes)
+        """
+        for shard in self.shards:
+            with tarfile.open(os.path.join(self.folder, shard), 'r|') as tar:
+                for member in tar:
+                    if member.isfile():
+                        yield member.name, tar.extractfile(member).read()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+class ShardSequence(Sequence):
+    """
+    keras.utils.Sequence of batches of (images, one-hot labels) read from
+    shards, like ImageDataGenerator.flow_from_directory with
+    class_mode='categorical' reads a folder with one subfolder per class.
+    :param folder: folder written by ShardWriter
+    :param batch_size: number of images per batch
+    :param target_size: (height, width) the images are resized to
+    :param shuffle: shuffle the images at the end of every epoch
+    :param preprocessing_function: function applied to every float32 image
+        array, e.g. keras.applications.inception_v3.preprocess_input
+    :param seed: seed of the shuffling
+    """
+    def __init__(self, folder, batch_size=32, target_size=(224, 224), shuffle=True, preprocessing_function=None, seed=None):
+        self.reader = ShardReader(folder)
+        self.batch_size = batch_size
+        self.target_size = tuple(target_size)
+        self.shuffle = shuffle
+        self.preprocessing_function = preprocessing_function
+        self.rng = np.random.RandomState(seed)
+        self.order = np.flatnonzero(self.reader.labels >= 0)
+        if shuffle:
+            self.rng.shuffle(self.order)
+
+    @property
+    def classes(self):
+        return self.reader.classes
+
+    def __len__(self):
+        return int(math.ceil(len(self.order) / float(self.batch_size)))
+
+    def __getitem__(self, batch):
+        indices = self.order[batch*self.batch_size:(batch+1)*self.batch_size]
+        x = np.zeros((len(indices),) + self.target_size + (3,), dtype=np.float32)
+        y = np.zeros((len(indices), len(self.reader.classes)), dtype=np.float32)
+        for row, i in enumerate(indices):
+            image = self.reader.image(i).convert('RGB')
+            if image.size != self.target_size[::-1]:
+                image = image.resize(self.target_size[::-1], Image.NEAREST)
+            image = np.asarray(image, dtype=np.float32)
+            if self.preprocessing_function is not None:
+                image = self.preprocessing_function(image)
+            x[row] = image
+            y[row, self.reader.labels[i]] = 1.
+        return x, y
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.rng.shuffle(self.order)
@@ -0,0 +1,83 @@
+import pathlib
+import sys
+import os
+import time
+import shutil
+import tempfile
+import zipfile
+import unittest
+
+# Ensure source directory is in python path
+src_dir = str(pathlib.Path(__file__).resolve().parents[2])
+if not src_dir in sys.path:
+    sys.path.append(src_dir)
+
+from ..model_cache import ModelCache, model_files
+
+
+class TestModelCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_folder = os.path.join(self.folder, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def model(self, name, files):
+        path = os.path.join(self.folder, name + '.model')
+        with zipfile.ZipFile(path, 'w') as model:
+            for file, content in files.items():
+                model.writestr(file, content)
+        return path
+
+    def test_model_files(self):
+        self.assertEqual(model_files(['Top.jpg', 'Bot.obj', 'Top.obj', 'Bot.jpg']),
+                         ['Bot.obj', 'Bot.jpg', 'Top.obj', 'Top.jpg'])
+        self.assertEqual(model_files(['a.jpg', 'a.obj']), ['a.obj', 'a.jpg'])
+        self.assertRaises(ValueError, model_files, ['a.obj', 'b.obj'])
+        self.assertRaises(ValueError, model_files, ['a.obj', 'a.jpg', 'b.obj'])
+        self.assertRaises(ValueError, model_files, ['Top.jpg', 'Bot.obj', 'Top.obj', 'a.jpg'])
+
+    def test_extract_once(self):
+        path = self.model('Liberte', {'Liberte.obj': 'v 0 0 0', 'Liberte.jpg': b'\xff\xd8'})
+        cache = ModelCache(self.cache_folder)
+        folder, files, model_hash = cache.extract(path)
+        self.assertEqual(files, ['Liberte.obj', 'Liberte.jpg'])
+        with open(os.path.join(folder, 'Liberte.obj')) as f:
+            self.assertEqual(f.read(), 'v 0 0 0')
+
+        # extracted files are reused, also by a new cache on the same folder
+        self.assertEqual(ModelCache(self.cache_folder).extract(path), (folder, files, model_hash))
+        self.assertEqual(cache.extract(path), (folder, files, model_hash))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'models': 1})
+
+        # a changed model is extracted again
+        path = self.model('Liberte', {'Liberte.obj': 'v 1 0 0', 'Liberte.jpg': b'\xff\xd8'})
+        other, _, other_hash = cache.extract(path)
+        self.assertNotEqual(other_hash, model_hash)
+        self.assertEqual(len(cache), 2)
+
+    def test_invalid_model(self):
+        path = self.model('Broken', {'a.obj': '', 'b.obj': ''})
+        cache = ModelCache(self.cache_folder)
+        self.assertRaises(ValueError, cache.extract, path)
+        self.assertEqual(os.listdir(self.cache_folder), [])
+
+    def test_evict_least_recently_used(self):
+        cache = ModelCache(self.cache_folder, max_models=2)
+        paths = [self.model(name, {name + '.obj': name, name + '.jpg': ''}) for name in ['a', 'b', 'c']]
+        a = cache.extract(paths[0])[0]
+        b = cache.extract(paths[1])[0]
+        # a used more recently than b
+        os.utime(b, (time.time() - 10, time.time() - 10))
+        cache.extract(paths[0])
+        c = cache.extract(paths[2])[0]
+        self.assertTrue(os.path.isdir(a))
+        self.assertFalse(os.path.isdir(b))
+        self.assertTrue(os.path.isdir(c))
+        self.assertEqual(len(cache), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
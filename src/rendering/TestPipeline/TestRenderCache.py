@@ -0,0 +1,91 @@
+import pathlib
+import sys
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+# Ensure source directory is in python path
+src_dir = str(pathlib.Path(__file__).resolve().parents[2])
+if not src_dir in sys.path:
+    sys.path.append(src_dir)
+
+from ..render_cache import RenderCache
+
+
+class TestRenderCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_folder = os.path.join(self.folder, 'cache')
+        self.sample = {'camera_radius': [6.1], 'lamp_energy': [5000.0, 4500.5], 'camera_loc': [[0.0, 0.6, 0.8]]}
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def render(self, name, size):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_key(self):
+        key = RenderCache.key('model', (300, 128), self.sample)
+        self.assertEqual(key, RenderCache.key('model', [300, 128], dict(reversed(list(self.sample.items())))))
+        self.assertNotEqual(key, RenderCache.key('other', (300, 128), self.sample))
+        self.assertNotEqual(key, RenderCache.key('model', (300, 64), self.sample))
+        changed = dict(self.sample, lamp_energy=[5000.0, 4500.500001])
+        self.assertNotEqual(key, RenderCache.key('model', (300, 128), changed))
+
+    def test_hit_miss(self):
+        cache = RenderCache(self.cache_folder)
+        key = RenderCache.key('model', (300, 128), self.sample)
+        dest = os.path.join(self.folder, 'render0.png')
+        self.assertFalse(cache.get(key, dest))
+        self.assertFalse(os.path.exists(dest))
+        src = self.render('src.png', 100)
+        cache.put(key, src)
+        self.assertTrue(cache.get(key, dest))
+        self.assertEqual(self.read(dest), self.read(src))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['insertions']), (1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+        # a second cache on the same folder, e.g. in another Blender process
+        other = RenderCache(self.cache_folder)
+        self.assertEqual(len(other), 1)
+        self.assertTrue(other.get(key, dest))
+        key2 = RenderCache.key('model2', (300, 128), self.sample)
+        other.put(key2, src)
+        self.assertTrue(cache.get(key2, dest))
+
+        cache.dump_stats(os.path.join(self.folder, 'render_cache.json'))
+        with open(os.path.join(self.folder, 'render_cache.json')) as f:
+            self.assertEqual(json.load(f)['hits'], 2)
+
+    def test_lru_eviction(self):
+        cache = RenderCache(self.cache_folder, max_bytes=250)
+        for key in ['a', 'b']:
+            cache.put(key, self.render(key, 100))
+        # using a makes b the least recently used
+        self.assertTrue(cache.get('a', os.path.join(self.folder, 'out.png')))
+        cache.put('c', self.render('c', 100))
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.bytes, 200)
+        self.assertEqual(sorted(os.listdir(self.cache_folder)), ['a.png', 'c.png'])
+
+        # the order survives reopening, and the bound is applied on opening
+        os.utime(cache.path('a'), (time.time() + 10, time.time() + 10))
+        reopened = RenderCache(self.cache_folder, max_bytes=150)
+        self.assertEqual(list(reopened.entries), ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import pathlib
+import sys
+import os
+import io
+import time
+import shutil
+import tempfile
+import unittest
+
+# Ensure source directory is in python path
+src_dir = str(pathlib.Path(__file__).resolve().parents[2])
+if not src_dir in sys.path:
+    sys.path.append(src_dir)
+
+from ..render_log import RenderLog, read_records, DEBUG, INFO, WARNING
+
+
+class TestRenderLog(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'blender_render.log')
+        self.stream = io.StringIO()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_levels(self):
+        log = RenderLog(self.path, level=INFO, stream=self.stream, buffer_lines=3)
+        log.debug('debug')
+        log.info('info')
+        log.log(WARNING, 'warning')
+        # buffered until buffer_lines messages are kept
+        self.assertEqual('', self.stream.getvalue())
+        log.info('info 2')
+        self.assertEqual('info\nwarning\ninfo 2\n', self.stream.getvalue())
+        log.info('info 3')
+        log.error('error')
+        self.assertEqual('info\nwarning\ninfo 2\ninfo 3\nerror\n', self.stream.getvalue())
+
+        log = RenderLog(self.path, level=DEBUG, stream=self.stream)
+        log.debug('debug')
+        log.close()
+        self.assertTrue(self.stream.getvalue().endswith('debug\n'))
+
+    def test_async_flush(self):
+        log = RenderLog(self.path, stream=self.stream, async_flush=True, flush_interval=0.01)
+        log.info('info')
+        deadline = time.time() + 5
+        while not self.stream.getvalue() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual('info\n', self.stream.getvalue())
+        log.close()
+        self.assertIsNone(log.flusher)
+
+    def test_redirect(self):
+        """
+        Output written to fd 1 goes to the log file, only the outermost
+        redirection replaces fd 1, and fd 1 is restored afterwards
+        """
+        before = os.fstat(1)
+        log = RenderLog(self.path, stream=self.stream)
+        with log:
+            inside = os.fstat(1)
+            os.write(1, b'session\n')
+            with log.redirect():
+                self.assertEqual(inside.st_ino, os.fstat(1).st_ino)
+                os.write(1, b'nested\n')
+            self.assertEqual(inside.st_ino, os.fstat(1).st_ino)
+        self.assertEqual((before.st_dev, before.st_ino), (os.fstat(1).st_dev, os.fstat(1).st_ino))
+        with log.redirect():
+            os.write(1, b'again\n')
+        with open(self.path) as f:
+            self.assertEqual('session\nnested\nagain\n', f.read())
+        self.assertRaises(RuntimeError, log.end_redirect)
+
+    def test_records(self):
+        log = RenderLog(self.path, stream=self.stream)
+        log.record(render=0, seconds=1.5, cached=False)
+        log.clear_records()
+        log.record(render=1, seconds=2.0, cached=False)
+        log.record(render=2, seconds=0.1, cached=True)
+        path = os.path.join(self.folder, 'render_log.jsonl')
+        log.dump_records(path)
+        self.assertEqual([], log.pending_records)
+        records = read_records(path)
+        self.assertEqual([1, 2], [r['render'] for r in records])
+        self.assertEqual([2.0, 0.1], [r['seconds'] for r in records])
+        self.assertIn('time', records[0])
+        self.assertEqual([], read_records(os.path.join(self.folder, 'missing.jsonl')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -98,6 +98,146 @@ class TestPipeline(unittest.TestCase):
         self.assertTrue( 'render0.png' in os.listdir(os.path.join(obj_poses, 'Liberte')) )
         self.assertTrue('render0.png' in os.listdir(os.path.join(obj_poses, 'Coconut')))
 
+    def test_shard_products(self):
+        shards = shard_products(['c', 'a', 'b'], 10, 2)
+        self.assertEqual([s['products'] for s in shards], [['a', 'c'], ['b']])
+        self.assertTrue(all(s['offset'] == 0 and s['count'] == 10 for s in shards))
+        # never more workers than products
+        self.assertEqual(len(shard_products(['a'], 10, 4)), 1)
+        self.assertRaises(RenderPipelineError, shard_products, ['a'], 10, 0)
+
+    def test_shard_products_split_renders(self):
+        shards = shard_products(['a', 'b'], 10, 3, split_renders=True)
+        self.assertEqual([(s['offset'], s['count']) for s in shards], [(0, 4), (4, 3), (7, 3)])
+        self.assertTrue(all(s['products'] == ['a', 'b'] for s in shards))
+
+    def test_merge_worker_outputs(self):
+        """
+        Two workers rendered different parts of the same product, their renders
+        should end up in one product folder with the sampled variables concatenated.
+        The first worker dumped its variables as json, as older runs did
+        """
+        worker_folders = []
+        for i, (offset, values) in enumerate([(0, [1.0, 2.0]), (2, [3.0])]):
+            worker_stats = os.path.join('dummy_dir', 'worker{}'.format(i), 'Liberte', 'stats')
+            os.makedirs(worker_stats)
+            for j in range(len(values)):
+                open(os.path.join('dummy_dir', 'worker{}'.format(i), 'Liberte', 'render%d.png' % (offset + j)), 'w').close()
+            if i == 0:
+                with open(os.path.join(worker_stats, 'randomvars_dump.json'), 'w') as f:
+                    json.dump({'camera_radius': values, 'camera_loc': [[0.0, 0.0, 1.0]] * len(values)}, f)
+            else:
+                save_logs(os.path.join(worker_stats, 'randomvars_dump.npz'),
+                          {'camera_radius': np.array(values), 'camera_loc': np.array([[0.0, 1.0, 0.0]] * len(values))})
+            with open(os.path.join(worker_stats, 'randomparams_dump.json'), 'w') as f:
+                json.dump({'camera_radius': {'dist': 'TruncNormDist'}}, f)
+            with open(os.path.join(worker_stats, 'render_log.jsonl'), 'w') as f:
+                for j in range(len(values)):
+                    record = {'render': offset + j, 'seconds': values[j], 'cached': i == 1}
+                    if i == 1:
+                        record.update(samples=16, quality='draft')
+                    f.write(json.dumps(record) + '\n')
+            worker_folders.append(os.path.join('dummy_dir', 'worker{}'.format(i)))
+
+        output_folder = os.path.join('dummy_dir', 'object_poses')
+        os.mkdir(output_folder)
+        merge_worker_outputs(worker_folders, output_folder)
+
+        product_folder = os.path.join(output_folder, 'Liberte')
+        self.assertEqual(sorted(os.listdir(product_folder)), ['render0.png', 'render1.png', 'render2.png', 'stats'])
+        logs = load_logs(os.path.join(product_folder, 'stats', 'randomvars_dump.npz'))
+        self.assertEqual(sorted(logs), ['camera_loc', 'camera_radius'])
+        self.assertEqual(logs['camera_radius'].tolist(), [1.0, 2.0, 3.0])
+        self.assertEqual(logs['camera_loc'].tolist(), [[0.0, 0.0, 1.0], [0.0, 0.0, 1.0], [0.0, 1.0, 0.0]])
+        with open(os.path.join(product_folder, 'stats', 'randomparams_dump.json')) as f:
+            self.assertEqual(json.load(f), {'camera_radius': {'dist': 'TruncNormDist'}})
+        times = dump_render_times(os.path.join(product_folder, 'stats'))
+        self.assertEqual((3, 1, 6.0, 2.0, 3.0),
+                         (times['renders'], times['cached'], times['seconds'], times['mean_seconds'], times['max_seconds']))
+        self.assertAlmostEqual(times['images_per_minute'], 30.0)
+        self.assertEqual((times['mean_samples'], times['quality']), (16, ['draft']))
+        self.assertIsNone(dump_render_times('dummy_dir'))
+
+    def test_render_cache_options(self):
+        args = blender_command('src', 'blender', 'objects', 'out', 3, {}, render_offset=2, render_seed=7,
+                               render_cache='cache', render_cache_size=64)
+        self.assertEqual(args[-8:], ['--render_offset', '2', '--seed', '7', '--render_cache', os.path.abspath('cache'),
+                                     '--render_cache_size', '64'])
+        self.assertNotIn('--seed', blender_command('src', 'blender', 'objects', 'out', 3, {}))
+        args = blender_command('src', 'blender', 'objects', 'out', 3, {}, render_schedule='schedules')
+        self.assertEqual(args[-2:], ['--schedule', os.path.abspath('schedules')])
+        args = blender_command('src', 'blender', 'objects', 'out', 3, {}, model_cache='models')
+        self.assertEqual(args[-2:], ['--model_cache', os.path.abspath('models')])
+        args = blender_command('src', 'blender', 'objects', 'out', 3, {}, scene_template=True)
+        self.assertEqual(args[-1], '--scene_template')
+        self.assertNotIn('--scene_template', blender_command('src', 'blender', 'objects', 'out', 3, {}))
+        args = blender_command('src', 'blender', 'objects', 'out', 3, {}, batch_views=4)
+        self.assertEqual(args[-2:], ['--batch_views', '4'])
+        self.assertNotIn('--batch_views', blender_command('src', 'blender', 'objects', 'out', 3, {}, batch_views=1))
+        args = blender_command('src', 'blender', 'objects', 'out', 3, {}, render_quality='draft')
+        self.assertEqual(args[-2:], ['--quality', 'draft'])
+        self.assertEqual(product_seed(7, 'Liberte'), product_seed(7, 'Liberte'))
+        self.assertNotEqual(product_seed(7, 'Liberte'), product_seed(7, 'Coconut'))
+        self.assertIsNone(product_seed(None, 'Liberte'))
+
+        stats = {'hits': 1, 'misses': 3, 'insertions': 3, 'evictions': 0, 'hit_rate': 0.25, 'entries': 3}
+        total = merge_cache_stats(merge_cache_stats(None, stats), dict(stats, hits=3, misses=1, entries=7))
+        self.assertEqual((total['hits'], total['misses'], total['hit_rate'], total['entries']), (4, 4, 0.5, 7))
+
+    def test_dump_coverage(self):
+        stats = os.path.join('dummy_dir', 'stats')
+        os.mkdir(stats)
+        self.assertIsNone(dump_coverage(stats))
+        rng = np.random.default_rng(0)
+        camera = scene_distributions()['camera_loc'].sample_qmc(64, 'sobol', rng)
+        save_logs(os.path.join(stats, 'randomvars_dump.npz'), {'camera_loc': camera, 'camera_radius': np.ones(64)})
+        coverage = dump_coverage(stats, {})
+        self.assertEqual(['camera_loc'], sorted(coverage))
+        self.assertEqual(64, coverage['camera_loc']['views'])
+        self.assertGreater(coverage['camera_loc']['coverage'], 0.5)
+        with open(os.path.join(stats, 'coverage.json')) as f:
+            self.assertEqual(coverage, json.load(f))
+
+    def test_completed_renders(self):
+        for i in [0, 1, 10]:
+            open(os.path.join('dummy_dir', 'render%d.png' % i), 'w').close()
+        open(os.path.join('dummy_dir', 'blender_render.log'), 'w').close()
+        # the last render may still be written by Blender
+        self.assertEqual(completed_renders('dummy_dir'), ['render0.png', 'render1.png'])
+        self.assertEqual(completed_renders('dummy_dir', rendering_done=True), ['render0.png', 'render1.png', 'render10.png'])
+        os.mkdir(os.path.join('dummy_dir', 'stats'))
+        self.assertEqual(completed_renders('dummy_dir'), ['render0.png', 'render1.png', 'render10.png'])
+
+    def test_stream_merge_poses(self):
+        """
+        Poses appear one by one while a fake render is running, all of them
+        should be merged with the database background by the time it returns
+        """
+        poses = os.path.join(project_dir, 'test_data', 'merging_tests', 'batch_test', 'object_poses')
+        background_database = os.path.join(project_dir, 'test_data', 'rendering_tests', 'pipeline_tests',
+                                           'render_workspace', 'bg_database', 'white')
+        obj_poses = os.path.join('dummy_dir', 'object_poses')
+        final_im = os.path.join('dummy_dir', 'images')
+        os.mkdir(obj_poses)
+        os.mkdir(final_im)
+
+        def render():
+            product_folder = os.path.join(obj_poses, 'Liberte')
+            os.mkdir(product_folder)
+            for i in range(1, 5):
+                shutil.copy(os.path.join(poses, 'render%d.png' % i), product_folder)
+                time.sleep(0.05)
+
+        all_bbox = stream_merge_poses(render, obj_poses, final_im, False, background_database, workers=2, poll_interval=0.02)
+        expected = ['render1.jpg', 'render2.jpg', 'render3.jpg', 'render4.jpg']
+        self.assertEqual(sorted(all_bbox['Liberte'].keys()), expected)
+        self.assertEqual(sorted(os.listdir(os.path.join(final_im, 'Liberte'))), expected)
+
+    def test_stream_merge_poses_render_error(self):
+        def render():
+            raise RenderPipelineError("Blender crashed")
+        self.assertRaises(RenderPipelineError, stream_merge_poses, render, 'dummy_dir', 'dummy_dir', True, poll_interval=0.01)
+
     def test_gen_merge(self):
         # Create an image
         foreground_path = os.path.join(project_dir, 'test_data', 'merging_tests', 'single_test', 'render1.png')
@@ -109,6 +249,122 @@ class TestPipeline(unittest.TestCase):
         self.assertEqual(os.listdir('dummy_dir'), ['output.jpg'])
 
 
+    def test_random_bg_with_background_bank(self):
+        # backgrounds are drawn from the bank, with the same seed the
+        # serial and the parallel merge give the same images
+        obj_poses_folder = os.path.join(project_dir, 'test_data', 'merging_tests', 'batch_test', 'object_poses')
+        bank = BackgroundBank.create(os.path.join('dummy_dir', 'bank.npy'), 4, 300, seed=0)
+        for folder in ['serial', 'parallel']:
+            os.mkdir(os.path.join('dummy_dir', folder))
+        serial = random_bg_for_all_objects(obj_poses_folder, os.path.join('dummy_dir', 'serial'), True, 300, 1, 7, bank)
+        parallel = random_bg_for_all_objects(obj_poses_folder, os.path.join('dummy_dir', 'parallel'), True, 300, 2, 7, bank)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(len(os.listdir(obj_poses_folder)), len(serial))
+        for name in serial:
+            with open(os.path.join('dummy_dir', 'serial', name), 'rb') as f1, open(os.path.join('dummy_dir', 'parallel', name), 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+        foreground = Image.open(os.path.join(obj_poses_folder, sorted(os.listdir(obj_poses_folder))[0]))
+        self.assertRaises(RenderPipelineError, gen_merge, foreground, os.path.join('dummy_dir', 'out.jpg'), 200, False, bank)
+
+    def test_merge_all_products_batched(self):
+        # the batched compositor merges every pose of every product,
+        # reproducibly for a given seed, with generated and database backgrounds
+        poses = os.path.join(project_dir, 'test_data', 'merging_tests', 'batch_test', 'object_poses')
+        background_database = os.path.join(project_dir, 'test_data', 'merging_tests', 'batch_test', 'backgrounds')
+        obj_poses = os.path.join('dummy_dir', 'object_poses')
+        shutil.copytree(poses, os.path.join(obj_poses, 'Liberte'))
+        results = []
+        for run, generate_background in enumerate([True, True, False]):
+            final_im = os.path.join('dummy_dir', 'images%d' % run)
+            os.mkdir(final_im)
+            results.append(merge_all_products(obj_poses, final_im, generate_background, background_database,
+                                              True, 300, seed=5, batch_size=3))
+            self.assertEqual(sorted(os.listdir(os.path.join(final_im, 'Liberte'))), sorted(results[-1]['Liberte']))
+        self.assertEqual(len(os.listdir(poses)), len(results[0]['Liberte']))
+        self.assertEqual(results[0], results[1])
+        for name in results[0]['Liberte']:
+            with open(os.path.join('dummy_dir', 'images0', 'Liberte', name), 'rb') as f1, open(os.path.join('dummy_dir', 'images1', 'Liberte', name), 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+            with Image.open(os.path.join('dummy_dir', 'images2', 'Liberte', name)) as im:
+                self.assertEqual((300, 300), im.size)
+
+    def test_resume_offset(self):
+        for i in [0, 1, 2, 4, 5]:
+            open(os.path.join('dummy_dir', 'render%d.png' % i), 'w').close()
+        # render3 is missing and render5 may be half written, everything from render3 on is rendered again
+        self.assertEqual(resume_offset('dummy_dir'), 3)
+        self.assertEqual(sorted(os.listdir('dummy_dir')), ['render0.png', 'render1.png', 'render2.png'])
+
+        # batches of views resume at the start of a batch, without the frames of the interrupted one
+        os.mkdir(os.path.join('dummy_dir', 'views'))
+        open(os.path.join('dummy_dir', 'views', 'view_0001.png'), 'w').close()
+        self.assertEqual(resume_offset('dummy_dir', batch_views=2), 2)
+        self.assertEqual(sorted(os.listdir('dummy_dir')), ['render0.png', 'render1.png'])
+
+    def test_run_manifest(self):
+        path = os.path.join('dummy_dir', 'run_manifest.json')
+        manifest = RunManifest(path)
+        self.assertTrue(manifest.start_render('r1'))
+        self.assertTrue(manifest.start_merge('m1'))
+        manifest.begin_render('Liberte', 'h1')
+        self.assertFalse(manifest.rendered('Liberte', 'h1'))
+        manifest.finish_render('Liberte')
+        manifest.finish_merge('Liberte', {'render0.jpg': ((1, 2), (3, 4))})
+
+        manifest = RunManifest(path)
+        self.assertFalse(manifest.start_render('r1'))
+        self.assertFalse(manifest.start_merge('m1'))
+        self.assertTrue(manifest.rendered('Liberte', 'h1'))
+        self.assertFalse(manifest.rendered('Liberte', 'h2'))
+        self.assertTrue(manifest.merged('Liberte'))
+        # rendering a product again invalidates its merged images
+        manifest.begin_render('Liberte', 'h2')
+        self.assertFalse(manifest.merged('Liberte'))
+        self.assertEqual(manifest.render_inputs('Liberte'), 'h2')
+        # new render parameters invalidate everything
+        self.assertTrue(manifest.start_render('r2'))
+        self.assertIsNone(manifest.render_inputs('Liberte'))
+
+        self.assertEqual(hash_params({'a': 1, 'b': [2]}), hash_params({'b': [2], 'a': 1}))
+        model = os.path.join('dummy_dir', 'model')
+        os.mkdir(model)
+        with open(os.path.join(model, 'a.obj'), 'w') as f:
+            f.write('v 0 0 0')
+        before = hash_folder(model)
+        with open(os.path.join(model, 'a.obj'), 'w') as f:
+            f.write('v 0 0 1')
+        self.assertNotEqual(before, hash_folder(model))
+
+    def test_merge_all_products_resume(self):
+        # products recorded in the manifest are skipped, the others are
+        # merged exactly as in an uninterrupted run
+        poses = os.path.join(project_dir, 'test_data', 'merging_tests', 'batch_test', 'object_poses')
+        obj_poses = os.path.join('dummy_dir', 'object_poses')
+        for product in ['Coconut', 'Liberte']:
+            shutil.copytree(poses, os.path.join(obj_poses, product))
+        final_im = os.path.join('dummy_dir', 'images')
+        os.mkdir(final_im)
+        manifest = RunManifest(os.path.join('dummy_dir', 'run_manifest.json'))
+        manifest.start_merge('m1')
+        full = merge_all_products(obj_poses, final_im, True, seed=3, manifest=manifest)
+        self.assertTrue(manifest.merged('Coconut') and manifest.merged('Liberte'))
+
+        # interrupted while merging Coconut
+        manifest.data['merge']['products'].pop('Coconut')
+        manifest.save()
+        os.remove(os.path.join(final_im, 'Coconut', sorted(full['Coconut'])[0]))
+        open(os.path.join(final_im, 'Liberte', 'marker'), 'w').close()
+        with open(os.path.join(final_im, 'Coconut', sorted(full['Coconut'])[1]), 'rb') as f:
+            merged = f.read()
+
+        resumed = merge_all_products(obj_poses, final_im, True, seed=3, manifest=RunManifest(manifest.path))
+        self.assertEqual(json.loads(json.dumps(resumed, default=int)), json.loads(json.dumps(full, default=int)))
+        self.assertIn('marker', os.listdir(os.path.join(final_im, 'Liberte')))
+        self.assertEqual(sorted(os.listdir(os.path.join(final_im, 'Coconut'))), sorted(full['Coconut']))
+        with open(os.path.join(final_im, 'Coconut', sorted(full['Coconut'])[1]), 'rb') as f:
+            self.assertEqual(f.read(), merged)
+
     def test_full_run(self):
         # Prepare the workspace to run the tests
         workspace = os.path.join(project_dir, 'test_data', 'rendering_tests', 'pipeline_tests', 'render_workspace')
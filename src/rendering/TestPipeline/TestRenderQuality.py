@@ -0,0 +1,37 @@
+import pathlib
+import sys
+import unittest
+
+# Ensure source directory is in python path
+src_dir = str(pathlib.Path(__file__).resolve().parents[2])
+if not src_dir in sys.path:
+    sys.path.append(src_dir)
+
+from ..render_quality import QUALITY_PRESETS, DEFAULT_QUALITY, quality_settings
+
+
+class TestRenderQuality(unittest.TestCase):
+
+    def test_presets(self):
+        keys = set(QUALITY_PRESETS[DEFAULT_QUALITY])
+        for quality, preset in QUALITY_PRESETS.items():
+            self.assertEqual(set(preset), keys)
+        self.assertLess(QUALITY_PRESETS['draft']['samples'], QUALITY_PRESETS['train']['samples'])
+        self.assertLess(QUALITY_PRESETS['train']['samples'], QUALITY_PRESETS['eval']['samples'])
+
+    def test_quality_settings(self):
+        # without a preset, the settings renders always had
+        settings = quality_settings(samples=64)
+        self.assertEqual(settings, {'samples': 64, 'tile_size': 512, 'max_bounces': 1, 'adaptive_threshold': None,
+                                    'denoise': False, 'quality': None})
+        # a preset ignores samples and is not changed by the returned settings
+        settings = quality_settings('draft', samples=64)
+        self.assertEqual(settings['samples'], QUALITY_PRESETS['draft']['samples'])
+        self.assertEqual(settings['quality'], 'draft')
+        settings['samples'] = 1
+        self.assertEqual(quality_settings('draft')['samples'], QUALITY_PRESETS['draft']['samples'])
+        self.assertRaises(ValueError, quality_settings, 'best')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import pathlib
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+# Ensure source directory is in python path
+src_dir = str(pathlib.Path(__file__).resolve().parents[2])
+if not src_dir in sys.path:
+    sys.path.append(src_dir)
+
+from ..render_schedule import RenderSchedule, scene_distributions, schedule_columns, schedule_name, write_schedules
+
+
+class TestRenderSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.attributes = {"attribute_distribution_params": [["num_lamps", "mid", 3], ["lamp_energy", "mu", 500.0]],
+                           "attribute_distribution": []}
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_scene_distributions(self):
+        distributions = scene_distributions(self.attributes)
+        self.assertEqual(distributions['num_lamps'].mid, 3)
+        self.assertEqual(distributions['lamp_energy'].mu, 500.0)
+        with self.assertRaises(KeyError):
+            scene_distributions({"attribute_distribution_params": [["not_an_attribute", "mu", 1]]})
+
+    def test_sample(self):
+        schedule = RenderSchedule.sample(50, self.attributes, np.random.default_rng(0))
+        self.assertEqual(len(schedule), 50)
+        self.assertEqual(schedule.columns, schedule_columns(schedule.max_lamps))
+        self.assertEqual(schedule.params.shape, (50, len(schedule.columns)))
+
+        num_lamps = schedule.params[:, 0].astype(int)
+        lamps = schedule.params[:, 7:].reshape(50, schedule.max_lamps, 6)
+        for n, row in zip(num_lamps, lamps):
+            self.assertFalse(np.isnan(row[:n]).any())
+            self.assertTrue(np.isnan(row[n:]).all())
+
+    def test_sample_low_discrepancy(self):
+        """
+        Low-discrepancy schedules have the same layout as i.i.d. ones, and
+        stratified lamp counts
+        """
+        for sampling in ['sobol', 'halton', 'stratified']:
+            schedule = RenderSchedule.sample(30, None, np.random.default_rng(0), sampling)
+            self.assertEqual(schedule.columns, schedule_columns(schedule.max_lamps))
+            self.assertEqual(schedule.params.shape, (30, len(schedule.columns)))
+            self.assertEqual([0, 10, 10, 10], np.bincount(schedule.params[:, 0].astype(int)).tolist())
+            self.assertEqual(len(schedule.scene(29)['lamps']), schedule.scene(29)['num_lamps'])
+        with self.assertRaises(ValueError):
+            RenderSchedule.sample(30, None, sampling='random')
+
+    def test_scene(self):
+        schedule = RenderSchedule.sample(10, self.attributes, np.random.default_rng(0))
+        for i in range(len(schedule)):
+            scene = schedule.scene(i)
+            self.assertEqual(len(scene['lamps']), scene['num_lamps'])
+            self.assertEqual(len(scene['camera_loc']), 3)
+            for lamp in scene['lamps']:
+                self.assertEqual(sorted(lamp), ['distance', 'energy', 'loc', 'size'])
+        with self.assertRaises(IndexError):
+            schedule.scene(10)
+
+    def test_save_load(self):
+        schedule = RenderSchedule.sample(5, self.attributes, np.random.default_rng(0))
+        path = os.path.join(self.folder, 'schedule.npz')
+        schedule.save(path)
+        loaded = RenderSchedule.load(path)
+        np.testing.assert_array_equal(loaded.params, schedule.params)
+        self.assertEqual(loaded.columns, schedule.columns)
+        self.assertEqual(loaded.blender_attributes, self.attributes)
+        self.assertEqual(loaded.scene(4), schedule.scene(4))
+
+    def test_write_schedules(self):
+        objects = os.path.join(self.folder, 'objects')
+        for product in ['Liberte', 'Coconut']:
+            os.makedirs(os.path.join(objects, product))
+        first = os.path.join(self.folder, 'first')
+        second = os.path.join(self.folder, 'second')
+        self.assertEqual(write_schedules(objects, first, 4, self.attributes, seed=7), ['Coconut', 'Liberte'])
+        self.assertEqual(write_schedules(objects, second, 4, self.attributes, seed=7, products=['Liberte']), ['Liberte'])
+
+        liberte = RenderSchedule.load(os.path.join(first, schedule_name('Liberte')))
+        coconut = RenderSchedule.load(os.path.join(first, schedule_name('Coconut')))
+        np.testing.assert_array_equal(liberte.params, RenderSchedule.load(os.path.join(second, schedule_name('Liberte'))).params)
+        self.assertFalse(np.array_equal(np.nan_to_num(liberte.params), np.nan_to_num(coconut.params)))
+        # existing schedules, e.g. of an interrupted run, are kept
+        self.assertEqual(write_schedules(objects, first, 4, self.attributes, seed=8), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import pathlib
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+import threading
+from multiprocessing.connection import Listener
+
+# Ensure source directory is in python path
+src_dir = str(pathlib.Path(__file__).resolve().parents[2])
+if not src_dir in sys.path:
+    sys.path.append(src_dir)
+
+from ..render_server import RenderServer, RenderServerClient, RenderServerError, write_port, wait_for_port
+from ..render_cache import RenderCache
+from ..model_cache import ModelCache
+
+
+class StubRenderInterface(object):
+    """
+    Stands in for RenderInterface, so the server can be tested without Blender.
+    Records every call instead of rendering.
+    """
+    def __init__(self):
+        self.calls = []
+        self.num_images = 0
+        self.render_cache = None
+        # render cache set when each model was loaded, which hashes the model
+        self.load_caches = []
+
+    def set_render(self, resolution, samples, quality=None):
+        self.calls.append(('set_render', resolution, samples))
+
+    def reset_distributions(self):
+        self.calls.append(('reset_distributions',))
+
+    def load_from_model(self, model_path, output_file):
+        if not model_path.endswith('.model'):
+            raise ValueError('file extension not wrong!')
+        self.calls.append(('load_from_model', model_path, output_file))
+        self.load_caches.append(self.render_cache)
+
+    def set_blender_attributes(self, blender_attributes):
+        self.calls.append(('set_blender_attributes', blender_attributes))
+
+    def render_all(self, dump_logs=False, visualize=False, dry_run=True, start_index=0, seed=None, schedule=None,
+                   batch_views=1):
+        self.calls.append(('render_all', self.num_images, dry_run, start_index))
+
+
+class TestRenderServer(unittest.TestCase):
+
+    def setUp(self):
+        self.RI = StubRenderInterface()
+        self.server = RenderServer(self.RI)
+        self.listener = Listener(('localhost', 0), authkey=b'secret')
+        self.thread = threading.Thread(target=self.server.serve, args=(self.listener,))
+        self.thread.start()
+        self.client = RenderServerClient(self.listener.address, b'secret', timeout=5.0)
+
+    def tearDown(self):
+        if self.thread.is_alive():
+            self.client.shutdown()
+        self.thread.join(5.0)
+        self.listener.close()
+
+    def test_ping(self):
+        self.assertEqual(self.client.ping(), {'status': 'ok', 'jobs_done': 0})
+
+    def test_render_jobs_reuse_interface(self):
+        attributes = {"attribute_distribution_params": [["num_lamps", "mid", 5]], "attribute_distribution": []}
+        reply = self.client.render('a/Liberte.model', 'out/Liberte', 3, attributes, resolution=300, samples=64)
+        self.assertEqual(reply['status'], 'ok')
+        self.assertEqual(reply['num_images'], 3)
+        self.client.render('a/Coconut.model', 'out/Coconut', 2, resolution=300, samples=64, render_offset=4)
+
+        self.assertEqual(self.RI.calls, [
+            ('set_render', 300, 64),
+            ('reset_distributions',),
+            ('load_from_model', 'a/Liberte.model', 'out/Liberte'),
+            ('set_blender_attributes', attributes),
+            ('render_all', 3, False, 0),
+            # render settings did not change, so they are not set again
+            ('reset_distributions',),
+            ('load_from_model', 'a/Coconut.model', 'out/Coconut'),
+            ('render_all', 2, False, 4),
+        ])
+        self.assertEqual(self.client.ping()['jobs_done'], 2)
+
+    def test_render_cache(self):
+        cache = os.path.join(os.path.dirname(__file__), 'server_cache')
+        try:
+            self.client.render('a/Liberte.model', 'out/Liberte', 1, render_cache=cache, seed=3)
+            first = self.RI.render_cache
+            self.assertIsInstance(first, RenderCache)
+            self.client.render('a/Coconut.model', 'out/Coconut', 1, render_cache=cache)
+            self.assertIs(self.RI.render_cache, first)
+            self.client.render('a/Coconut.model', 'out/Coconut', 1)
+            self.assertIsNone(self.RI.render_cache)
+            self.client.render('a/Liberte.model', 'out/Liberte', 1, render_cache=cache)
+            # the cache is set before the model is loaded, including the first
+            # job and a job following one without a cache
+            self.assertEqual(self.RI.load_caches, [first, first, None, first])
+        finally:
+            shutil.rmtree(cache, ignore_errors=True)
+
+    def test_model_cache(self):
+        cache = os.path.join(os.path.dirname(__file__), 'server_model_cache')
+        try:
+            self.client.render('a/Liberte.model', 'out/Liberte', 1, model_cache=cache)
+            first = self.RI.model_cache
+            self.assertIsInstance(first, ModelCache)
+            self.client.render('a/Coconut.model', 'out/Coconut', 1, model_cache=cache)
+            self.assertIs(self.RI.model_cache, first)
+            self.client.render('a/Coconut.model', 'out/Coconut', 1)
+            self.assertIsNone(self.RI.model_cache)
+        finally:
+            shutil.rmtree(cache, ignore_errors=True)
+
+    def test_failed_job_keeps_server_alive(self):
+        self.assertRaises(RenderServerError, self.client.render, 'a/Liberte.obj', 'out', 1)
+        self.assertRaises(RenderServerError, self.client.request, {'cmd': 'nonsense'})
+        self.assertEqual(self.client.ping()['status'], 'ok')
+
+    def test_shutdown(self):
+        self.client.shutdown()
+        self.thread.join(5.0)
+        self.assertFalse(self.thread.is_alive())
+
+    def test_port_file(self):
+        folder = tempfile.mkdtemp()
+        try:
+            port_file = os.path.join(folder, 'port')
+            # the server reports the port the OS gave its listener
+            write_port(port_file, self.listener.address[1])
+            port = wait_for_port(port_file, timeout=1.0, poll_interval=0.01)
+            self.assertEqual(port, self.listener.address[1])
+
+            missing = os.path.join(folder, 'missing')
+            self.assertRaises(RenderServerError, wait_for_port, missing, timeout=0.05, poll_interval=0.01)
+            self.assertRaises(RenderServerError, wait_for_port, missing, timeout=5.0, alive=lambda: False)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
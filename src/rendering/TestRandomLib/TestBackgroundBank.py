@@ -0,0 +1,102 @@
+"""
+Tests for RandomLib.background_bank
+"""
+
+import unittest
+
+import os, sys, pickle, shutil, tempfile
+import numpy as np
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.abspath(os.path.join(dir_path, os.pardir))
+base_path = os.path.abspath(os.path.join(parent,os.pardir)) # folder /src
+
+if not (base_path in sys.path):
+    sys.path.append(base_path)
+
+from ..RandomLib import background_bank as bb
+from ..RandomLib.random_exceptions import BackgroundBankError
+
+
+class TestBackgroundBank(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_create(self):
+        """
+        The bank is a memory mapped uint8 array of the requested shape and
+        the same seed gives the same bank
+        """
+        bank = bb.BackgroundBank.create(os.path.join(self.folder, 'a.npy'), 5, 40, seed=1, batch_size=2)
+        self.assertEqual(5, len(bank))
+        self.assertEqual(40, bank.size)
+        self.assertIsInstance(bank.backgrounds, np.memmap)
+        self.assertEqual((5,40,40,3), bank.backgrounds.shape)
+        self.assertEqual(np.uint8, bank.backgrounds.dtype)
+        again = bb.BackgroundBank.create(os.path.join(self.folder, 'b.npy'), 5, 40, seed=1, batch_size=2)
+        self.assertTrue(np.array_equal(bank.backgrounds, again.backgrounds))
+        self.assertEqual(['a.npy', 'b.npy'], sorted(os.listdir(self.folder)))
+
+    def test_open_or_create_reuses_bank(self):
+        """
+        A bank is only regenerated when it is too small for the request
+        """
+        bank = bb.BackgroundBank.open_or_create(self.folder, 4, 32, seed=0)
+        mtime = os.path.getmtime(bb.bank_path(self.folder, 32))
+        reused = bb.BackgroundBank.open_or_create(self.folder, 3, 32, seed=5)
+        self.assertEqual(4, len(reused))
+        self.assertTrue(np.array_equal(bank.backgrounds, reused.backgrounds))
+        self.assertEqual(mtime, os.path.getmtime(bb.bank_path(self.folder, 32)))
+        larger = bb.BackgroundBank.open_or_create(self.folder, 6, 32)
+        self.assertEqual(6, len(larger))
+        # other resolutions get their own bank
+        self.assertEqual(16, bb.BackgroundBank.open_or_create(self.folder, 2, 16).size)
+
+    def test_sample(self):
+        """
+        Samples are uint8 backgrounds of the bank size, reproducible for a
+        given random state. Without augmentation they are bank entries
+        """
+        bank = bb.BackgroundBank.create(os.path.join(self.folder, 'a.npy'), 3, 32, seed=0)
+        sample = bank.sample(np.random.RandomState(2))
+        self.assertEqual((32,32,3), sample.shape)
+        self.assertEqual(np.uint8, sample.dtype)
+        self.assertTrue(np.array_equal(sample, bank.sample(np.random.RandomState(2))))
+
+        plain = bb.BackgroundBank(bank.path, augment=False)
+        sample = plain.sample(np.random.default_rng(0))
+        self.assertTrue(any(np.array_equal(sample, background) for background in bank.backgrounds))
+
+    def test_hue_rotation(self):
+        """
+        Rotating the hue keeps greys unchanged and a full turn is the identity
+        """
+        self.assertTrue(np.allclose(np.eye(3), bb.hue_rotation(360)))
+        grey = np.array([100., 100., 100.])
+        self.assertTrue(np.allclose(grey, grey.dot(bb.hue_rotation(40).T)))
+
+    def test_pickle(self):
+        """
+        Banks pickle as their path, so pool workers map the same file
+        """
+        bank = bb.BackgroundBank.create(os.path.join(self.folder, 'a.npy'), 2, 16, seed=0, augment=False)
+        data = pickle.dumps(bank)
+        self.assertLess(len(data), 1000)
+        copy = pickle.loads(data)
+        self.assertFalse(copy.augment)
+        self.assertTrue(np.array_equal(bank.backgrounds, copy.backgrounds))
+
+    def test_invalid_bank(self):
+        path = os.path.join(self.folder, 'a.npy')
+        np.save(path, np.zeros((2,2)))
+        self.assertRaises(BackgroundBankError, bb.BackgroundBank, path)
+        self.assertRaises(BackgroundBankError, bb.BackgroundBank, os.path.join(self.folder, 'missing.npy'))
+        self.assertRaises(BackgroundBankError, bb.BackgroundBank.create, path, 0, 16)
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+Tests for RandomLib.low_discrepancy and the inverse transforms of the
+distributions
+"""
+
+import unittest
+
+import os, sys, math
+import numpy as np
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.abspath(os.path.join(dir_path, os.pardir))
+base_path = os.path.abspath(os.path.join(parent,os.pardir)) # folder /src
+
+if not (base_path in sys.path):
+    sys.path.append(base_path)
+
+from ..RandomLib import low_discrepancy as ld
+from ..RandomLib import random_render as rnd
+
+
+class NoShift(object):
+    def random(self, d):
+        return np.zeros(d)
+
+
+class TestLowDiscrepancy(unittest.TestCase):
+
+    def test_sobol(self):
+        """
+        The first 2^m Sobol points put one point in each of the 2^m strata
+        of every dimension, and in each cell of the 4x4 grid of the first two
+        """
+        X = ld.sobol(16, 8, NoShift())
+        self.assertEqual([0.0, 0.5, 0.75, 0.25], X[:4, 1].tolist())
+        for j in range(8):
+            self.assertEqual(list(range(16)), sorted(np.floor(X[:, j]*16).astype(int).tolist()))
+        cells = np.floor(X[:, 0]*4)*4 + np.floor(X[:, 1]*4)
+        self.assertEqual(list(range(16)), sorted(cells.astype(int).tolist()))
+
+        X = ld.sobol(16, 3, np.random.default_rng(0))
+        self.assertTrue(np.all((X >= 0) & (X < 1)))
+        for j in range(3):
+            self.assertEqual(list(range(16)), sorted(np.floor(X[:, j]*16).astype(int).tolist()))
+        self.assertRaises(ValueError, ld.sobol, 16, 9)
+
+    def test_sobol_scramble(self):
+        """
+        The linear matrix scramble keeps the net structure, but unlike a
+        digital shift alone it does not XOR every point with the same value
+        """
+        plain = (ld.sobol(64, 8, NoShift()) * 2**32).astype(np.uint64)
+        X = ld.sobol(64, 8, np.random.default_rng(0))
+        for m in [2, 4, 6]:
+            for j in range(8):
+                self.assertEqual(list(range(2**m)), sorted(np.floor(X[:2**m, j]*2**m).astype(int).tolist()))
+        cells = np.floor(X[:16, 0]*4)*4 + np.floor(X[:16, 1]*4)
+        self.assertEqual(list(range(16)), sorted(cells.astype(int).tolist()))
+
+        shifts = (X * 2**32).astype(np.uint64) ^ plain
+        for j in range(8):
+            self.assertGreater(len(set(shifts[:, j].tolist())), 1)
+        self.assertTrue(np.array_equal(X, ld.sobol(64, 8, np.random.default_rng(0))))
+
+    def test_halton(self):
+        X = ld.halton(5, 2, NoShift())
+        self.assertTrue(np.allclose([0.0, 0.5, 0.25, 0.75, 0.125], X[:, 0]))
+        self.assertTrue(np.allclose([0.0, 1/3., 2/3., 1/9., 4/9.], X[:, 1]))
+        X = ld.halton(100, 4, np.random.default_rng(0))
+        self.assertTrue(np.all((X >= 0) & (X < 1)))
+
+    def test_stratified(self):
+        X = ld.stratified(50, 3, np.random.default_rng(0))
+        for j in range(3):
+            self.assertEqual(list(range(50)), sorted(np.floor(X[:, j]*50).astype(int).tolist()))
+        self.assertRaises(ValueError, ld.points, 'random', 10, 2)
+        self.assertEqual((10, 2), ld.points('iid', 10, 2).shape)
+
+    def test_norm_ppf(self):
+        p = np.array([1e-10, 0.01, 0.2, 0.5, 0.975, 1 - 1e-8])
+        self.assertTrue(np.allclose(p, ld.norm_cdf(ld.norm_ppf(p)), rtol=1e-9, atol=0))
+        self.assertAlmostEqual(1.959963984540054, ld.norm_ppf([0.975])[0], places=9)
+        self.assertEqual([-np.inf, np.inf], ld.norm_ppf([0.0, 1.0]).tolist())
+
+    def test_transform_batch(self):
+        """
+        Every distribution maps points of the unit cube into its support,
+        logs the samples, and matches its distribution on average
+        """
+        u = ld.sobol(1024, 2, np.random.default_rng(0))
+        D = rnd.TruncNormDist(mu=6.0, sigmu=0.3, l=4.0, r=8.0)
+        X = D.transform_batch(u[:, :1])
+        self.assertTrue(np.all((X >= 4.0) & (X <= 8.0)))
+        self.assertAlmostEqual(6.0, X.mean(), places=2)
+        self.assertEqual(X.tolist(), D.log.tolist())
+
+        X = rnd.NormDist(mu=1.0, sigma=2.0).transform_batch(u[:, 0])
+        self.assertAlmostEqual(1.0, X.mean(), places=2)
+        self.assertAlmostEqual(2.0, X.std(), places=1)
+
+        X = rnd.PScaledUniformDDist(mid=2, scale=0.5).transform_batch(u[:, :1])
+        self.assertEqual([0, 341, 341, 342], np.bincount(X).tolist())
+
+        for D in [rnd.ShellRingCoordinateDist(phi_sigma=10.0, normal='X'),
+                  rnd.CompositeShellRingDist(phi_sigma=10.0, normals='XYZ'), rnd.UniformShellCoordinateDist()]:
+            X = D.transform_batch(u)
+            self.assertEqual((1024, 3), X.shape)
+            self.assertTrue(np.allclose(1.0, np.linalg.norm(X, axis=1)))
+            self.assertEqual(1024, len(D.log))
+
+        # every ring gets about the same number of samples
+        D = rnd.CompositeShellRingDist(phi_sigma=0.0, normals='XYZ')
+        D.transform_batch(u)
+        counts = np.bincount(D.distribution_select.log.values())
+        self.assertLessEqual(counts.max() - counts.min(), 2)
+
+        class Constant(rnd.Distribution):
+            pass
+        self.assertRaises(NotImplementedError, Constant().transform_batch, u)
+
+    def test_sample_qmc(self):
+        D = rnd.CompositeShellRingDist(phi_sigma=10.0, normals='YZ')
+        X = D.sample_qmc(64, 'halton', np.random.default_rng(1))
+        self.assertEqual((64, 3), X.shape)
+        self.assertEqual((64, 3), D.sample_qmc(64, 'iid', np.random.default_rng(1)).shape)
+
+    def test_view_coverage(self):
+        reference = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [-1.0, 0.0, 0.0]])
+        directions = np.array([[1.0, 0.0, 0.0], [0.0, math.cos(0.1), math.sin(0.1)]])
+        coverage = ld.view_coverage(directions, reference, angle=10.0)
+        self.assertEqual(0.5, coverage['coverage'])
+        self.assertAlmostEqual(90.0, coverage['covering_angle'])
+        self.assertEqual(2, coverage['views'])
+        self.assertEqual(0.0, ld.view_coverage(np.empty((0, 3)), reference)['coverage'])
+
+    def test_coverage_gain(self):
+        """
+        Low-discrepancy views cover the camera distribution better than as
+        many i.i.d. views
+        """
+        D = rnd.CompositeShellRingDist(phi_sigma=10.0, normals='YZ')
+        reference = D.sample_qmc(2048, 'sobol', np.random.default_rng(0))
+        gain = []
+        for seed in range(5):
+            iid = ld.view_coverage(D.sample_batch(64, np.random.default_rng(seed)), reference)['coverage']
+            sobol = ld.view_coverage(D.sample_qmc(64, 'sobol', np.random.default_rng(seed)), reference)['coverage']
+            gain.append(sobol - iid)
+        self.assertGreater(np.mean(gain), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
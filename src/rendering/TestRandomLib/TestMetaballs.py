@@ -78,6 +78,25 @@ class Testturbulence(unittest.TestCase):
         all_balls = [mb.ball(2,0,0,2)]
         self.assertRaises(IndexError, mb.sum_inverse_distance,x,y, all_balls)
         
+    def test_balls(self):
+        """
+        The structure of arrays Balls gives the same inverse distances as
+        the individual ball instances, also for mixed normalisation factors
+        and for coordinates given as a broadcasting row and collumn
+        """
+        all_balls = [mb.ball(3,0,0,2),mb.ball(4,-1,2,1),mb.ball(5,0,1,3)]
+        balls = mb.Balls.from_balls(all_balls)
+        self.assertEqual(3, len(balls))
+        X, Y = mb.coordinate_grid(4,5)
+        self.assertEqual((1,5), X.shape)
+        self.assertEqual((4,1), Y.shape)
+        self.assertIs(X, mb.coordinate_grid(4,5)[0])
+        inverse = balls.inverse_distance(X,Y)
+        self.assertEqual((3,4,5), inverse.shape)
+        for i, one_ball in enumerate(all_balls):
+            self.assertTrue(np.allclose(one_ball.inverse_distance(X,Y), inverse[i]))
+        self.assertTrue(np.allclose(mb.sum_inverse_distance(X,Y,all_balls), inverse.sum(axis=0)))
+
     def test_metaball(self):
         """
         Test function metaball, that creates a single metaball
@@ -119,6 +138,20 @@ class Testturbulence(unittest.TestCase):
                     true_count +=1
         self.assertGreater(true_count,1)
 
+
+    def test_random_metaball_batch(self):
+        """
+        Batch of metaball images, each with its own threshold.
+        With the same seed the balls are the same, so a higher threshold
+        must give a subset of the features of a lower one
+        """
+        low = mb.random_metaball_batch(3,100,300,4,[0.1,0.2,0.3],np.random.default_rng(5))
+        high = mb.random_metaball_batch(3,100,300,4,0.5,np.random.default_rng(5))
+        self.assertEqual((3,100,300), low.shape)
+        self.assertEqual(bool, low.dtype)
+        for i in range(3):
+            self.assertGreater(np.count_nonzero(low[i]),1)
+        self.assertFalse(np.any(high & ~low))
         
  
        
@@ -0,0 +1,86 @@
+"""
+Tests for RandomLib.param_log
+"""
+
+import unittest
+
+import os, sys, json, shutil, tempfile
+import numpy as np
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.abspath(os.path.join(dir_path, os.pardir))
+base_path = os.path.abspath(os.path.join(parent,os.pardir)) # folder /src
+
+if not (base_path in sys.path):
+    sys.path.append(base_path)
+
+from ..RandomLib import param_log as pl
+from ..RandomLib import random_render as rnd
+
+
+class TestParamLog(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_growth(self):
+        """
+        The log keeps every sample through reallocations, in the former list format
+        """
+        log = pl.ParamLog(capacity=2)
+        for i in range(5):
+            log.append((i, 0.5, 1.0))
+        log.extend(np.ones((3, 3)))
+        self.assertEqual(8, len(log))
+        self.assertEqual((8, 3), log.values().shape)
+        self.assertEqual((2.0, 0.5, 1.0), log[2])
+        self.assertEqual([(1.0, 1.0, 1.0)] * 2, log[-2:])
+        self.assertLessEqual(log.buffer.nbytes, 2 * 8 * 3 * len(log))
+
+    def test_dtype(self):
+        """
+        Integer samples stay integers until a float is logged
+        """
+        log = pl.ParamLog()
+        log.extend(np.array([1, 2]))
+        self.assertEqual([1, 2], log.tolist())
+        self.assertIsInstance(log[0], int)
+        log.append(2.5)
+        self.assertEqual([1.0, 2.0, 2.5], log.tolist())
+        self.assertEqual([], pl.ParamLog().tolist())
+        log.truncate(2)
+        self.assertEqual([1.0, 2.0], log.tolist())
+        log.append(3)
+        self.assertEqual([1.0, 2.0, 3.0], log.tolist())
+
+    def test_distribution_log(self):
+        D = rnd.UniformShellCoordinateDist()
+        samples = [D.sample_param() for i in range(10)]
+        self.assertEqual([tuple(s) for s in samples], D.log.tolist())
+        D.clear_log()
+        self.assertEqual(0, len(D.log))
+
+    def test_save_load(self):
+        logs = {'camera_radius': pl.ParamLog(), 'camera_loc': pl.ParamLog(), 'num_lamps': pl.ParamLog()}
+        for i in range(3):
+            logs['camera_radius'].append(6.0 + i)
+            logs['camera_loc'].append((0.0, 0.6, 0.8))
+        path = os.path.join(self.folder, 'randomvars_dump.npz')
+        pl.save_logs(path, logs)
+        loaded = pl.load_logs(path)
+        self.assertEqual([6.0, 7.0, 8.0], loaded['camera_radius'].tolist())
+        self.assertEqual((3, 3), loaded['camera_loc'].shape)
+        self.assertEqual(0, len(loaded['num_lamps']))
+
+        # dumps of older runs
+        path = os.path.join(self.folder, 'randomvars_dump.json')
+        with open(path, 'w') as f:
+            json.dump({'camera_radius': [6.0, 7.0, 8.0]}, f)
+        self.assertEqual([6.0, 7.0, 8.0], pl.load_logs(path)['camera_radius'].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
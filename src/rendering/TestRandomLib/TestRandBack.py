@@ -92,6 +92,26 @@ class TestResizeImages(unittest.TestCase):
                         self.assertTrue(value>=0 and value <=1.0)
                         
     
+    def test_rand_background_batch(self):
+        """
+        Creates a batch of images, checks the shape and type of the batch
+        and that the same seed gives the same batch
+        """
+        result = rb.rand_background_batch(6, 64, np.random.default_rng(3))
+        self.assertEqual((6,64,64,3), result.shape)
+        self.assertEqual(np.uint8, result.dtype)
+        again = rb.rand_background_batch(6, 64, np.random.default_rng(3))
+        self.assertTrue(np.array_equal(result, again))
+        self.assertEqual((0,64,64,3), rb.rand_background_batch(0, 64).shape)
+
+    def test_random_image_batch(self):
+        """
+        Batch of random images of values between 0 and 1
+        """
+        result = rb.random_image_batch(8, 50, np.random.default_rng(0))
+        self.assertEqual((8,50,50,3), result.shape)
+        self.assertTrue(np.all(result >= 0) and np.all(result <= 1.0))
+
     def test_generate_images(self):
         """
         Generates few images, checks that they are of the
@@ -369,6 +369,96 @@ class Testturbulence(unittest.TestCase):
         param = D.give_param()
         self.assertEqual(param,{"dist": "UniformShellCoordinateDist"})        
 
+    def test_sample_trunc_norm_batch(self):
+        rng = np.random.default_rng(0)
+        x = rr.sample_trunc_norm_batch(90.0, 30.0, 10000, 0.0, 180.0, rng=rng)
+        self.assertEqual((10000,), x.shape)
+        self.assertTrue(np.all((x >= 0.0) & (x <= 180.0)))
+        self.assertAlmostEqual(90.0, x.mean(), delta=1.5)
+        # one sided and narrow intervals
+        self.assertTrue(np.all(rr.sample_trunc_norm_batch(0.0, 1.0, 100, a=2.0, rng=rng) >= 2.0))
+        x = rr.sample_trunc_norm_batch(0.0, 1.0, 100, 3.0, 3.1, rng=rng)
+        self.assertTrue(np.all((x >= 3.0) & (x <= 3.1)))
+        self.assertEqual((0,), rr.sample_trunc_norm_batch(0.0, 1.0, 0, rng=rng).shape)
+        self.assertRaises(ValueError, rr.sample_trunc_norm_batch, 0.0, 1.0, 10, 2.0, 1.0)
+        self.assertRaises(ImprobableError, rr.sample_trunc_norm_batch, 3.0, 15.0, 10, 1e05, 5e05)
+
+    def test_sample_batch(self):
+        """
+        sample_batch returns arrays of samples within the support of every
+        distribution, logs them like sample_param, and the same stream gives
+        the same batch
+        """
+        distributions = [rr.TruncNormDist(mu=6.0, sigmu=0.3, l=4.0, r=8.0), rr.NormDist(mu=1.0, sigma=2.0),
+                         rr.UniformCDist(l=-1.0, r=2.0), rr.UniformDDist(l=1, r=3),
+                         rr.PScaledUniformDDist(mid=10, scale=0.5), rr.ShellRingCoordinateDist(phi_sigma=10.0, normal='X'),
+                         rr.CompositeShellRingDist(phi_sigma=10.0, normals='XYZ'), rr.UniformShellCoordinateDist()]
+        for D in distributions:
+            X = D.sample_batch(500, np.random.default_rng(1))
+            self.assertEqual(500, len(X))
+            self.assertEqual([tuple(x) for x in X.tolist()] if X.ndim > 1 else X.tolist(), D.log.tolist())
+            self.assertTrue(np.array_equal(X, D.sample_batch(500, np.random.default_rng(1))))
+            self.assertEqual(0, len(D.sample_batch(0)))
+
+        X = distributions[0].sample_batch(500)
+        self.assertTrue(np.all((X >= 4.0) & (X <= 8.0)))
+        X = distributions[2].sample_batch(500)
+        self.assertTrue(np.all((X >= -1.0) & (X <= 2.0)))
+        X = distributions[3].sample_batch(500)
+        self.assertEqual([1, 2, 3], sorted(set(X.tolist())))
+        X = distributions[4].sample_batch(500)
+        self.assertTrue(np.all((X >= 5) & (X <= 15)))
+        for D in distributions[5:]:
+            X = D.sample_batch(500)
+            self.assertEqual((500, 3), X.shape)
+            self.assertTrue(np.allclose(1.0, np.linalg.norm(X, axis=1)))
+
+        # with phi_sigma = 0 every ring is a circle in the plane normal to its axis
+        D = rr.CompositeShellRingDist(phi_sigma=0.0, normals='XYZ')
+        X = D.sample_batch(300, np.random.default_rng(2))
+        on_ring = np.isclose(X, 0.0, atol=1e-9)
+        self.assertTrue(np.all(on_ring.sum(axis=1) >= 1))
+        self.assertTrue(np.all(on_ring.any(axis=0)))
+
+    def test_sample_batch_default(self):
+        """
+        Distributions without a vectorized sample_batch fall back to sample_param
+        """
+        class Constant(rr.Distribution):
+            def sample_param(self, rng=None):
+                self.log_param(4.0)
+                return 4.0
+        D = Constant()
+        self.assertEqual([4.0, 4.0], D.sample_batch(2).tolist())
+        self.assertEqual([4.0, 4.0], D.log.tolist())
+
+    def test_sample_view(self):
+        """
+        A view after the first of a batch has the camera of a render of its
+        own from the same stream, the lamps and subject size of the scene,
+        and is logged as a whole scene
+        """
+        distributions = rr.default_scene_distributions()
+        distributions['num_lamps'] = rr.UniformDDist(l=1, r=4)
+        scene = rr.sample_scene(distributions, np.random.default_rng(0))
+        for seed in range(1, 6):
+            single = rr.default_scene_distributions()
+            single['num_lamps'] = rr.UniformDDist(l=1, r=4)
+            alone = rr.sample_scene(single, np.random.default_rng(seed))
+
+            start = {name: len(D.log) for name, D in distributions.items()}
+            view = rr.sample_view(distributions, scene, np.random.default_rng(seed))
+            for attr in rr.VIEW_PARAMS:
+                self.assertEqual(np.asarray(alone[attr]).tolist(), np.asarray(view[attr]).tolist())
+            for attr in ['num_lamps', 'lamps', 'subject_size']:
+                self.assertEqual(scene[attr], view[attr])
+
+            self.assertEqual(len(scene['lamps']), len(distributions['lamp_energy'].log) - start['lamp_energy'])
+            for attr in ['num_lamps', 'camera_loc', 'camera_radius', 'spin_angle', 'subject_size']:
+                self.assertEqual(1, len(distributions[attr].log) - start[attr])
+            self.assertEqual(view['spin_angle'], distributions['spin_angle'].log[-1])
+            self.assertEqual(scene['lamps'][-1]['energy'], distributions['lamp_energy'].log[-1])
+
 
 if __name__=='__main__':
     unittest.main()
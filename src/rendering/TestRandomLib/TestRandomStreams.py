@@ -0,0 +1,85 @@
+"""
+Tests for RandomLib.random_streams and the distributions and backgrounds
+sampled from streams
+"""
+
+import unittest
+
+import os, sys, json, random
+import numpy as np
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.abspath(os.path.join(dir_path, os.pardir))
+base_path = os.path.abspath(os.path.join(parent,os.pardir)) # folder /src
+
+if not (base_path in sys.path):
+    sys.path.append(base_path)
+
+from ..RandomLib import random_streams as rs
+from ..RandomLib import random_render as rnd
+from ..RandomLib import random_background as rb
+
+
+class TestRandomStreams(unittest.TestCase):
+
+    def distributions(self):
+        return [rnd.TruncNormDist(mu=6.0, sigmu=0.3, l=4.0, r=8.0), rnd.NormDist(mu=1.0, sigma=2.0),
+                rnd.UniformCDist(l=0.0, r=360.0), rnd.UniformDDist(l=1, r=5),
+                rnd.PScaledUniformDDist(mid=100, scale=0.5), rnd.ShellRingCoordinateDist(phi_sigma=10.0, normal='Z'),
+                rnd.CompositeShellRingDist(phi_sigma=10.0, normals='XYZ'), rnd.UniformShellCoordinateDist()]
+
+    def test_stream_seed(self):
+        self.assertEqual(rs.stream_seed(1, 'Liberte', 3), rs.stream_seed(1, 'Liberte', 3))
+        seeds = {rs.stream_seed(1, 'Liberte', 3), rs.stream_seed(1, 'Liberte', 4), rs.stream_seed(1, 'Coconut', 3),
+                 rs.stream_seed(2, 'Liberte', 3), rs.stream_seed(1, 'Liberte')}
+        self.assertEqual(5, len(seeds))
+        self.assertEqual(rs.stream(1, 'a').uniform(), rs.stream(1, 'a').uniform())
+        self.assertRaises(ValueError, rs.stream_seed, 1, -1)
+
+    def test_sample_param_stream(self):
+        """
+        A stream gives the same samples whatever was drawn from the random
+        module, and the samples are plain python numbers for the json logs
+        """
+        first = [D.sample_param(rs.stream(7, i)) for i, D in enumerate(self.distributions())]
+        random.seed(0)
+        random.random()
+        again = [D.sample_param(rs.stream(7, i)) for i, D in enumerate(self.distributions())]
+        self.assertEqual(first, again)
+        json.dumps(first)
+        for D, x in zip(self.distributions(), first):
+            if isinstance(D, (rnd.UniformDDist, rnd.PScaledUniformDDist)):
+                self.assertIsInstance(x, int)
+                self.assertTrue(D.l <= x <= D.r)
+
+    def test_sample_param_global(self):
+        """
+        Without a stream, the distributions still sample from the random module
+        """
+        random.seed(3)
+        first = [D.sample_param() for D in self.distributions()]
+        random.seed(3)
+        self.assertEqual(first, [D.sample_param() for D in self.distributions()])
+
+    def test_streams_are_independent(self):
+        """
+        The samples of a stream do not depend on the streams sampled before
+        it, as when renders are split over processes
+        """
+        D = rnd.CompositeShellRingDist(phi_sigma=10.0, normals='XYZ')
+        serial = [D.sample_param(rs.stream(5, 'Liberte', i)) for i in range(6)]
+        split = [D.sample_param(rs.stream(5, 'Liberte', i)) for i in [3, 4, 5, 0, 1, 2]]
+        self.assertEqual(serial, split[3:] + split[:3])
+
+    def test_rand_background_stream(self):
+        state = np.random.get_state()
+        img1 = rb.rand_background(2, 40, rs.stream(1, 'background'))
+        img2 = rb.rand_background(2, 40, rs.stream(1, 'background'))
+        self.assertTrue(np.array_equal(img1, img2))
+        self.assertFalse(np.array_equal(img1, rb.rand_background(2, 40, rs.stream(2, 'background'))))
+        # the global state is left alone
+        self.assertEqual(state[1].tolist(), np.random.get_state()[1].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -85,6 +85,67 @@ class Testturbulence(unittest.TestCase):
                 
         
 
+    def test_smooth_noise_batch(self):
+        """
+        Every array in the batch is smoothed on its own: sampling the noise
+        bilinearly at (i/scale, j/scale). Checked against a reference
+        computed pixel by pixel
+        """
+        noise = np.random.uniform(size=[2,20,20])
+        scale = 3
+        sm_noise = tb.smooth_noise_batch(noise, scale)
+        self.assertEqual((2,20,20), sm_noise.shape)
+        for i in [0, 7, 19]:
+            for j in [0, 5, 19]:
+                y, x = i/scale, j/scale
+                y0, x0 = int(y), int(x)
+                wy, wx = y-y0, x-x0
+                ref = (noise[1,y0,x0]*(1-wy)*(1-wx) + noise[1,y0+1,x0]*wy*(1-wx) +
+                       noise[1,y0,x0+1]*(1-wy)*wx + noise[1,y0+1,x0+1]*wy*wx)
+                self.assertAlmostEqual(ref, sm_noise[1,i,j])
+        self.assertTrue(np.array_equal(noise, tb.smooth_noise_batch(noise, 1)))
+
+    def test_smoothing_methods(self):
+        """
+        All smoothing backends keep the shape, the range and (roughly) the
+        mean of the noise, and reduce its variance.
+        Unknown backends raise a ValueError
+        """
+        noise = tb.generate_noise(120)
+        for method in tb.SMOOTHING_METHODS:
+            sm_noise = tb.smoothNoise(noise, 4, method)
+            self.assertEqual((120,120), sm_noise.shape)
+            self.assertTrue(np.all(sm_noise >= 0) and np.all(sm_noise <= 1))
+            self.assertAlmostEqual(np.mean(noise), np.mean(sm_noise), delta=0.1)
+            self.assertGreater(np.var(noise), np.var(sm_noise))
+            turb = tb.turbulence(120, 5, 2, method)
+            self.assertTrue(np.all(turb >= 0) and np.all(turb <= 1))
+        self.assertRaises(ValueError, tb.smoothNoise, noise, 2, 'nearest')
+
+    def test_interp_table_cache(self):
+        """
+        The interpolation tables are computed once per (N, scale, method)
+        and cannot be modified by the callers
+        """
+        tb._interp_table.cache_clear()
+        noise = tb.generate_noise(50)
+        tb.smoothNoise(noise, 2)
+        tb.smoothNoise(noise, 2)
+        info = tb._interp_table.cache_info()
+        self.assertEqual(1, info.misses)
+        self.assertEqual(3, info.hits)
+        index, weight = tb._interp_table(50, 2.0, 'linear')
+        self.assertFalse(weight.flags.writeable)
+
+    def test_turbulence_rgb_batch(self):
+        """
+        Batch of RGB meshes, all values between 0 and 1
+        """
+        turb = tb.turbulence_rgb_batch(4, 100, np.random.default_rng(0))
+        self.assertEqual((4,100,100,3), turb.shape)
+        self.assertTrue(np.all(turb >= 0) and np.all(turb <= 1))
+
+
 if __name__=='__main__':
     unittest.main()
 
@@ -0,0 +1,95 @@
+"""
+Tests of the encoders in SceneLib/Encode_Images.py
+"""
+import unittest
+
+import os, sys, shutil, tempfile, pickle
+import numpy as np
+from PIL import Image
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.abspath(os.path.join(dir_path, os.pardir))
+gr_parent = os.path.abspath(os.path.join(parent,os.pardir))
+base_path = os.path.abspath(os.path.join(gr_parent,os.pardir))
+if not (gr_parent in sys.path):
+    sys.path.append(gr_parent)
+
+from ..SceneLib import Encode_Images as ei
+from ..SceneLib import Merge_Images as mi
+
+
+class TestEncodeImages(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.image = np.random.RandomState(0).randint(0, 256, (40, 50, 3)).astype(np.uint8)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_baseline_matches_pil(self):
+        """
+        The 'pil' encoder writes exactly what PIL.Image.save used to
+        """
+        reference = os.path.join(self.folder, 'reference.jpg')
+        Image.fromarray(self.image).save(reference, "JPEG", quality=80, optimize=True, progressive=True)
+        encoder = ei.get_encoder('pil')
+        path = os.path.join(self.folder, 'image' + encoder.extension)
+        encoder.save(Image.fromarray(self.image), path)
+        with open(reference, 'rb') as f1, open(path, 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test_available_encoders(self):
+        """
+        Every available encoder writes a file PIL reads back with the right size,
+        lossless encoders give back the exact pixels
+        """
+        self.assertTrue({'pil', 'pil_fast', 'png', 'raw'} <= set(ei.available_encoders()))
+        for name in ei.available_encoders():
+            encoder = ei.get_encoder(name)
+            self.assertEqual(encoder.name, name)
+            path = os.path.join(self.folder, name + encoder.extension)
+            nbytes = encoder.save(self.image, path)
+            self.assertEqual(nbytes, os.path.getsize(path))
+            with Image.open(path) as im:
+                self.assertEqual((50, 40), im.size)
+                if name in ('png', 'raw'):
+                    self.assertTrue(np.array_equal(np.array(im), self.image))
+
+    def test_unknown_encoder(self):
+        self.assertRaises(ei.EncoderError, ei.get_encoder, 'gif')
+        encoder = ei.get_encoder('png')
+        self.assertIs(ei.get_encoder(encoder), encoder)
+
+    def test_stats(self):
+        encoder = ei.get_encoder('raw')
+        for i in range(3):
+            encoder.save(self.image, os.path.join(self.folder, '%d.ppm' % i))
+        summary = encoder.stats.summary()
+        self.assertEqual(summary['images'], 3)
+        self.assertEqual(summary['bytes_per_image'], os.path.getsize(os.path.join(self.folder, '0.ppm')))
+
+        worker = pickle.loads(pickle.dumps(encoder)).fresh()
+        self.assertEqual(worker.stats.images, 0)
+        worker.save(self.image, os.path.join(self.folder, '3.ppm'))
+        encoder.stats.merge(worker.stats)
+        self.assertEqual(encoder.stats.images, 4)
+
+    def test_merge_with_encoder(self):
+        """
+        generate_for_all_objects writes files with the extension of the
+        encoder and collects the stats of the workers
+        """
+        test_folder = os.path.join(base_path, 'test_data', 'merging_tests', 'batch_test')
+        obj_poses_folder = os.path.join(test_folder, 'object_poses')
+        encoder = ei.get_encoder('png')
+        bboxes = mi.generate_for_all_objects(obj_poses_folder, os.path.join(test_folder, 'backgrounds'), self.folder,
+                                             workers=2, seed=3, encoder=encoder)
+        self.assertEqual(sorted(bboxes), sorted(os.listdir(self.folder)))
+        self.assertTrue(all(name.endswith('.png') for name in bboxes))
+        self.assertEqual(encoder.stats.images, len(os.listdir(obj_poses_folder)))
+        self.assertEqual(encoder.stats.bytes, sum(os.path.getsize(os.path.join(self.folder, name)) for name in bboxes))
+
+
+if __name__ == '__main__':
+    unittest.main()
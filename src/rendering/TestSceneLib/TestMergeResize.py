@@ -18,7 +18,8 @@ way of testing the functions.
 
 import unittest
 
-import os, io, sys
+import os, io, sys, shutil
+import numpy as np
 from PIL import Image
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
@@ -165,6 +166,105 @@ class TestResizeImages(unittest.TestCase):
             self.assertEqual('JPEG', im.format)
             self.assertNotEqual('PNG', im.format)
 
+    def test_all_merge_parallel_reproducible(self):
+        """
+        Merging with a process pool and the same seed must give exactly the
+        same images and bounding boxes as merging serially
+        """
+        test_folder = os.path.join(base_path, 'test_data', 'merging_tests', 'batch_test')
+        backgrounds_folder = os.path.join(test_folder, 'backgrounds')
+        obj_poses_folder = os.path.join(test_folder, 'object_poses')
+        serial_folder = os.path.join(test_folder, 'results_serial')
+        parallel_folder = os.path.join(test_folder, 'results_parallel')
+        for folder in [serial_folder, parallel_folder]:
+            shutil.rmtree(folder, ignore_errors=True)
+            os.mkdir(folder)
+
+        serial = mi.generate_for_all_objects(obj_poses_folder, backgrounds_folder, serial_folder, True, workers=1, seed=42)
+        parallel = mi.generate_for_all_objects(obj_poses_folder, backgrounds_folder, parallel_folder, True, workers=3, seed=42)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(len(os.listdir(obj_poses_folder)), len(serial))
+        for the_file in os.listdir(serial_folder):
+            with open(os.path.join(serial_folder, the_file), 'rb') as f1, open(os.path.join(parallel_folder, the_file), 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+        for folder in [serial_folder, parallel_folder]:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def test_random_offset_stream(self):
+        """
+        The offset drawn from a stream only depends on the stream, and the
+        global random state is left alone
+        """
+        from ..RandomLib.random_streams import stream
+        foreground = Image.open(os.path.join(base_path, 'test_data', 'merging_tests', 'single_test', 'render1.png'))
+        np.random.seed(0)
+        state = np.random.get_state()
+        image1, bbox1 = mi.add_random_offset_foreground(foreground, 0.1, stream(4, 'render1.png'))
+        image2, bbox2 = mi.add_random_offset_foreground(foreground, 0.1, stream(4, 'render1.png'))
+        self.assertEqual(bbox1, bbox2)
+        self.assertTrue(np.array_equal(np.array(image1), np.array(image2)))
+        self.assertEqual(state[1].tolist(), np.random.get_state()[1].tolist())
+
+    def test_image_seed(self):
+        self.assertEqual(mi.image_seed(1, 'render0.png'), mi.image_seed(1, 'render0.png'))
+        self.assertNotEqual(mi.image_seed(1, 'render0.png'), mi.image_seed(1, 'render1.png'))
+        self.assertNotEqual(mi.image_seed(1, 'render0.png'), mi.image_seed(2, 'render0.png'))
+
+    def test_background_index(self):
+        """
+        Builds the index of a database with invalid and too small images.
+        These are rejected at index time, the others are stored resized.
+        The index is only rebuilt when the database changes
+        """
+        database = os.path.join(base_path, 'test_data', 'merging_tests', 'error_test')
+        cache = os.path.join(base_path, 'test_data', 'merging_tests', 'index_cache')
+        shutil.rmtree(cache, ignore_errors=True)
+
+        index = mi.BackgroundIndex.open_or_build(database, 300, cache)
+        self.assertEqual(['background.jpg', 'background_large.jpg'], index.names)
+        self.assertEqual(['background_small.jpg', 'dummy.txt', 'render1.png', 'render_small.png'], sorted(index.rejected))
+        self.assertEqual((2,300,300,3), index.backgrounds.shape)
+        self.assertEqual((300,300,3), index.get(1).shape)
+        self.assertEqual(2, len(os.listdir(cache)))
+
+        again = mi.BackgroundIndex.open_or_build(database, 300, cache)
+        self.assertEqual(index.path, again.path)
+        self.assertEqual(2, len(os.listdir(cache)))
+        small = mi.BackgroundIndex.open_or_build(database, 200, cache)
+        self.assertEqual(5, len(small))
+        self.assertNotEqual(index.path, small.path)
+
+        shutil.rmtree(cache, ignore_errors=True)
+
+    def test_all_merge_indexed(self):
+        """
+        Merging with the index of a database with only valid backgrounds
+        gives exactly the same images as merging from the files
+        """
+        test_folder = os.path.join(base_path, 'test_data', 'merging_tests', 'batch_test')
+        backgrounds_folder = os.path.join(test_folder, 'backgrounds')
+        obj_poses_folder = os.path.join(test_folder, 'object_poses')
+        cache = os.path.join(test_folder, 'index_cache')
+        files_folder = os.path.join(test_folder, 'results_files')
+        indexed_folder = os.path.join(test_folder, 'results_indexed')
+        for folder in [cache, files_folder, indexed_folder]:
+            shutil.rmtree(folder, ignore_errors=True)
+        for folder in [files_folder, indexed_folder]:
+            os.mkdir(folder)
+
+        index = mi.BackgroundIndex.open_or_build(backgrounds_folder, 300, cache)
+        self.assertEqual(len(os.listdir(backgrounds_folder)), len(index))
+        from_files = mi.generate_for_all_objects(obj_poses_folder, backgrounds_folder, files_folder, True, seed=3)
+        indexed = mi.generate_for_all_objects(obj_poses_folder, backgrounds_folder, indexed_folder, True, workers=2, seed=3, background_index=index)
+        self.assertEqual(from_files, indexed)
+        for the_file in os.listdir(files_folder):
+            with open(os.path.join(files_folder, the_file), 'rb') as f1, open(os.path.join(indexed_folder, the_file), 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+        for folder in [cache, files_folder, indexed_folder]:
+            shutil.rmtree(folder, ignore_errors=True)
+
     def test_merge_images(self):
         """
         This function will test merge of two images, for the function
@@ -180,6 +280,60 @@ class TestResizeImages(unittest.TestCase):
         self.assertEqual((300,300),output.size)
         self.assertEqual('JPEG',output.format)
 
+    def test_composite(self):
+        """
+        The array compositor places the object exactly where the PIL path
+        does for the same random state, and gives the same pixels up to
+        rounding. Mismatched sizes and empty object poses raise ImageError
+        """
+        test_folder = os.path.join(base_path, 'test_data', 'merging_tests', 'single_test')
+        foreground = Image.open(os.path.join(test_folder, 'render1.png'))
+        background = Image.open(os.path.join(test_folder, 'background.jpg')).convert('RGB')
+        fg_array = np.array(foreground)
+        bg_array = np.array(background)
+        for seed in range(5):
+            np.random.seed(seed)
+            output, bbox = mi.merge_images(foreground, background.copy())
+            np.random.seed(seed)
+            array, array_bbox = mi.composite(fg_array, bg_array)
+            self.assertEqual(bbox, array_bbox)
+            self.assertEqual((300,300,3), array.shape)
+            self.assertEqual(np.uint8, array.dtype)
+            self.assertLessEqual(np.abs(np.array(output).astype(int) - array).max(), 1)
+
+        np.random.seed(0)
+        brighter, _ = mi.composite(fg_array, bg_array, adjust_brightness=True)
+        self.assertFalse(np.array_equal(brighter, array))
+        self.assertTrue(np.array_equal(bg_array, np.array(background)))
+
+        self.assertRaises(mi.ImageError, mi.composite, fg_array, bg_array[:200])
+        self.assertRaises(mi.ImageError, mi.composite, np.zeros_like(fg_array), bg_array)
+
+    def test_composite_batch(self):
+        """
+        Compositing a stack at once gives exactly the images and bounding
+        boxes of compositing one image after the other
+        """
+        test_folder = os.path.join(base_path, 'test_data', 'merging_tests', 'batch_test')
+        poses = sorted(os.listdir(os.path.join(test_folder, 'object_poses')))
+        backgrounds = sorted(os.listdir(os.path.join(test_folder, 'backgrounds')))[:len(poses)]
+        foregrounds = np.stack([np.array(Image.open(os.path.join(test_folder, 'object_poses', name))) for name in poses])
+        backgrounds = np.stack([np.array(Image.open(os.path.join(test_folder, 'backgrounds', name))) for name in backgrounds])
+
+        for adjust_brightness in [False, True]:
+            np.random.seed(4)
+            offsets = mi.random_offsets(mi.subject_bboxes(foregrounds[..., 3]), (300, 300))
+            composites, bboxes = mi.composite_batch(foregrounds, backgrounds, offsets, adjust_brightness=adjust_brightness)
+            self.assertEqual(foregrounds.shape[:3] + (3,), composites.shape)
+            self.assertEqual((len(poses), 4), bboxes.shape)
+            np.random.seed(4)
+            for i in range(len(poses)):
+                composite, ((x0, x1), (y0, y1)) = mi.composite(foregrounds[i], backgrounds[i], adjust_brightness)
+                self.assertTrue(np.array_equal(composite, composites[i]))
+                self.assertEqual([x0, x1, y0, y1], list(bboxes[i]))
+
+        self.assertRaises(mi.ImageError, mi.composite_batch, foregrounds, backgrounds[:2], offsets)
+
     def test_single_error_merge(self):
         """
         This function will test that the add_background function
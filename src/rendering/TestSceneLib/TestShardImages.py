@@ -0,0 +1,124 @@
+"""
+Tests of the shard writer and readers in SceneLib/Shard_Images.py
+"""
+import unittest
+
+import os, io, sys, shutil, tempfile, tarfile, pickle
+import numpy as np
+from PIL import Image
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.abspath(os.path.join(dir_path, os.pardir))
+gr_parent = os.path.abspath(os.path.join(parent,os.pardir))
+base_path = os.path.abspath(os.path.join(gr_parent,os.pardir))
+if not (gr_parent in sys.path):
+    sys.path.append(gr_parent)
+
+from ..SceneLib import Shard_Images as si
+from ..SceneLib import Encode_Images as ei
+from ..SceneLib import Merge_Images as mi
+
+
+class TestShardImages(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.root = os.path.join(self.folder, 'images')
+        self.shards = os.path.join(self.folder, 'shards')
+        self.images = {}
+        encoder = ei.get_encoder('png')
+        rng = np.random.RandomState(0)
+        for product in ['Coconut', 'Liberte']:
+            for i in range(3):
+                image = rng.randint(0, 256, (8, 6, 3)).astype(np.uint8)
+                self.images[product + '/render%d.png' % i] = (image, encoder.encode(image))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write(self, max_images):
+        with si.ShardWriter(self.shards, self.root, max_images) as writer:
+            for name, (_, data) in sorted(self.images.items()):
+                writer.add(os.path.join(self.root, name), data)
+        return writer
+
+    def test_write_read(self):
+        writer = self.write(4)
+        self.assertEqual(len(writer), 6)
+        self.assertEqual(sorted(os.listdir(self.shards)), ['index.json', 'shard-000000.tar', 'shard-000001.tar'])
+
+        # plain tar files, members named <class>/<name>
+        with tarfile.open(os.path.join(self.shards, 'shard-000001.tar')) as tar:
+            self.assertEqual(tar.getnames(), ['Liberte/render1.png', 'Liberte/render2.png'])
+
+        reader = si.ShardReader(self.shards)
+        self.assertEqual(reader.classes, ['Coconut', 'Liberte'])
+        self.assertEqual(list(reader.labels), [0, 0, 0, 1, 1, 1])
+        for i in range(len(reader)):
+            image, data = self.images[reader.name(i)]
+            self.assertEqual(reader.read(i), data)
+            self.assertTrue(np.array_equal(np.array(reader.image(i)), image))
+        self.assertEqual(dict(iter(reader)), {name: data for name, (_, data) in self.images.items()})
+
+        copy = pickle.loads(pickle.dumps(reader))
+        self.assertEqual(copy.read(5), reader.read(5))
+        reader.close()
+        copy.close()
+
+    def test_errors(self):
+        self.assertRaises(si.ShardError, si.ShardReader, self.folder)
+        self.assertRaises(si.ShardError, si.ShardWriter, self.shards, self.root, 0)
+        writer = si.ShardWriter(self.shards, self.root)
+        self.assertRaises(si.ShardError, writer.add, os.path.join(self.folder, 'render0.png'), b'')
+        writer.close()
+
+    def test_shard_sequence(self):
+        self.write(4)
+        sequence = si.ShardSequence(self.shards, batch_size=4, target_size=(4, 3), seed=0)
+        self.assertEqual(len(sequence), 2)
+        x, y = sequence[0]
+        self.assertEqual(x.shape, (4, 4, 3, 3))
+        self.assertEqual(x.dtype, np.float32)
+        self.assertEqual(y.shape, (4, 2))
+        self.assertTrue(np.all(y.sum(axis=1) == 1))
+        labels = np.concatenate([sequence[i][1].argmax(axis=1) for i in range(len(sequence))])
+        self.assertEqual(sorted(labels), [0, 0, 0, 1, 1, 1])
+
+    def test_find_shards(self):
+        self.assertIsNone(si.find_shards(self.folder))
+        self.write(4)
+        self.assertEqual(si.find_shards(self.shards), self.shards)
+        # the folder of a full_run with shard_size
+        self.assertEqual(si.find_shards(self.folder), self.shards)
+        self.assertIsNone(si.find_shards(self.root))
+
+    def test_merge_into_shards(self):
+        """
+        Images merged by worker processes end up in the shards, in the same
+        order and with the same bytes as the image files
+        """
+        test_folder = os.path.join(base_path, 'test_data', 'merging_tests', 'batch_test')
+        obj_poses_folder = os.path.join(test_folder, 'object_poses')
+        backgrounds_folder = os.path.join(test_folder, 'backgrounds')
+        files = os.path.join(self.folder, 'files')
+        os.mkdir(files)
+        mi.generate_for_all_objects(obj_poses_folder, backgrounds_folder, files, workers=2, seed=5)
+
+        encoder = ei.get_encoder('pil')
+        writer = si.ShardWriter(self.shards, self.folder, 2)
+        encoder.sink = writer
+        bboxes = mi.generate_for_all_objects(obj_poses_folder, backgrounds_folder, os.path.join(self.folder, 'files'),
+                                             workers=2, seed=5, encoder=encoder)
+        writer.close()
+        self.assertEqual(encoder.stats.images, len(bboxes))
+
+        reader = si.ShardReader(self.shards)
+        self.assertEqual([reader.name(i) for i in range(len(reader))], ['files/' + name for name in sorted(bboxes)])
+        for i in range(len(reader)):
+            with open(os.path.join(self.folder, reader.name(i)), 'rb') as f:
+                self.assertEqual(reader.read(i), f.read())
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""
+Benchmark of random background generation: the per-image
+random_background.rand_background path used by gen_merge against the
+batched random_background.rand_background_batch.
+
+Run from the src folder:
+  python -m rendering.benchmarks.bench_background --n 16 --size 300
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ..RandomLib import random_background as rb
+
+
+def bench_per_image(n, size, seed):
+    np.random.seed(seed)
+    start = time.time()
+    for i in range(n):
+        img = rb.rand_background(np.random.randint(2, 4), size)
+        np.clip(img*256, 0, 255).astype(np.uint8)
+    return time.time() - start
+
+
+def bench_batch(n, size, seed, batch_size):
+    rng = np.random.default_rng(seed)
+    start = time.time()
+    for i in range(0, n, batch_size):
+        rb.rand_background_batch(min(batch_size, n - i), size, rng)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark random background generation')
+    parser.add_argument('--n', type=int, default=16, help='number of backgrounds')
+    parser.add_argument('--size', type=int, default=300, help='size of the square backgrounds in pixels')
+    parser.add_argument('--batch_size', type=int, default=16, help='backgrounds per rand_background_batch call')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print('{} backgrounds of {}x{} pixels'.format(args.n, args.size, args.size))
+    per_image = bench_per_image(args.n, args.size, args.seed)
+    print('per image: {:.3f}s ({:.1f} images/s)'.format(per_image, args.n/per_image))
+    batch = bench_batch(args.n, args.size, args.seed, args.batch_size)
+    print('batched:   {:.3f}s ({:.1f} images/s)'.format(batch, args.n/batch))
+    print('speedup:   {:.1f}x'.format(per_image/batch))
@@ -0,0 +1,91 @@
+"""
+Benchmark of multi-view batch rendering: images per minute of
+RenderInterface.render_all rendering one scene per image (the single-shot
+path) against batches of --views views per scene, rendered as one
+animation (see BlenderRandomScene.views_setup).
+
+Every batch size runs in its own Blender process, after one warm-up render
+of the product. Run from the src folder:
+  python -m rendering.benchmarks.bench_batch_views --blender /path/to/blender \
+      --model ../test_data/rendering_tests/pipeline_tests/render_workspace/object_files/two_set_model_format/Liberte/Liberte.model
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import bpy
+except ImportError:
+    # run outside Blender, launches Blender for every batch size
+    bpy = None
+
+
+def measure(args):
+    """
+    Runs inside Blender: renders --renders images of the model in batches
+    of --batch_views views and dumps the time as json
+    """
+    sys.path.append(args.project_dir)
+    import rendering.RenderInterface as Render
+
+    RI = Render.RenderInterface(num_images=args.renders, resolution=args.resolution, samples=args.samples)
+    output_folder = tempfile.mkdtemp()
+    with RI.log:
+        RI.load_from_model(args.model, output_folder)
+        RI.scene.render_to_file(os.path.join(output_folder, 'warm-up.png'))
+        start = time.time()
+        RI.render_all(dry_run=False, seed=args.seed, batch_views=args.batch_views)
+        seconds = time.time() - start
+    with open(args.output, 'w') as f:
+        json.dump({'renders': args.renders, 'seconds': seconds}, f)
+
+
+def run(args, batch_views):
+    output = os.path.join(tempfile.mkdtemp(), 'views{}.json'.format(batch_views))
+    src_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    blender_args = [args.blender, '--background', '--python-exit-code', '2', '--python', os.path.abspath(__file__),
+                    '--', src_dir, os.path.abspath(args.model), str(batch_views), output,
+                    '--renders', str(args.renders), '--resolution', str(args.resolution),
+                    '--samples', str(args.samples), '--seed', str(args.seed)]
+    subprocess.check_call(blender_args, stdout=subprocess.DEVNULL)
+    with open(output) as f:
+        return json.load(f)
+
+
+if __name__ == '__main__' and bpy is not None:
+    parser = argparse.ArgumentParser(description='Batch rendering inside Blender')
+    parser.add_argument('project_dir')
+    parser.add_argument('model')
+    parser.add_argument('batch_views', type=int)
+    parser.add_argument('output')
+    parser.add_argument('--renders', type=int, default=24)
+    parser.add_argument('--resolution', type=int, default=300)
+    parser.add_argument('--samples', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    measure(parser.parse_args(argv))
+
+elif __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark single-shot against multi-view batch rendering')
+    parser.add_argument('--blender', required=True, help='path to the Blender executable')
+    parser.add_argument('--model', required=True, help='.model file rendered')
+    parser.add_argument('--views', type=int, nargs='+', default=[4, 8], help='views per scene compared to 1')
+    parser.add_argument('--renders', type=int, default=24, help='renders per batch size')
+    parser.add_argument('--resolution', type=int, default=300, help='resolution of the renders')
+    parser.add_argument('--samples', type=int, default=32, help='Cycles samples of the renders')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the poses')
+    args = parser.parse_args()
+
+    print('{} renders of {}, {}x{} pixels, {} samples'.format(
+        args.renders, os.path.basename(args.model), args.resolution, args.resolution, args.samples))
+    print('{:>8}{:>14}{:>16}{:>10}'.format('views', 'seconds', 'images/minute', 'speedup'))
+    single = None
+    for batch_views in [1] + [v for v in args.views if v > 1]:
+        result = run(args, batch_views)
+        rate = 60.0 * result['renders'] / result['seconds']
+        single = rate if single is None else single
+        print('{:>8}{:>14.1f}{:>16.1f}{:>9.2f}x'.format(batch_views, result['seconds'], rate, rate / single))
@@ -0,0 +1,72 @@
+"""
+Benchmark of compositing an object pose onto a background: the PIL path
+(add_random_offset_foreground, brightness adjustment and paste, as done by
+add_background) against the array native Merge_Images.composite and the
+batched Merge_Images.composite_batch.
+Decoding and encoding are left out of both.
+
+Run from the src folder:
+  python -m rendering.benchmarks.bench_compositing --n 200
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from ..SceneLib import Merge_Images as mi
+
+test_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir, os.pardir,
+                           'test_data', 'merging_tests', 'single_test')
+
+
+def pil_path(foreground, background, adjust_brightness):
+    foreground, bbox = mi.add_random_offset_foreground(foreground, pad_ratio=0.1)
+    if adjust_brightness:
+        factor = mi.brightness_factor(np.array(foreground), np.array(background))
+        background = Image.fromarray(np.uint8(np.minimum(np.array(background)*factor, 255)))
+    else:
+        background = background.copy()
+    background.paste(foreground, (0, 0), foreground)
+    return background, bbox
+
+
+def bench(function, n, *args):
+    """
+    :return: seconds per image
+    """
+    np.random.seed(0)
+    start = time.time()
+    for i in range(n):
+        function(*args)
+    return (time.time() - start)/n
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark PIL and array compositing')
+    parser.add_argument('--n', type=int, default=200, help='number of composites per path')
+    parser.add_argument('--batch_size', type=int, default=32, help='images per composite_batch call')
+    parser.add_argument('--foreground', default=os.path.join(test_folder, 'render1.png'), help='RGBA object pose')
+    parser.add_argument('--background', default=os.path.join(test_folder, 'background.jpg'),
+                        help='background of the same size as the object pose')
+    args = parser.parse_args()
+
+    foreground = Image.open(args.foreground)
+    foreground.load()
+    background = Image.open(args.background).convert('RGB')
+    fg_array = np.array(foreground)
+    bg_array = np.array(background)
+
+    print('{}x{} pixels, {} composites'.format(foreground.size[0], foreground.size[1], args.n))
+    for adjust_brightness in [False, True]:
+        pil = bench(pil_path, args.n, foreground, background, adjust_brightness)
+        array = bench(mi.composite, args.n, fg_array, bg_array, adjust_brightness)
+        foregrounds = np.repeat(fg_array[None], args.batch_size, axis=0)
+        backgrounds = np.repeat(bg_array[None], args.batch_size, axis=0)
+        offsets = mi.random_offsets(mi.subject_bboxes(foregrounds[..., 3]), foregrounds.shape[1:3])
+        batch = bench(mi.composite_batch, max(1, args.n//args.batch_size), foregrounds, backgrounds, offsets,
+                      None, adjust_brightness)/args.batch_size
+        print('adjust_brightness={!s:<5}  PIL: {:.3f} ms/image  array: {:.3f} ms/image ({:.1f}x)  '
+              'batch: {:.3f} ms/image ({:.1f}x)'.format(adjust_brightness, pil*1000, array*1000, pil/array,
+                                                         batch*1000, pil/batch))
@@ -0,0 +1,47 @@
+"""
+Benchmark of the view coverage of the camera locations of a product, for
+i.i.d. and low-discrepancy sampling: the fraction of a dense reference
+sample of the camera distribution within --angle degrees of a view, and
+the number of renders each sampling needs to reach the coverage of
+--target.
+
+Run from the src folder:
+  python -m rendering.benchmarks.bench_coverage --renders 25 50 100 200
+"""
+import argparse
+
+import numpy as np
+
+from ..RandomLib import random_render as rr
+from ..RandomLib.low_discrepancy import SAMPLING_METHODS, view_coverage
+from ..RandomLib.random_streams import stream
+
+
+def coverage(method, n, angle, reference, repeats):
+    D = rr.default_scene_distributions()['camera_loc']
+    return np.mean([view_coverage(D.sample_qmc(n, method, stream(seed, method, n)), reference, angle)['coverage']
+                    for seed in range(repeats)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the view coverage of i.i.d. and low-discrepancy sampling')
+    parser.add_argument('--renders', type=int, nargs='+', default=[25, 50, 100, 200], help='renders per product')
+    parser.add_argument('--angle', type=float, default=10.0, help='coverage angle in degrees')
+    parser.add_argument('--repeats', type=int, default=10, help='products averaged over')
+    parser.add_argument('--target', type=float, default=0.9, help='coverage the renders needed are reported for')
+    args = parser.parse_args()
+
+    reference = rr.default_scene_distributions()['camera_loc'].sample_qmc(8192, 'sobol', stream(0, 'reference'))
+    print('coverage within {} degrees, mean of {} products'.format(args.angle, args.repeats))
+    print('{:>12}'.format('renders') + ''.join('{:>8}'.format(n) for n in args.renders) + '{:>10}'.format('needed'))
+    for method in SAMPLING_METHODS:
+        row = [coverage(method, n, args.angle, reference, args.repeats) for n in args.renders]
+        # bisection on the renders needed for the target coverage
+        low, high = 1, 4096
+        while low < high:
+            mid = (low + high) // 2
+            if coverage(method, mid, args.angle, reference, args.repeats) >= args.target:
+                high = mid
+            else:
+                low = mid + 1
+        print('{:>12}'.format(method) + ''.join('{:8.3f}'.format(c) for c in row) + '{:>10}'.format(low))
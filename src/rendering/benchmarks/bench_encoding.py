@@ -0,0 +1,47 @@
+"""
+Benchmark of the encoders of SceneLib.Encode_Images on a final image:
+time and size per image of every backend available in this environment.
+
+Run from the src folder:
+  python -m rendering.benchmarks.bench_encoding --n 200
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from ..SceneLib import Encode_Images as ei
+from ..SceneLib import Merge_Images as mi
+
+test_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir, os.pardir,
+                           'test_data', 'merging_tests', 'single_test')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the final image encoders')
+    parser.add_argument('--n', type=int, default=200, help='number of images per encoder')
+    parser.add_argument('--quality', type=int, default=80, help='JPEG quality')
+    parser.add_argument('--foreground', default=os.path.join(test_folder, 'render1.png'), help='RGBA object pose')
+    parser.add_argument('--background', default=os.path.join(test_folder, 'background.jpg'),
+                        help='background of the same size as the object pose')
+    args = parser.parse_args()
+
+    foreground = np.array(Image.open(args.foreground).convert('RGBA'))
+    background = np.array(Image.open(args.background).convert('RGB'))
+    final, _ = mi.composite(foreground, background)
+    image = Image.fromarray(final)
+
+    folder = tempfile.mkdtemp()
+    try:
+        print('{}x{} pixels, {} images per encoder'.format(final.shape[1], final.shape[0], args.n))
+        for name in ei.available_encoders():
+            encoder = ei.get_encoder(name, args.quality)
+            for i in range(args.n):
+                encoder.save(image, os.path.join(folder, str(i) + encoder.extension))
+            summary = encoder.stats.summary()
+            print('{:<11} {:8.3f} ms/image {:9d} bytes/image'.format(name, summary['ms_per_image'], summary['bytes_per_image']))
+    finally:
+        shutil.rmtree(folder)
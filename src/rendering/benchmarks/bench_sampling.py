@@ -0,0 +1,44 @@
+"""
+Benchmark of sampling the render parameters of a whole schedule: one
+sample_param call per render against one sample_batch call per
+distribution, for the default distributions of BlenderRandomScene.
+
+Run from the src folder:
+  python -m rendering.benchmarks.bench_sampling --n 10000
+"""
+import argparse
+import time
+
+from ..RandomLib import random_render as rr
+from ..RandomLib.random_streams import stream
+
+
+def distributions():
+    return {'camera_loc': rr.CompositeShellRingDist(phi_sigma=10.0, normals='XYZ'),
+            'camera_radius': rr.NormDist(mu=6.0, sigma=1.0),
+            'lamp_energy': rr.TruncNormDist(mu=5000.0, sigmu=0.3, l=0.0),
+            'lamp_loc': rr.UniformShellCoordinateDist(),
+            'num_lamps': rr.UniformDDist(l=2, r=5),
+            'spin_angle': rr.UniformCDist(l=0.0, r=360.0)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark scalar against batch sampling of render parameters')
+    parser.add_argument('--n', type=int, default=10000, help='number of renders in the schedule')
+    args = parser.parse_args()
+
+    print('{} renders, {} distributions'.format(args.n, len(distributions())))
+    rng = stream(0, 'scalar')
+    start = time.perf_counter()
+    for name, D in distributions().items():
+        for i in range(args.n):
+            D.sample_param(rng)
+    scalar = time.perf_counter() - start
+    print('sample_param {:10.2f} ms {:8.3f} us/render'.format(scalar*1e3, scalar*1e6/args.n))
+
+    rng = stream(0, 'batch')
+    start = time.perf_counter()
+    for name, D in distributions().items():
+        D.sample_batch(args.n, rng)
+    batch = time.perf_counter() - start
+    print('sample_batch {:10.2f} ms {:8.3f} us/render ({:.0f}x)'.format(batch*1e3, batch*1e6/args.n, scalar/batch))
@@ -0,0 +1,123 @@
+"""
+Benchmark of switching products in Blender, rebuilding the subjects for
+every product against swapping meshes and textures in a scene template
+(see BlenderRandomScene): the time of load_from_model and the growth of
+Blender's data and memory over a run of --switches products.
+
+Every mode runs in its own Blender process. Run from the src folder:
+  python -m rendering.benchmarks.bench_scene_template --blender /path/to/blender \
+      --objects ../test_data/rendering_tests/pipeline_tests/render_workspace/object_files/two_set_model_format
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import bpy
+except ImportError:
+    # run outside Blender, launches Blender for every mode
+    bpy = None
+
+MODES = ['rebuild', 'template']
+
+
+def find_models(object_folder):
+    models = []
+    for product in sorted(os.listdir(object_folder)):
+        folder = os.path.join(object_folder, product)
+        if os.path.isdir(folder):
+            models += [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith('.model')]
+    return models
+
+
+def resident_mb():
+    """
+    :return: resident memory of this process in MB, Linux only
+    """
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2.0**20
+
+
+def data_blocks():
+    return {'meshes': len(bpy.data.meshes), 'materials': len(bpy.data.materials), 'images': len(bpy.data.images)}
+
+
+def measure(args):
+    """
+    Runs inside Blender: loads --switches products one after the other and
+    dumps the time, memory and data blocks after every load as json
+    """
+    sys.path.append(args.project_dir)
+    import rendering.RenderInterface as Render
+
+    RI = Render.RenderInterface(num_images=0, resolution=args.resolution, samples=args.samples,
+                                scene_template=args.mode == 'template')
+    models = find_models(args.object_folder)
+    output_folder = tempfile.mkdtemp()
+    switches = []
+    with RI.log:
+        for i in range(args.switches):
+            start = time.time()
+            RI.load_from_model(models[i % len(models)], output_folder)
+            seconds = time.time() - start
+            if args.render:
+                RI.scene.render_to_file(os.path.join(output_folder, 'render.png'))
+            switch = {'seconds': seconds, 'resident_mb': resident_mb()}
+            switch.update(data_blocks())
+            switches.append(switch)
+    with open(args.output, 'w') as f:
+        json.dump(switches, f)
+
+
+def run_mode(args, mode):
+    output = os.path.join(tempfile.mkdtemp(), mode + '.json')
+    src_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    blender_args = [args.blender, '--background', '--python-exit-code', '2', '--python', os.path.abspath(__file__),
+                    '--', src_dir, os.path.abspath(args.objects), mode, output,
+                    '--switches', str(args.switches), '--resolution', str(args.resolution),
+                    '--samples', str(args.samples)]
+    if args.render:
+        blender_args.append('--render')
+    subprocess.check_call(blender_args, stdout=subprocess.DEVNULL)
+    with open(output) as f:
+        return json.load(f)
+
+
+if __name__ == '__main__' and bpy is not None:
+    parser = argparse.ArgumentParser(description='Product switches inside Blender')
+    parser.add_argument('project_dir')
+    parser.add_argument('object_folder')
+    parser.add_argument('mode', choices=MODES)
+    parser.add_argument('output')
+    parser.add_argument('--switches', type=int, default=10)
+    parser.add_argument('--resolution', type=int, default=64)
+    parser.add_argument('--samples', type=int, default=1)
+    parser.add_argument('--render', action='store_true')
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    measure(parser.parse_args(argv))
+
+elif __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark rebuilding the scene against a scene template')
+    parser.add_argument('--blender', required=True, help='path to the Blender executable')
+    parser.add_argument('--objects', required=True, help='folder of product folders with .model files')
+    parser.add_argument('--switches', type=int, default=10, help='products loaded one after the other')
+    parser.add_argument('--resolution', type=int, default=64, help='resolution of the renders')
+    parser.add_argument('--samples', type=int, default=1, help='Cycles samples of the renders')
+    parser.add_argument('--render', action='store_true', help='render one image after every switch')
+    args = parser.parse_args()
+
+    print('{} product switches, {} products'.format(args.switches, len(find_models(args.objects))))
+    print('{:>10}{:>12}{:>12}{:>14}{:>10}{:>12}{:>9}'.format(
+        'mode', 'first [s]', 'switch [s]', 'memory [MB]', 'meshes', 'materials', 'images'))
+    for mode in MODES:
+        switches = run_mode(args, mode)
+        later = [s['seconds'] for s in switches[1:]] or [switches[0]['seconds']]
+        last = switches[-1]
+        print('{:>10}{:>12.3f}{:>12.3f}{:>14}{:>10}{:>12}{:>9}'.format(
+            mode, switches[0]['seconds'], sum(later) / len(later),
+            '{:.0f} (+{:.0f})'.format(last['resident_mb'], last['resident_mb'] - switches[0]['resident_mb']),
+            last['meshes'], last['materials'], last['images']))
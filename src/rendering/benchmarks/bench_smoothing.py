@@ -0,0 +1,52 @@
+"""
+Micro-benchmark of the turbulence smoothing backends, reported as smoothed
+octaves (one N*N array at one scale) per second. Each round smooths one
+octave per scale used by turbulence_rgb, on a fresh noise array.
+
+Run from the src folder:
+  python -m rendering.benchmarks.bench_smoothing --size 300 --rounds 20
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ..RandomLib import turbulence as tb
+
+
+def octave_scales(max_depth=8, max_initial=3):
+    """
+    All scales smoothNoise is called with by turbulence_rgb
+    """
+    return sorted(set(initial*2**i for initial in range(1, max_initial+1) for i in range(max_depth-1)))
+
+
+def bench(method, size, rounds, batch, seed=0):
+    """
+    :return: octaves per second
+    """
+    rng = np.random.default_rng(seed)
+    scales = octave_scales()
+    # first call fills the weight cache, like the first background of a run
+    tb.smooth_noise_batch(rng.uniform(size=[batch, size, size]), scales[0], method)
+    start = time.time()
+    for r in range(rounds):
+        noise = rng.uniform(size=[batch, size, size])
+        for scale in scales:
+            if batch == 1:
+                tb.smoothNoise(noise[0], scale, method)
+            else:
+                tb.smooth_noise_batch(noise, scale, method)
+    return rounds*len(scales)*batch/(time.time() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark turbulence smoothing backends')
+    parser.add_argument('--size', type=int, default=300, help='side of the noise arrays in pixels')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=1, help='arrays smoothed per call, 1 uses smoothNoise')
+    args = parser.parse_args()
+
+    print('{}x{} noise, batch of {}'.format(args.size, args.size, args.batch))
+    for method in tb.SMOOTHING_METHODS:
+        print('{:<7} {:10.1f} octaves/s'.format(method, bench(method, args.size, args.rounds, args.batch)))
@@ -0,0 +1,109 @@
+"""
+Hash-keyed cache of extracted .model files.
+
+A .model file is a zip of one or two meshes (.obj) and their textures
+(.jpg). RenderInterface.load_from_model used to extract it into a fresh
+temporary folder every time a product was loaded. The cache extracts every
+model once, into a folder named after the hash of the .model file, and
+later loads, in this or any later run, read the extracted files directly.
+A changed .model file hashes differently and is extracted again.
+
+The cache is bounded in the number of models, evicting the least recently
+used ones. Like render_cache.RenderCache it does not need Blender and can
+be shared by several Blender processes: models are extracted to a
+temporary folder that is renamed into place.
+"""
+import fnmatch
+import os
+import shutil
+import zipfile
+
+from .render_cache import RenderCache
+
+
+def model_files(names):
+    """
+    Validates the file names of a .model file
+    :param names: names of the files in the .model
+    :return: list of the file names, ordered as [Bot.obj, Bot.jpg, Top.obj,
+        Top.jpg] for two meshes and [obj, jpg] for one
+    """
+    if not (len(names) == 4 or len(names) == 2):
+        raise ValueError('model file not correct format!')
+    if len(names) == 4:
+        if not set(['Bot.jpg', 'Bot.obj', 'Top.obj', 'Top.jpg']) == set(names):
+            raise ValueError('model file not correct format!')
+        return ['Bot.obj', 'Bot.jpg', 'Top.obj', 'Top.jpg']
+    objs = fnmatch.filter(names, '*.obj')
+    jpgs = fnmatch.filter(names, '*.jpg')
+    if not (len(jpgs) == 1 and len(objs) == 1):
+        raise ValueError('model file not correct format!')
+    return objs + jpgs
+
+
+def validate_and_extract_model(model):
+    """
+    :param model: zipfile.ZipFile of a .model file
+    :return: list of its file names, see model_files
+    """
+    return model_files(model.namelist())
+
+
+class ModelCache(object):
+    """
+    :param folder: folder of the extracted models, created if needed
+    :param max_models: number of extracted models kept, the least recently
+        used ones are evicted beyond it
+    """
+    def __init__(self, folder, max_models=256):
+        self.folder = folder
+        self.max_models = max_models
+        os.makedirs(folder, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, model_hash):
+        return os.path.join(self.folder, model_hash)
+
+    def extract(self, model_path):
+        """
+        Extracts the model at model_path, unless it was extracted before
+        :param model_path: path to the .model file
+        :return: (folder of the extracted files, list of the file names as
+            returned by model_files, hash of the .model file)
+        """
+        model_hash = RenderCache.hash_file(model_path)
+        path = self.path(model_hash)
+        if os.path.isdir(path):
+            self.hits += 1
+            os.utime(path)
+            return path, model_files(os.listdir(path)), model_hash
+
+        self.misses += 1
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        shutil.rmtree(tmp, ignore_errors=True)
+        with zipfile.ZipFile(model_path, 'r') as model:
+            files = validate_and_extract_model(model)
+            model.extractall(tmp)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # extracted by another process in the meantime
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._evict(keep=model_hash)
+        return path, files, model_hash
+
+    def _evict(self, keep):
+        entries = []
+        for name in os.listdir(self.folder):
+            path = self.path(name)
+            if name != keep and not name.endswith('.tmp') and os.path.isdir(path):
+                entries.append((os.path.getmtime(path), path))
+        for _, path in sorted(entries)[:max(0, len(entries) + 1 - self.max_models)]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.folder) if not name.endswith('.tmp'))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'models': len(self)}
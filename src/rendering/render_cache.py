@@ -0,0 +1,150 @@
+"""
+Content-addressed cache of rendered poses.
+
+A render is fully determined by the model, the render settings and the
+parameters BlenderRandomScene samples for it (lamps, camera location and
+radius, spin, subject size). The cache stores every render under the hash
+of exactly these, so a pose that is sampled again, e.g. by a repeated
+Bayesian optimization evaluation with a fixed render seed, is copied from
+disk instead of rendered.
+
+The cache is a folder of <key>.png files, bounded in size by evicting the
+least recently used renders. It does not need Blender and can be shared by
+several Blender processes: files are written atomically and a render
+inserted by another process is picked up on lookup.
+"""
+import hashlib
+import json
+import os
+import shutil
+from collections import OrderedDict
+
+
+class RenderCache(object):
+    """
+    :param folder: folder of the cached renders, created if needed
+    :param max_bytes: size bound of the cache, least recently used renders
+        are evicted beyond it
+    """
+    def __init__(self, folder, max_bytes=1 << 30):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+
+        # key -> size in bytes, least recently used first. The modification
+        # time of a file is its last use, so the order survives restarts.
+        files = []
+        for name in os.listdir(folder):
+            if name.endswith('.png'):
+                stat = os.stat(os.path.join(folder, name))
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        self.entries = OrderedDict((key, size) for _, key, size in sorted(files))
+        self.bytes = sum(self.entries.values())
+        self.reset_stats()
+        self._evict()
+
+    @staticmethod
+    def hash_file(path):
+        """
+        :return: hex digest of the contents of the file at path
+        """
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    @staticmethod
+    def key(model_hash, render_settings, sample):
+        """
+        Cache key of a render
+        :param model_hash: hash of the model file, see hash_file
+        :param render_settings: (resolution, samples)
+        :param sample: dictionary of the parameters sampled for the render,
+            see BlenderRandomScene.last_sample
+        :return: hex digest
+        """
+        payload = json.dumps([model_hash, list(render_settings), sample], sort_keys=True, default=repr)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.png')
+
+    def get(self, key, dest):
+        """
+        Copies the render cached under key to dest
+        :return: True on a hit, False on a miss
+        """
+        path = self.path(key)
+        if key not in self.entries and os.path.isfile(path):
+            # inserted by another process
+            self.entries[key] = os.path.getsize(path)
+            self.bytes += self.entries[key]
+        if key in self.entries:
+            try:
+                shutil.copyfile(path, dest)
+                os.utime(path)
+            except FileNotFoundError:
+                # evicted by another process
+                self.bytes -= self.entries.pop(key)
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True
+        self.misses += 1
+        return False
+
+    def put(self, key, src):
+        """
+        Adds the render at src to the cache under key, evicting the least
+        recently used renders if the cache grows beyond max_bytes
+        """
+        path = self.path(key)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, path)
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)
+        self.entries[key] = os.path.getsize(path)
+        self.bytes += self.entries[key]
+        self.insertions += 1
+        self._evict()
+
+    def _evict(self):
+        # the most recent render is kept, even if it is larger than max_bytes
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            self.bytes -= size
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.insertions = 0
+        self.evictions = 0
+
+    def stats(self):
+        """
+        :return: dictionary of the hit/miss counts since the last
+            reset_stats and of the current size of the cache
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.,
+                'insertions': self.insertions,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes}
+
+    def dump_stats(self, path):
+        with open(path, 'w+') as f:
+            json.dump(self.stats(), f, sort_keys=True, indent=4, separators=(',', ': '))
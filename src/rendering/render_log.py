@@ -0,0 +1,188 @@
+"""
+Log sink of a Blender session.
+
+Blender and Cycles write their progress straight to file descriptor 1. The
+RenderInterface keeps that output out of the terminal by pointing fd 1 at
+blender_render.log while it loads models and renders. RenderLog does this
+once for a whole session when used as a context manager:
+
+    log = RenderLog('blender_render.log')
+    with log:                       # fd 1 -> blender_render.log
+        with log.redirect():        # nested redirections cost nothing
+            ...
+        log.info('message')         # buffered, written to stderr
+
+Messages below the level of the log are dropped, the others are buffered
+and written to stderr in batches, by a background thread if async_flush is
+set. Errors are written at once.
+
+Per-render timings are kept as structured records and dumped as json lines
+(see record and dump_records), which read_records parses back. RenderLog
+does not need Blender.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+
+class RenderLog(object):
+    """
+    :param path: file fd 1 is redirected to
+    :param level: messages below this level are dropped
+    :param stream: stream the messages are written to, default sys.stderr
+    :param buffer_lines: number of messages buffered before they are written
+    :param async_flush: if True, a background thread writes the buffered
+        messages every flush_interval seconds
+    :param flush_interval: seconds between background flushes
+    """
+    def __init__(self, path='blender_render.log', level=INFO, stream=None, buffer_lines=64, async_flush=False,
+                 flush_interval=1.0):
+        self.path = path
+        self.level = level
+        self.stream = stream
+        self.buffer_lines = buffer_lines
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.pending_records = []
+
+        # fd 1 redirection, counted so that nested redirections are free
+        self.depth = 0
+        self.saved_fd = None
+        self.log_fd = None
+
+        self.flush_interval = flush_interval
+        self.closed = threading.Event()
+        self.flusher = None
+        if async_flush:
+            self.flusher = threading.Thread(target=self._flush_loop, name='RenderLog flush')
+            self.flusher.daemon = True
+            self.flusher.start()
+
+    # ********************** fd 1 redirection **********************
+    def begin_redirect(self):
+        if self.depth == 0:
+            sys.stdout.flush()
+            self.log_fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            self.saved_fd = os.dup(1)
+            os.dup2(self.log_fd, 1)
+        self.depth += 1
+
+    def end_redirect(self):
+        if self.depth == 0:
+            raise RuntimeError('end_redirect called without begin_redirect')
+        self.depth -= 1
+        if self.depth == 0:
+            sys.stdout.flush()
+            os.dup2(self.saved_fd, 1)
+            os.close(self.saved_fd)
+            os.close(self.log_fd)
+            self.saved_fd = None
+            self.log_fd = None
+
+    @contextmanager
+    def redirect(self):
+        """
+        Redirects fd 1 to the log file for the duration of the block. Only
+        the outermost redirection touches file descriptors
+        """
+        self.begin_redirect()
+        try:
+            yield self
+        finally:
+            self.end_redirect()
+
+    def __enter__(self):
+        self.begin_redirect()
+        return self
+
+    def __exit__(self, *exc):
+        self.end_redirect()
+        self.flush()
+        return False
+
+    # ********************** messages **********************
+    def log(self, level, message):
+        if level < self.level:
+            return
+        with self.lock:
+            self.buffer.append(message)
+            full = len(self.buffer) >= self.buffer_lines
+        if full or level >= ERROR:
+            self.flush()
+
+    def debug(self, message):
+        self.log(DEBUG, message)
+
+    def info(self, message):
+        self.log(INFO, message)
+
+    def warning(self, message):
+        self.log(WARNING, message)
+
+    def error(self, message):
+        self.log(ERROR, message)
+
+    def flush(self):
+        """
+        Writes the buffered messages
+        """
+        with self.lock:
+            lines, self.buffer = self.buffer, []
+        if lines:
+            stream = self.stream or sys.stderr
+            stream.write('\n'.join(lines) + '\n')
+            stream.flush()
+
+    def _flush_loop(self):
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """
+        Stops the background flushes and writes the buffered messages
+        """
+        self.closed.set()
+        if self.flusher is not None:
+            self.flusher.join()
+            self.flusher = None
+        self.flush()
+
+    # ********************** structured records **********************
+    def record(self, **fields):
+        """
+        Keeps a structured record, e.g. the timing of a render, until
+        dump_records
+        """
+        fields.setdefault('time', time.time())
+        self.pending_records.append(fields)
+
+    def clear_records(self):
+        self.pending_records = []
+
+    def dump_records(self, path):
+        """
+        Appends the kept records to path as json lines and forgets them
+        """
+        with open(path, 'a') as f:
+            for record in self.pending_records:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+        self.clear_records()
+
+
+def read_records(path):
+    """
+    :param path: json lines file written by RenderLog.dump_records
+    :return: list of record dictionaries, empty if there is no file
+    """
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
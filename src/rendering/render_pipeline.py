@@ -20,7 +20,7 @@ python -m rendering.render_pipeline
 """
 
 import sys
-from shutil import rmtree, make_archive
+from shutil import rmtree, make_archive, copytree, copyfile
 from shutil import move as sh_move
 from PIL import Image
 import numpy as np
@@ -29,6 +29,12 @@ import subprocess
 import json
 import datetime
 import time
+import tempfile
+import uuid
+import random
+import re
+import threading
+import multiprocessing
 
 """
 Here the paths have to be set up.
@@ -67,7 +73,18 @@ if not src_path in sys.path:
 
 
 from .SceneLib import Merge_Images as mi
+from .SceneLib.Encode_Images import get_encoder, EncodingStats
+from .SceneLib.Shard_Images import ShardWriter
 from .RandomLib import random_background as rb
+from .RandomLib.background_bank import BackgroundBank
+from .RandomLib.random_streams import stream, stream_seed
+from .render_server import RenderServerClient, RenderServerError, wait_for_port
+from .run_manifest import RunManifest, hash_folder, hash_params
+from .render_schedule import write_schedules, schedule_name, scene_distributions
+from .RandomLib.param_log import save_logs, load_logs
+from .RandomLib.low_discrepancy import SAMPLING_METHODS, view_coverage
+from .render_log import read_records
+from .render_quality import QUALITY_PRESETS
 
 """------------ Create Slack reporter ----------- """
 from . import SlackReporter
@@ -89,6 +106,8 @@ data_folders = ['object_files',
 # Folders to be destroyed at the end of the run
 temp_folders = ['generate_bg',
                 'object_poses',
+                'object_poses_workers',
+                'render_schedule',
                 #'final_folder/images',
                 'final_folder']
 
@@ -127,7 +146,7 @@ def destroy_folders(target_folder, folder_list):
 
 
 """------------ Helper functions ----------- """
-def generate_poses(src_dir, blender_path, object_folder, output_folder, renders_per_product, blender_attributes, visualize_dump=False, dry_run_mode=False, render_resolution=300, render_samples=128):
+def generate_poses(src_dir, blender_path, object_folder, output_folder, renders_per_product, blender_attributes, visualize_dump=False, dry_run_mode=False, render_resolution=300, render_samples=128, products=None, render_offset=0, render_seed=None, render_cache=None, render_cache_size=1024, render_schedule=None, model_cache=None, scene_template=False, batch_views=1, render_quality=None):
     """
     Make a system call to Blender, passing the configuration for this run
     and wait for Blender to return.
@@ -139,6 +158,36 @@ def generate_poses(src_dir, blender_path, object_folder, output_folder, renders_
         output_folder: path to which Blender should save the rendered images
         renders_per_product: number of images to generate per product (.obj file)
         blender_attributes: a dictionary of Blender configurations.
+        products: list of product folder names to render, see
+            blender_command. Default = None, every product
+        render_offset: index of the first render of every product.
+            Default = 0
+        render_seed: seed of the sampled poses, every render of every
+            product is sampled from its own stream of it (see
+            RandomLib.random_streams), so the poses do not depend on how
+            the renders are split. Default = None, unseeded
+        render_cache: folder of a render cache (see render_cache.py), poses
+            sampled before are copied from it instead of rendered.
+            Default = None, no cache
+        render_cache_size: size bound of the render cache in MB
+        render_schedule: folder of render schedules (see
+            render_schedule.write_schedules), every render is set up with
+            its row of the schedule of its product instead of being
+            sampled in Blender. Default = None, sampled in Blender
+        model_cache: folder of a model cache (see model_cache.py), every
+            .model file is extracted into it once and reused by later
+            runs. Default = None, extracted into a temporary folder
+        scene_template: if True, Blender creates the subjects and their
+            materials once and only swaps meshes and textures between
+            products (see BlenderRandomScene). Default = False
+        batch_views: number of views Blender renders per scene. Above 1,
+            every batch of batch_views renders shares the lamps and the
+            subject size of its first render and is rendered as one
+            animation, so Cycles keeps the scene between the views (see
+            RenderInterface.render_all). Default = 1, one scene per render
+        render_quality: name of a quality preset of the Cycles settings
+            (see render_quality.py), render_samples is then ignored.
+            Default = None, render_samples with the 'train' settings
 
     Passing Rendering Parameters to Blender:
         Rendering parameters should be passed to Blender in a dictionary of the format
@@ -164,6 +213,38 @@ def generate_poses(src_dir, blender_path, object_folder, output_folder, renders_
     print("Project source dir is", src_dir)
     print("Blender path is ", blender_path)
 
+    blender_args = blender_command(src_dir, blender_path, object_folder, output_folder, renders_per_product,
+                                   blender_attributes, visualize_dump, dry_run_mode, render_resolution, render_samples,
+                                   products, render_offset, render_seed, render_cache, render_cache_size, render_schedule,
+                                   model_cache, scene_template, batch_views, render_quality)
+
+    print('\n')
+    print(' ============================ LAUNCHING BLENDER FOR POSE RENDERING ============================')
+    print('\n')
+    try:
+        subprocess.check_call(blender_args)
+    except subprocess.CalledProcessError as e:
+        raise RenderPipelineError("Error during pose generation! The returned subprocess error code is : {}".format(e.returncode))
+    print('\n')
+    print(' ============================ CLOSING BLENDER FOR POSE RENDERING ============================')
+    print('\n')
+
+
+def blender_command(src_dir, blender_path, object_folder, output_folder, renders_per_product, blender_attributes, visualize_dump=False, dry_run_mode=False, render_resolution=300, render_samples=128, products=None, render_offset=0, render_seed=None, render_cache=None, render_cache_size=1024, render_schedule=None, model_cache=None, scene_template=False, batch_views=1, render_quality=None):
+    """
+    Assemble the command line that launches Blender with render_poses.py.
+    See generate_poses for a description of the arguments.
+
+    args:
+        products: list of product folder names this Blender process should
+            render. None renders every product in object_folder
+        render_offset: index of the first render of every product
+        render_seed, render_cache, render_cache_size, render_schedule,
+            model_cache, scene_template, batch_views, render_quality: see
+            generate_poses
+    returns:
+        list of strings, to be passed to subprocess
+    """
     blender_script_path = os.path.join(src_dir, 'rendering', 'render_poses.py')
     blender_args = [blender_path, '--background', '--python-exit-code', '2','--python', blender_script_path, '--',
                     src_dir,
@@ -175,20 +256,449 @@ def generate_poses(src_dir, blender_path, object_folder, output_folder, renders_
                     json.dumps(blender_attributes),
                     str(visualize_dump),
                     str(dry_run_mode)]
+    if products is not None:
+        blender_args += ['--products', json.dumps(products)]
+    if render_offset:
+        blender_args += ['--render_offset', str(render_offset)]
+    if render_seed is not None:
+        blender_args += ['--seed', str(render_seed)]
+    if render_cache is not None:
+        blender_args += ['--render_cache', os.path.abspath(render_cache), '--render_cache_size', str(render_cache_size)]
+    if render_schedule is not None:
+        blender_args += ['--schedule', os.path.abspath(render_schedule)]
+    if model_cache is not None:
+        blender_args += ['--model_cache', os.path.abspath(model_cache)]
+    if scene_template:
+        blender_args += ['--scene_template']
+    if batch_views > 1:
+        blender_args += ['--batch_views', str(batch_views)]
+    if render_quality is not None:
+        blender_args += ['--quality', render_quality]
+    return blender_args
+
+
+def shard_products(products, renders_per_product, workers, split_renders=False):
+    """
+    Split the rendering work between several Blender processes.
+    By default every worker gets a subset of the products and renders all
+    poses of them. With split_renders, every worker renders every product
+    but only a contiguous part of the renders_per_product range, which is
+    useful when there are fewer products than workers.
+
+    args:
+        products: list of product folder names
+        renders_per_product: number of renders per product
+        workers: maximum number of concurrent Blender processes
+        split_renders: shard the render range instead of the products
+    returns:
+        list of shards, each a dict with keys 'products', 'offset', 'count'
+    """
+    if workers < 1:
+        raise RenderPipelineError("Number of render workers has to be at least 1")
+    products = sorted(products)
+    shards = []
+    if split_renders:
+        n_shards = min(workers, renders_per_product)
+        offset = 0
+        for i in range(n_shards):
+            count = renders_per_product // n_shards + (1 if i < renders_per_product % n_shards else 0)
+            shards.append({'products': products, 'offset': offset, 'count': count})
+            offset += count
+    else:
+        n_shards = min(workers, len(products))
+        for i in range(n_shards):
+            shards.append({'products': products[i::n_shards], 'offset': 0, 'count': renders_per_product})
+    return shards
+
+
+def merge_stats(stats_folders, output_stats):
+    """
+    Merge the stats dumps of several Blender processes that rendered parts
+    of the same product. The sampled variables are concatenated in the order
+    of stats_folders, the distribution parameters are identical for all
+    workers so the first dump is kept. Variables dumped as json by older
+    runs are read as well, the merged variables are saved as .npz
+
+    args:
+        stats_folders: list of paths to 'stats' folders, ordered by render offset
+        output_stats: path to the merged 'stats' folder
+    """
+    logs = {}
+    params = None
+    cache_stats = None
+    records = []
+    for folder in stats_folders:
+        for vars_dump in [os.path.join(folder, 'randomvars_dump.npz'), os.path.join(folder, 'randomvars_dump.json')]:
+            if os.path.isfile(vars_dump):
+                for key, values in load_logs(vars_dump).items():
+                    logs.setdefault(key, []).append(values)
+                break
+        params_dump = os.path.join(folder, 'randomparams_dump.json')
+        if params is None and os.path.isfile(params_dump):
+            with open(params_dump) as f:
+                params = json.load(f)
+        cache_dump = os.path.join(folder, 'render_cache.json')
+        if os.path.isfile(cache_dump):
+            with open(cache_dump) as f:
+                cache_stats = merge_cache_stats(cache_stats, json.load(f))
+        records += read_records(os.path.join(folder, 'render_log.jsonl'))
+
+    if not os.path.isdir(output_stats):
+        os.makedirs(output_stats)
+    save_logs(os.path.join(output_stats, 'randomvars_dump.npz'),
+              {key: np.concatenate([v for v in values if len(v)] or values) for key, values in logs.items()})
+    if params is not None:
+        with open(os.path.join(output_stats, 'randomparams_dump.json'), "w+") as f:
+            json.dump(params, f, sort_keys=True, indent=4, separators=(',', ': '))
+    if cache_stats is not None:
+        with open(os.path.join(output_stats, 'render_cache.json'), "w+") as f:
+            json.dump(cache_stats, f, sort_keys=True, indent=4, separators=(',', ': '))
+    if records:
+        with open(os.path.join(output_stats, 'render_log.jsonl'), "w+") as f:
+            for record in records:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def merge_cache_stats(total, stats):
+    """
+    Add up the render cache stats of two Blender processes. The cache is
+    shared, so its size is that of the last dump.
+    """
+    if total is None:
+        return dict(stats)
+    total = dict(stats, **{key: total[key] + stats[key] for key in ['hits', 'misses', 'insertions', 'evictions']})
+    lookups = total['hits'] + total['misses']
+    total['hit_rate'] = total['hits'] / lookups if lookups else 0.
+    return total
+
+
+def dump_coverage(stats_folder, blender_attributes=None, angle=10.0, references=4096):
+    """
+    Dumps the coverage of the camera and lamp directions sampled for a
+    product (see RandomLib.low_discrepancy.view_coverage) to coverage.json
+    in its stats folder. The reference directions are a fixed, evenly
+    spread sample of the distributions of blender_attributes.
+
+    args:
+        stats_folder: path to the 'stats' folder of the product
+        blender_attributes: attributes the product was rendered with
+        angle: angle in degrees within which a reference direction is covered
+        references: number of reference directions
+    returns:
+        dictionary of attribute name -> coverage, None without sampled variables
+    """
+    for name in ['randomvars_dump.npz', 'randomvars_dump.json']:
+        vars_dump = os.path.join(stats_folder, name)
+        if os.path.isfile(vars_dump):
+            break
+    else:
+        return None
+    logs = load_logs(vars_dump)
+    distributions = scene_distributions(blender_attributes)
+    coverage = {}
+    for attr in ['camera_loc', 'lamp_loc']:
+        if attr in logs and distributions[attr].dims is not None:
+            reference = distributions[attr].sample_qmc(references, 'sobol', np.random.default_rng(0))
+            coverage[attr] = view_coverage(logs[attr], reference, angle)
+    with open(os.path.join(stats_folder, 'coverage.json'), "w+") as f:
+        json.dump(coverage, f, sort_keys=True, indent=4, separators=(',', ': '))
+    return coverage
+
+
+def dump_render_times(stats_folder):
+    """
+    Summarizes the timing of every render of a product, parsed from the
+    render_log.jsonl Blender dumps with its stats (see render_log), into
+    render_times.json in the same folder
+
+    args:
+        stats_folder: path to the 'stats' folder of the product
+    returns:
+        dictionary with the number of renders, how many came from the
+        render cache, and the total, mean and largest render time in
+        seconds, the renders per minute, the mean Cycles samples and the
+        quality presets of the renders. None without render log
+    """
+    records = [r for r in read_records(os.path.join(stats_folder, 'render_log.jsonl')) if 'seconds' in r]
+    if not records:
+        return None
+    seconds = [r['seconds'] for r in records]
+    times = {'renders': len(records),
+             'cached': sum(1 for r in records if r.get('cached')),
+             'seconds': sum(seconds),
+             'mean_seconds': sum(seconds) / len(seconds),
+             'max_seconds': max(seconds)}
+    times['images_per_minute'] = 60.0 * len(seconds) / times['seconds'] if times['seconds'] > 0 else None
+    samples = [r['samples'] for r in records if r.get('samples') is not None]
+    times['mean_samples'] = sum(samples) / len(samples) if samples else None
+    times['quality'] = sorted(set(r['quality'] for r in records if r.get('quality') is not None))
+    with open(os.path.join(stats_folder, 'render_times.json'), "w+") as f:
+        json.dump(times, f, sort_keys=True, indent=4, separators=(',', ': '))
+    return times
+
+
+def product_seed(seed, product):
+    """
+    Seed of the poses of a product, as render_poses.py derives it. Each
+    render of the product is then sampled from its own stream, see
+    RenderInterface.render_all, so the seed does not depend on the render
+    offset
+    """
+    if seed is None:
+        return None
+    return stream_seed(seed, product)
+
+
+def merge_worker_outputs(worker_folders, output_folder):
+    """
+    Move the renders of all workers into output_folder/<product> and merge
+    their stats dumps.
+
+    args:
+        worker_folders: list of worker output folders, ordered by render offset
+        output_folder: folder the merged product folders are created in
+    """
+    products = set()
+    for worker_folder in worker_folders:
+        if os.path.isdir(worker_folder):
+            products.update(p for p in os.listdir(worker_folder) if os.path.isdir(os.path.join(worker_folder, p)))
+
+    for product in sorted(products):
+        product_folder = os.path.join(output_folder, product)
+        if not os.path.isdir(product_folder):
+            os.mkdir(product_folder)
+        stats_folders = []
+        for worker_folder in worker_folders:
+            worker_product = os.path.join(worker_folder, product)
+            if not os.path.isdir(worker_product):
+                continue
+            for image in os.listdir(worker_product):
+                if image.endswith('.png'):
+                    sh_move(os.path.join(worker_product, image), os.path.join(product_folder, image))
+            stats_folders.append(os.path.join(worker_product, 'stats'))
+        merge_stats(stats_folders, os.path.join(product_folder, 'stats'))
+
+
+def generate_poses_parallel(src_dir, blender_path, object_folder, output_folder, renders_per_product, blender_attributes, visualize_dump=False, dry_run_mode=False, render_resolution=300, render_samples=128, workers=2, split_renders=False, worker_root=None, products=None, render_offset=0, render_seed=None, render_cache=None, render_cache_size=1024, render_schedule=None, model_cache=None, scene_template=False, batch_views=1, render_quality=None):
+    """
+    Same as generate_poses, but shards the products (or with split_renders
+    the render range) over several concurrent Blender processes.
+    Every worker renders into its own subfolder of worker_root, which are
+    merged into output_folder once all workers have returned. A failing
+    worker does not stop the others, its renders are merged as far as they
+    got and its folder and blender_render.log are kept for inspection.
+
+    args:
+        workers: number of concurrent Blender processes
+        split_renders: shard the renders_per_product range instead of the
+            products, see shard_products
+        worker_root: folder for the worker subfolders.
+            Default = output_folder + '_workers'
+        products: list of product folder names to render.
+            Default = None, every product
+        render_offset: index of the first render of every product.
+            Default = 0
+        For the remaining arguments see generate_poses
+    returns:
+        failures: dictionary of worker index -> returned error code, empty
+            if all workers succeeded
+    """
+    object_folder = os.path.abspath(object_folder)
+    output_folder = os.path.abspath(output_folder)
+    if worker_root is None:
+        worker_root = output_folder.rstrip(os.sep) + '_workers'
+    if not os.path.isdir(worker_root):
+        os.makedirs(worker_root)
+
+    products = [p for p in os.listdir(object_folder) if os.path.isdir(os.path.join(object_folder, p))
+                and (products is None or p in products)]
+    shards = shard_products(products, renders_per_product, workers, split_renders)
+    for shard in shards:
+        shard['offset'] += render_offset
 
     print('\n')
-    print(' ============================ LAUNCHING BLENDER FOR POSE RENDERING ============================')
+    print(' ============================ LAUNCHING {} BLENDER WORKERS FOR POSE RENDERING ============================'.format(len(shards)))
     print('\n')
-    try:
-        subprocess.check_call(blender_args)
-    except subprocess.CalledProcessError as e:
-        raise RenderPipelineError("Error during pose generation! The returned subprocess error code is : {}".format(e.returncode))
+    processes = []
+    worker_folders = []
+    for i, shard in enumerate(shards):
+        worker_folder = os.path.join(worker_root, 'worker{}'.format(i))
+        if not os.path.isdir(worker_folder):
+            os.mkdir(worker_folder)
+        worker_folders.append(worker_folder)
+        blender_args = blender_command(src_dir, blender_path, object_folder, worker_folder, shard['count'],
+                                       blender_attributes, visualize_dump, dry_run_mode, render_resolution,
+                                       render_samples, shard['products'], shard['offset'],
+                                       render_seed, render_cache, render_cache_size, render_schedule, model_cache,
+                                       scene_template, batch_views, render_quality)
+        print("Worker {}: products {}, renders {} to {}".format(
+            i, shard['products'], shard['offset'], shard['offset'] + shard['count'] - 1))
+        # run every worker in its own folder so the blender_render.log files do not clash
+        processes.append(subprocess.Popen(blender_args, cwd=worker_folder))
+
+    failures = {}
+    for i, process in enumerate(processes):
+        returncode = process.wait()
+        if returncode != 0:
+            failures[i] = returncode
+            print("Worker {} failed with error code {}, see {}".format(
+                i, returncode, os.path.join(worker_folders[i], 'blender_render.log')))
+
+    merge_worker_outputs(worker_folders, output_folder)
+    for i, worker_folder in enumerate(worker_folders):
+        if i not in failures:
+            rmtree(worker_folder)
+
     print('\n')
-    print(' ============================ CLOSING BLENDER FOR POSE RENDERING ============================')
+    print(' ============================ CLOSING BLENDER WORKERS FOR POSE RENDERING ============================')
     print('\n')
 
+    if len(failures) == len(shards):
+        raise RenderPipelineError("Error during pose generation! All {} workers failed, returned error codes are : {}".format(len(shards), failures))
+    if failures:
+        slack.send_message('{} of {} render workers failed: {}'.format(len(failures), len(shards), failures),
+                           'Rendering Worker Failure', 'warning')
+    return failures
+
+
+def find_model(product_folder):
+    """Return the name of the .model file in a folder"""
+    for file in os.listdir(product_folder):
+        if file.endswith('.model'):
+            return file
+
 
-def gen_merge(image, save_as, pixels=300, adjust_brightness = False):
+class BlenderRenderServer(object):
+    """
+    Keeps one Blender process with render_server.py alive, so several runs
+    (e.g. the evaluations of a Bayesian optimization) do not pay Blender
+    startup, scene setup and Cycles warm-up again. Pass an instance to
+    full_run through its render_server argument.
+
+    Usage:
+        with BlenderRenderServer(blender_path) as server:
+            full_run(..., render_server=server)
+    """
+    def __init__(self, blender_path, src_dir=None, render_resolution=300, render_samples=128, timeout=120.0, render_cache=None, render_cache_size=1024, model_cache=None, scene_template=False):
+        """
+        args:
+            blender_path: path to the Blender executable
+            src_dir: full path to project source code. Default is the src
+                folder of this project
+            render_resolution: initial resolution of the renders
+            render_samples: initial number of Cycles samples
+            timeout: seconds to wait for Blender to start listening
+            render_cache: folder of a render cache used for all jobs, see
+                generate_poses. Default = None, no cache
+            render_cache_size: size bound of the render cache in MB
+            model_cache: folder of a model cache used for all jobs, see
+                generate_poses. Default = None, no cache
+            scene_template: if True, the server keeps the subjects and
+                their materials between jobs, see generate_poses
+        """
+        self.blender_path = blender_path
+        self.src_dir = src_dir if src_dir is not None else src_path
+        self.render_resolution = render_resolution
+        self.render_samples = render_samples
+        self.timeout = timeout
+        self.render_cache = os.path.abspath(render_cache) if render_cache is not None else None
+        self.render_cache_size = render_cache_size
+        self.model_cache = os.path.abspath(model_cache) if model_cache is not None else None
+        self.scene_template = scene_template
+        self.process = None
+        self.client = None
+
+    def start(self):
+        """
+        Launches Blender and connects to the render server in it
+        """
+        # the server binds a port picked by the OS and reports it in port_file
+        port_folder = tempfile.mkdtemp()
+        port_file = os.path.join(port_folder, 'port')
+        authkey = uuid.uuid4().hex
+
+        server_script = os.path.join(self.src_dir, 'rendering', 'render_server.py')
+        blender_args = [self.blender_path, '--background', '--python-exit-code', '2', '--python', server_script, '--',
+                        self.src_dir, '0', authkey, '--port_file', port_file,
+                        '--resolution', str(self.render_resolution),
+                        '--samples', str(self.render_samples)]
+        if self.scene_template:
+            blender_args += ['--scene_template']
+        print(' ============================ LAUNCHING BLENDER RENDER SERVER ============================')
+        self.process = subprocess.Popen(blender_args)
+        alive = lambda: self.process.poll() is None
+        try:
+            port = wait_for_port(port_file, timeout=self.timeout, alive=alive)
+            self.client = RenderServerClient(('localhost', port), authkey.encode(), timeout=self.timeout, alive=alive)
+        except RenderServerError as e:
+            self.stop()
+            raise RenderPipelineError("Could not start the Blender render server: {}".format(e.value))
+        finally:
+            rmtree(port_folder, ignore_errors=True)
+        return self
+
+    def stop(self):
+        """
+        Shuts the render server down and waits for Blender to exit
+        """
+        if self.client is not None:
+            try:
+                self.client.shutdown()
+            except (RenderServerError, EOFError, OSError):
+                pass
+            self.client = None
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+        print(' ============================ CLOSING BLENDER RENDER SERVER ============================')
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def generate_poses(self, object_folder, output_folder, renders_per_product, blender_attributes, visualize_dump=False, dry_run_mode=False, render_resolution=300, render_samples=128, products=None, render_offset=0, render_seed=None, render_schedule=None, batch_views=1, render_quality=None):
+        """
+        Drop-in replacement for the module level generate_poses, rendering
+        every product of object_folder through the running server.
+        See generate_poses for a description of the arguments.
+        """
+        if self.client is None:
+            raise RenderPipelineError("The Blender render server is not running, call start() first")
+        for product in sorted(os.listdir(object_folder)):
+            if products is not None and product not in products:
+                continue
+            product_folder = os.path.join(object_folder, product)
+            if not os.path.isdir(product_folder):
+                print("RENDER SERVER: Couldn't find {} object folder! Skipping".format(product))
+                continue
+            render_folder = os.path.join(output_folder, product)
+            if not os.path.isdir(render_folder):
+                os.mkdir(render_folder)
+            model_file = find_model(product_folder)
+            if model_file is None:
+                print("RENDER SERVER: No model file in {}! Skipping".format(product_folder))
+                continue
+            schedule = None
+            if render_schedule is not None:
+                schedule = os.path.abspath(os.path.join(render_schedule, schedule_name(product)))
+            try:
+                reply = self.client.render(os.path.abspath(os.path.join(product_folder, model_file)),
+                                           os.path.abspath(render_folder), renders_per_product, blender_attributes,
+                                           render_resolution, render_samples, visualize_dump, dry_run_mode,
+                                           render_offset, product_seed(render_seed, product),
+                                           self.render_cache, self.render_cache_size, schedule, self.model_cache,
+                                           batch_views, render_quality)
+            except RenderServerError as e:
+                raise RenderPipelineError("Error during pose generation of {}! The render server returned : {}".format(product, e.value))
+            print("RENDER SERVER: rendered {} in {:.1f}s".format(product, reply['time']))
+
+
+def gen_merge(image, save_as, pixels=300, adjust_brightness = False, background_bank = None, encoder = 'pil', rng = np.random):
     """
     This functionw will be called whenever you need to generate your own
     background. Instead of generating large quanta and randomly searching
@@ -206,13 +716,27 @@ def gen_merge(image, save_as, pixels=300, adjust_brightness = False):
         adjust_brigtness (boolean): Whether the brigthness of the background
             should be adjusted to match on average the brightness of the
             foreground image. Default = False
+        background_bank (BackgroundBank): If given, the background is drawn
+            from this bank of pre-generated backgrounds instead of being
+            generated. Default = None
+        encoder (string or ImageEncoder): encoder the final image is
+            written with, see SceneLib.Encode_Images. Default = 'pil'
+        rng: numpy Generator or RandomState the background and offset are
+            drawn from, see RandomLib.random_streams. Default = the global
+            numpy state
 
     returns:
         bbox - bounding box information around the object after translation
     """
 
-    back = rb.rand_background(np.random.randint(2,4),pixels)
-    scaled = back*256
+    if background_bank is not None:
+        if background_bank.size != pixels:
+            raise RenderPipelineError("Background bank holds %dpx backgrounds, %dpx are needed" % (background_bank.size, pixels))
+        scaled = background_bank.sample(rng).astype(float)
+    else:
+        integers = rng.integers if hasattr(rng, 'integers') else rng.randint
+        back = rb.rand_background(integers(2,4),pixels,rng)
+        scaled = back*256
 
     if adjust_brightness:
         for_array = np.array(image)
@@ -233,16 +757,34 @@ def gen_merge(image, save_as, pixels=300, adjust_brightness = False):
         scaled[scaled>255]=255
 
     background = Image.fromarray(scaled.astype('uint8'), mode = "RGB")
-    final, bbox = mi.merge_images(image, background)
+    final, bbox = mi.merge_images(image, background, rng)
 
     try:
-        final.save(save_as, "JPEG", quality=80, optimize=True, progressive=True)
+        get_encoder(encoder).save(final, save_as)
         return bbox
     except Exception as e:
         #slack.send_message('Error in gen_merge. Output file: ' + save_as, 'Rendering Error', 'warning')
         raise RenderPipelineError("Error during image merging!")
 
-def random_bg_for_all_objects(objects_folder, final_folder, adjust_brightness = False, n_of_pixels = 300):
+def _random_bg_task(task):
+    """
+    Process pool entry point of random_bg_for_all_objects.
+    Returns the bounding box (None if the pose is skipped) and the copy of
+    the encoder that wrote the image, see Merge_Images._add_background_task
+    """
+    path, save_to, n_of_pixels, adjust_brightness, seed, background_bank, encoder = task
+    rng = stream(seed)
+    encoder = get_encoder(encoder).fresh()
+    try:
+        foreground = Image.open(path)
+    except:
+        print("skipping", os.path.basename(path))
+        return None, encoder
+    bbox = gen_merge(foreground, save_to, n_of_pixels, adjust_brightness, background_bank, encoder, rng)
+    foreground.close()
+    return bbox, encoder
+
+def random_bg_for_all_objects(objects_folder, final_folder, adjust_brightness = False, n_of_pixels = 300, workers = 1, seed = None, background_bank = None, encoder = 'pil'):
     """
     Provides interface for gen_merge for large number of images.
     For each object pose (image) in objects_folder, generates a random colour
@@ -254,29 +796,377 @@ def random_bg_for_all_objects(objects_folder, final_folder, adjust_brightness =
         adjust_brightness (bool): If the background brightness should be
                 adjusted to match the foreground brightness
         n_ox_pixels (int): the size of one side of the final square image.
+        workers (int): number of processes merging images. Default = 1
+        seed (int): seed of the run, every image is seeded from it and its
+                name so the result does not depend on workers.
+                Default = None, draws a seed from numpy
+        background_bank (BackgroundBank): bank to draw the backgrounds from
+                instead of generating them, see gen_merge. Default = None
+        encoder (string or ImageEncoder): encoder of the final images, the
+                file extension follows it. The encoding stats of all images
+                are added to the stats of an ImageEncoder. Default = 'pil'
     returns:
         bboxes: Dictionary of bounding boxes for each object
     """
-    bboxes = {}
+    seed = mi.run_seed(seed)
+    encoder = get_encoder(encoder)
+    tasks = []
+    names = []
     # for each object pose
-    for image in os.listdir(objects_folder):
+    for image in sorted(os.listdir(objects_folder)):
         path = os.path.join(objects_folder, image)
-        try:
-            foreground = Image.open(path)
-        except:
-            print("skipping", image)
+        if os.path.isdir(path):
             continue
-
         just_name = os.path.splitext(image)[0]
-        name_jpg = just_name + ".jpg"
+        name_jpg = just_name + encoder.extension
         save_to = os.path.join(final_folder, name_jpg)
-        bbox = gen_merge(foreground, save_to, n_of_pixels, adjust_brightness)
-        bboxes[name_jpg] = bbox
-        foreground.close()
+        tasks.append((path, save_to, n_of_pixels, adjust_brightness, mi.image_seed(seed, image), background_bank, encoder))
+        names.append(name_jpg)
 
+    bboxes = {}
+    for name_jpg, (bbox, worker_encoder) in zip(names, mi.map_images(_random_bg_task, tasks, workers)):
+        encoder.collect(worker_encoder)
+        if bbox is not None:
+            bboxes[name_jpg] = bbox
+
+    return bboxes
+
+def batch_merge_all_objects(objects_folder, final_folder, generate_background, background_database=None, adjust_brightness=False, n_of_pixels=300, seed=None, background_bank=None, background_index=None, batch_size=32, encoder='pil'):
+    """
+    Merge every object pose in objects_folder with a background using the
+    batched compositor (Merge_Images.composite_batch). Poses are decoded
+    batch_size at a time and merged with a stack of backgrounds in a few
+    array operations; generated backgrounds are produced with
+    random_background.rand_background_batch.
+
+    All random choices of a folder come from a single random stream seeded
+    with seed, so the result is reproducible, but differs from the per
+    image path of random_bg_for_all_objects and generate_for_all_objects.
+    The brightness adjustment is that of Merge_Images.add_background.
+
+    args:
+        objects_folder (string): path to folder containing object poses
+        final_folder (string): path to destination folder for the final images
+        generate_background, background_database, adjust_brightness,
+            n_of_pixels, background_bank, background_index: see merge_pose
+        seed (int): seed of the folder. Default = None, draws a seed from numpy
+        batch_size (int): number of poses merged at once
+        encoder (string or ImageEncoder): see random_bg_for_all_objects
+    returns:
+        bboxes: Dictionary of bounding boxes for each object
+    """
+    rng = np.random.default_rng(mi.run_seed(seed))
+    encoder = get_encoder(encoder)
+    if not generate_background and background_index is None:
+        all_backgrounds = sorted(os.listdir(background_database))
+
+    images = sorted(os.listdir(objects_folder))
+
+    bboxes = {}
+    for start in range(0, len(images), batch_size):
+        names = []
+        poses = []
+        for image in images[start:start+batch_size]:
+            try:
+                with Image.open(os.path.join(objects_folder, image)) as foreground:
+                    pose = np.array(foreground.convert('RGBA'))
+            except Exception:
+                print("skipping", image)
+                continue
+            if pose.shape[:2] != (n_of_pixels, n_of_pixels):
+                raise RenderPipelineError("Resolution of the object pose {} does not match the given number of pixels".format(image))
+            names.append(os.path.splitext(image)[0] + encoder.extension)
+            poses.append(pose)
+        if not poses:
+            continue
+        foregrounds = np.stack(poses)
+        n = len(foregrounds)
+        if generate_background and background_bank is not None:
+            backgrounds = np.stack([background_bank.sample(rng) for i in range(n)])
+        elif generate_background:
+            backgrounds = rb.rand_background_batch(n, n_of_pixels, rng)
+        elif background_index is not None:
+            backgrounds = np.stack([background_index.get(i) for i in rng.integers(0, len(background_index), n)])
+        else:
+            backgrounds = []
+            for i in rng.integers(0, len(all_backgrounds), n):
+                try:
+                    with Image.open(os.path.join(background_database, all_backgrounds[i])) as background:
+                        backgrounds.append(np.array(mi.fit_background(background, n_of_pixels).convert('RGB')))
+                except Exception as e:
+                    raise RenderPipelineError("Invalid background image {}: {}".format(all_backgrounds[i], e))
+            backgrounds = np.stack(backgrounds)
+
+        try:
+            offsets = mi.random_offsets(mi.subject_bboxes(foregrounds[..., 3]), foregrounds.shape[1:3], 0.1, rng)
+            composites, boxes = mi.composite_batch(foregrounds, backgrounds, offsets, adjust_brightness=adjust_brightness)
+        except mi.ImageError as e:
+            raise RenderPipelineError("Error during batch merging: " + str(e))
+
+        for name_jpg, final, (x0, x1, y0, y1) in zip(names, composites, boxes):
+            encoder.save(final, os.path.join(final_folder, name_jpg))
+            bboxes[name_jpg] = ((int(x0), int(x1)), (int(y0), int(y1)))
     return bboxes
 
-def full_run( obj_set, blender_path, renders_per_class=10, work_dir=workspace, generate_background=True, background_database=None, blender_attributes={}, visualize_dump=False, dry_run_mode=False, n_of_pixels = 300, adjust_brightness =False, render_samples=128):
+def merge_all_products(obj_poses, final_im, generate_background, background_database=None, adjust_brightness=False, n_of_pixels=300, workers=1, seed=None, background_bank=None, background_index=None, batch_size=0, encoder='pil', manifest=None):
+    """
+    Merge the poses of every product in obj_poses with backgrounds, either
+    generated or drawn from background_database, and save them into
+    final_im/<product>.
+
+    args:
+        obj_poses (string): folder with one subfolder of renders per product
+        final_im (string): folder the final images are saved to
+        generate_background, background_database, adjust_brightness,
+            n_of_pixels: see full_run
+        workers (int): number of merge processes per product
+        seed (int): seed of the run, every product is seeded from it and
+            its name. Default = None, draws a seed from numpy
+        background_bank (BackgroundBank): bank to draw generated
+            backgrounds from, see gen_merge. Default = None
+        background_index (Merge_Images.BackgroundIndex): index of
+            background_database to take the backgrounds from. Default = None
+        batch_size (int): If positive, every product is merged with
+            batch_merge_all_objects, batch_size poses at a time, instead of
+            one pose per task. Default = 0
+        encoder (string or ImageEncoder): encoder of the final images, see
+            random_bg_for_all_objects. Default = 'pil'
+        manifest (RunManifest): If given, products it lists as merged are
+            skipped and every merged product is recorded in it, see
+            full_run. Default = None
+    returns:
+        all_bbox: dictionary of product -> dictionary of bounding boxes
+    """
+    seed = mi.run_seed(seed)
+    encoder = get_encoder(encoder)
+    all_bbox = {}
+    # Generate images for each class poses
+    for folder in os.listdir(obj_poses):
+        sub_obj = os.path.join(obj_poses, folder)
+        if os.path.isdir(sub_obj) is False:
+            print(sub_obj, " is not a folder")
+            continue
+
+        sub_final = os.path.join(final_im, folder)
+        if manifest is not None:
+            if manifest.merged(folder) and os.path.isdir(sub_final):
+                all_bbox[folder] = manifest.merged_bboxes(folder)
+                continue
+            # partly merged by an interrupted run
+            rmtree(sub_final, ignore_errors=True)
+        os.mkdir(sub_final)
+
+        # Merge images based on the choice of background
+        if batch_size > 0:
+            if generate_background is False and background_database is None:
+                raise RenderPipelineError("A background database is missing")
+            bboxes = batch_merge_all_objects(sub_obj, sub_final, generate_background, background_database, adjust_brightness,
+                                             n_of_pixels, mi.image_seed(seed, folder), background_bank, background_index, batch_size, encoder)
+        elif generate_background:
+            # Generate random background
+            bboxes = random_bg_for_all_objects(sub_obj, sub_final, adjust_brightness, n_of_pixels, workers, mi.image_seed(seed, folder), background_bank, encoder)
+
+        elif generate_background is False and background_database is None:
+            print("We need a background database")
+            raise RenderPipelineError("A background database is missing")
+        else:
+            # We draw background images from given database
+            try:
+                bboxes = mi.generate_for_all_objects(sub_obj,background_database ,sub_final, adjust_brightness, n_of_pixels, workers, mi.image_seed(seed, folder), background_index, encoder)
+            except Exception as e:
+                raise RenderPipelineError("Error occured during random background generation!")
+
+        # collate all the bboxes
+        all_bbox[folder] = bboxes
+        if manifest is not None:
+            manifest.finish_merge(folder, bboxes)
+    return all_bbox
+
+
+def merge_pose(image_path, save_to, generate_background, background_database, adjust_brightness=False, n_of_pixels=300, seed=None, background_bank=None, background_index=None, encoder='pil'):
+    """
+    Merge a single object pose with a background and save the final image.
+    Top level function so that it can be sent to a process pool.
+    Given the same seed, the result is the same as that of
+    merge_all_products.
+
+    args:
+        image_path (string): path to the object pose
+        save_to (string): full path of the final image
+        generate_background (bool): generate a random background if True,
+            draw one from background_database otherwise
+        background_database (string): folder of background images
+        adjust_brightness (bool): see gen_merge
+        n_of_pixels (int): the size of one side of the final square image
+        seed (int): seed of this image, see Merge_Images.image_seed
+        background_bank (BackgroundBank): see gen_merge
+        background_index (Merge_Images.BackgroundIndex): see
+            Merge_Images.generate_for_all_objects
+        encoder (string or ImageEncoder): encoder the final image is
+            written with, see gen_merge. Default = 'pil'
+    returns:
+        bbox: bounding box of the object in the final image
+    """
+    return _merge_pose(image_path, save_to, generate_background, background_database, adjust_brightness, n_of_pixels,
+                       seed, background_bank, background_index, encoder)[0]
+
+
+def _merge_pose(image_path, save_to, generate_background, background_database, adjust_brightness=False, n_of_pixels=300, seed=None, background_bank=None, background_index=None, encoder='pil'):
+    """
+    merge_pose, returning the bounding box and the copy of the encoder that
+    wrote the image, see Merge_Images._add_background_task
+    """
+    if seed is None:
+        seed = mi.run_seed()
+    if generate_background:
+        return _random_bg_task((image_path, save_to, n_of_pixels, adjust_brightness, seed, background_bank, encoder))
+    if background_index is not None:
+        return mi._add_background_task((image_path, background_index.choose(seed), save_to, adjust_brightness, n_of_pixels, seed, background_index, encoder))
+    background = random.Random(seed).choice(sorted(os.listdir(background_database)))
+    return mi._add_background_task((image_path, os.path.join(background_database, background), save_to, adjust_brightness, n_of_pixels, seed, None, encoder))
+
+
+render_pattern = re.compile(r'^render(\d+)\.png$')
+
+def completed_renders(product_folder, rendering_done=False):
+    """
+    Find the renders in a product folder that Blender has finished writing.
+    Blender renders the poses of a product in order, so a render is complete
+    once a render with a higher index exists. The last render is complete
+    once the stats of the product have been dumped or rendering is over.
+
+    args:
+        product_folder (string): folder Blender renders one product into
+        rendering_done (bool): True if Blender has returned
+    returns:
+        list of file names of complete renders
+    """
+    renders = []
+    for image in os.listdir(product_folder):
+        match = render_pattern.match(image)
+        if match:
+            renders.append((int(match.group(1)), image))
+    renders.sort()
+    if not renders:
+        return []
+    if rendering_done or os.path.isdir(os.path.join(product_folder, 'stats')):
+        return [image for _, image in renders]
+    return [image for _, image in renders[:-1]]
+
+
+def resume_offset(product_folder, batch_views=1):
+    """
+    Prepare the folder of an interrupted product render for resuming.
+    The complete renders render0.png ... render<k-1>.png are kept, the
+    remaining renders (the one Blender was writing and any after a gap)
+    are deleted, as are the frames of an interrupted batch of views.
+
+    args:
+        product_folder (string): folder Blender was rendering one product into
+        batch_views (int): views rendered per scene, k is rounded down to a
+            multiple of it so that the resumed renders are batched as in an
+            uninterrupted run
+    returns:
+        k, the index the rendering should resume at
+    """
+    complete = set(completed_renders(product_folder))
+    offset = 0
+    while 'render%d.png' % offset in complete:
+        offset += 1
+    offset -= offset % batch_views
+    # frames of a batch of views, see RenderInterface.render_views
+    rmtree(os.path.join(product_folder, 'views'), ignore_errors=True)
+    for image in os.listdir(product_folder):
+        match = render_pattern.match(image)
+        if match and int(match.group(1)) >= offset:
+            os.remove(os.path.join(product_folder, image))
+    return offset
+
+
+def stream_merge_poses(render, obj_poses, final_im, generate_background, background_database=None, adjust_brightness=False, n_of_pixels=300, workers=2, poll_interval=1.0, seed=None, background_bank=None, background_index=None, encoder='pil'):
+    """
+    Run the pose rendering and the merging at the same time. render is
+    called in a background thread while obj_poses is watched for completed
+    renders, which are handed to a pool of merge workers as they appear.
+    The wall-clock time is then about the larger of the render and merge
+    times instead of their sum.
+
+    args:
+        render: callable rendering the poses into obj_poses, e.g. a lambda
+            around generate_poses. Exceptions it raises are re-raised here
+        obj_poses (string): folder with one subfolder of renders per product
+        final_im (string): folder the final images are saved to, with one
+            subfolder per product
+        generate_background, background_database, adjust_brightness,
+            n_of_pixels, background_bank, background_index: see merge_pose
+        workers (int): number of merge processes
+        poll_interval (float): seconds between two scans of obj_poses
+        seed (int): seed of the run, images are seeded exactly as in
+            merge_all_products. Default = None, draws a seed from numpy
+        encoder (string or ImageEncoder): encoder of the final images, see
+            random_bg_for_all_objects. Default = 'pil'
+    returns:
+        all_bbox: dictionary of product -> dictionary of bounding boxes
+    """
+    encoder = get_encoder(encoder)
+    render_errors = []
+    def run_render():
+        try:
+            render()
+        except Exception as e:
+            render_errors.append(e)
+    render_thread = threading.Thread(target=run_render)
+    render_thread.start()
+
+    all_bbox = {}
+    pending = []
+    submitted = set()
+    seed = mi.run_seed(seed)
+    pool = multiprocessing.Pool(workers)
+    try:
+        rendering_done = False
+        while True:
+            # read the state before scanning, so nothing finished after the scan is missed
+            rendering_done = not render_thread.is_alive()
+            for product in sorted(os.listdir(obj_poses)):
+                sub_obj = os.path.join(obj_poses, product)
+                if not os.path.isdir(sub_obj):
+                    continue
+                sub_final = os.path.join(final_im, product)
+                if not os.path.isdir(sub_final):
+                    os.mkdir(sub_final)
+                    all_bbox[product] = {}
+                for image in completed_renders(sub_obj, rendering_done):
+                    if (product, image) in submitted:
+                        continue
+                    submitted.add((product, image))
+                    name_jpg = os.path.splitext(image)[0] + encoder.extension
+                    result = pool.apply_async(_merge_pose, (os.path.join(sub_obj, image), os.path.join(sub_final, name_jpg),
+                                                           generate_background, background_database,
+                                                           adjust_brightness, n_of_pixels,
+                                                           mi.image_seed(mi.image_seed(seed, product), image),
+                                                           background_bank, background_index, encoder))
+                    pending.append((product, name_jpg, result))
+            if rendering_done:
+                break
+            time.sleep(poll_interval)
+
+        if render_errors:
+            raise render_errors[0]
+        for product, name_jpg, result in pending:
+            try:
+                all_bbox[product][name_jpg], worker_encoder = result.get()
+                encoder.collect(worker_encoder)
+            except Exception as e:
+                raise RenderPipelineError("Error occured during streamed merging of {}: {}".format(name_jpg, e))
+    finally:
+        pool.terminate()
+        pool.join()
+        render_thread.join()
+    return all_bbox
+
+
+def full_run( obj_set, blender_path, renders_per_class=10, work_dir=workspace, generate_background=True, background_database=None, blender_attributes={}, visualize_dump=False, dry_run_mode=False, n_of_pixels = 300, adjust_brightness =False, render_samples=128, render_workers=1, split_renders=False, render_server=None, stream_merge=False, merge_workers=1, merge_seed=None, background_bank_size=0, background_bank_folder=None, index_backgrounds=False, composite_batch_size=0, encoder='pil', shard_size=0, resume=False, render_seed=None, render_cache=None, render_cache_size=1024, render_schedule=False, render_sampling='iid', model_cache=None, scene_template=False, batch_views=1, render_quality=None):
     """
     Function that will take all the parameters and execute the
     complete pipeline. Given object model files it will generate the specified
@@ -310,6 +1200,120 @@ def full_run( obj_set, blender_path, renders_per_class=10, work_dir=workspace, g
                 foreground image. Default = False
         render_samples:
                 Default = 128
+        render_workers (int): Number of concurrent Blender processes used
+                for pose rendering. Default = 1
+        split_renders (boolean): If True, the render workers split the
+                renders of every product instead of the products.
+                Default = False
+        render_server (BlenderRenderServer): A running render server to
+                reuse instead of launching Blender for this run. Takes
+                precedence over render_workers. Default = None
+        stream_merge (boolean): If True, object poses are merged with their
+                backgrounds while Blender is still rendering, see
+                stream_merge_poses. Ignored with render_workers above 1
+                (without a render_server), whose renders are only moved
+                to the object poses once every worker is done.
+                Default = False
+        merge_workers (int): Number of processes merging object poses with
+                backgrounds. Default = 1
+        merge_seed (int): Seed for the backgrounds and offsets of the final
+                images. The same seed gives the same images, whatever the
+                number of merge workers. Default = None, random
+        background_bank_size (int): If positive and generate_background is
+                True, backgrounds are drawn (and augmented) from a bank of
+                this many pre-generated backgrounds instead of generating
+                one per image. Default = 0, no bank
+        background_bank_folder (string): Folder of the background banks.
+                Banks are not deleted at the end of the run, so later runs
+                with the same resolution reuse them.
+                Default = None, work_dir/background_bank
+        index_backgrounds (boolean): If True and generate_background is
+                False, the background database is indexed once per
+                resolution (see Merge_Images.BackgroundIndex) into
+                work_dir/background_index, and the backgrounds are taken
+                from the index instead of being decoded and resized for
+                every image. Too small or invalid backgrounds are left out
+                of the index. Default = False
+        composite_batch_size (int): If positive, the poses of each product
+                are merged composite_batch_size at a time with the batched
+                array compositor, see batch_merge_all_objects. Not used
+                with stream_merge. Default = 0, one pose at a time
+        encoder (string or ImageEncoder): Encoder of the final images, one
+                of SceneLib.Encode_Images.available_encoders() or an
+                ImageEncoder instance. The time spent encoding and the size
+                of the images are printed and dumped with the merging
+                parameters. Default = 'pil', progressive JPEG as before
+        shard_size (int): If positive, the final images are written straight
+                into tar shards of shard_size images, see
+                SceneLib.Shard_Images, instead of one file per image. The
+                final folder (shards, stats and merging parameters) is then
+                moved to final_zip instead of being zipped, and the path of
+                the folder is returned. Default = 0, zip of image files
+        resume (boolean): If True, the run keeps a manifest of its completed
+                work in work_dir/run_manifest.json (see run_manifest) and
+                skips whatever an earlier, interrupted or finished, run with
+                the same parameters completed: products whose renders are
+                complete are not rendered again, interrupted products are
+                rendered from their first missing render on, and products
+                already merged are not merged again. A changed model folder
+                only invalidates its own product, changed merge parameters
+                only the merged images, so the object poses are reused. The
+                object poses are kept at the end of the run for later runs.
+                Renders resumed halfway only have the stats of the resumed
+                part. Images are merged after rendering, stream_merge is
+                ignored. With shard_size, all products are merged again.
+                Default = False
+        render_seed (int): Seed of the sampled poses, the same seed samples
+                the same poses, whatever the number of render workers.
+                Default = None, unseeded
+        render_cache (string): Folder of a render cache (see
+                render_cache.py). Poses rendered before for the same model,
+                render settings and sampled parameters, e.g. in an earlier
+                run with the same render_seed, are copied from it instead of
+                rendered. Hits and misses are saved with the stats of every
+                product. A render_server uses its own cache instead.
+                Default = None, no cache
+        render_cache_size (int): Size bound of the render cache in MB, the
+                least recently used renders are evicted. Default = 1024
+        render_schedule (boolean): If True, the parameters of all renders
+                are sampled before rendering into one schedule per product
+                (see render_schedule.py), seeded with render_seed, and
+                Blender only applies them. The schedule of every product is
+                saved with its stats. Scheduled runs sample other poses
+                than unscheduled runs with the same render_seed.
+                Default = False
+        render_sampling (string): One of 'iid', 'sobol', 'halton' or
+                'stratified'. Other than 'iid', the cameras and lamps of the
+                renders of a product are drawn from a low-discrepancy point
+                set (see RandomLib.low_discrepancy), covering the views
+                evenly with fewer renders, and the lamp counts are
+                stratified. This needs the whole schedule of a product, so
+                it turns render_schedule on. The view coverage of every
+                product is saved in its stats as coverage.json, whatever
+                the sampling. Default = 'iid'
+        model_cache (string): Folder of a model cache (see model_cache.py).
+                Every .model file is extracted into it once, later loads
+                and runs reuse the extracted files. A render_server uses
+                its own cache instead. Default = None, no cache
+        scene_template (boolean): If True, Blender creates the subjects and
+                their materials once and loading the next product only
+                swaps meshes and textures. A render_server is started with
+                its own scene_template instead. Default = False
+        batch_views (int): Number of views rendered per scene. Above 1,
+                every batch of batch_views renders of a product shares the
+                lamps and the subject size of its first render, and Blender
+                renders the batch as one animation, reusing the scene
+                between the views. Every render keeps the camera it would
+                have without batches, so a render_seed or a render_schedule
+                gives the same cameras either way. With resume, a product
+                resumes at the start of a batch. Default = 1
+        render_quality (string): One of 'draft', 'train' or 'eval', a
+                quality preset of the Cycles samples, tile size, light
+                bounces, adaptive sampling and denoising (see
+                render_quality.py). render_samples is then ignored. The
+                samples and time of every render are saved with the stats
+                of its product. Default = None, render_samples with the
+                'train' settings
     """
     print('Checking data directories...')
     slack.send_message('Obj_set: ' + obj_set + '\n renders_per_class: ' + str(renders_per_class), 'Rendering Run Started', 'good')
@@ -320,14 +1324,159 @@ def full_run( obj_set, blender_path, renders_per_class=10, work_dir=workspace, g
         print(message)
         raise RenderPipelineError(message)
 
-    destroy_folders(work_dir, temp_folders)
+    if render_sampling not in SAMPLING_METHODS:
+        raise RenderPipelineError("Invalid render sampling, must be one of {}".format(SAMPLING_METHODS))
+    if render_quality is not None and render_quality not in QUALITY_PRESETS:
+        raise RenderPipelineError("Invalid render quality, must be one of {}".format(sorted(QUALITY_PRESETS)))
+    if render_sampling != 'iid':
+        render_schedule = True
+
+    if stream_merge and render_workers > 1 and render_server is None:
+        # the workers' renders only reach obj_poses once every worker is done
+        print("Render workers render before merging, stream_merge is ignored")
+        stream_merge = False
+
+    manifest_path = os.path.join(work_dir, "run_manifest.json")
+    if resume:
+        if stream_merge:
+            print("Resumed runs render before merging, stream_merge is ignored")
+            stream_merge = False
+        destroy_folders(work_dir, ['generate_bg', 'object_poses_workers'])
+    else:
+        destroy_folders(work_dir, temp_folders)
+        if os.path.isfile(manifest_path):
+            os.remove(manifest_path)
     validate_folders(work_dir, data_folders)
 
     obj_poses = os.path.join(work_dir, "object_poses")
+    final_folder = os.path.join(work_dir, "final_folder")
+    final_im = os.path.join(work_dir, "final_folder/images")
+
+    if generate_background is False and background_database is None:
+        print("We need a background database")
+        raise RenderPipelineError("A background database is missing")
+
+    try:
+        encoder = get_encoder(encoder)
+    except Exception as e:
+        raise RenderPipelineError("Invalid encoder: " + str(e))
+    encoder.stats = EncodingStats()
+
+    manifest = None
+    if resume:
+        manifest = RunManifest(manifest_path)
+        render_key = hash_params({"renders_per_class": renders_per_class,
+                                  "blender_attributes": blender_attributes,
+                                  "resolution": n_of_pixels,
+                                  "samples": render_samples,
+                                  "visualize_dump": visualize_dump,
+                                  "dry_run_mode": dry_run_mode,
+                                  "render_seed": render_seed,
+                                  "render_schedule": render_schedule,
+                                  "render_sampling": render_sampling,
+                                  "batch_views": batch_views,
+                                  "render_quality": render_quality})
+        if manifest.start_render(render_key):
+            print("Render parameters changed, nothing is reused")
+            destroy_folders(work_dir, ['object_poses', 'final_folder', 'render_schedule'])
+        merge_key = hash_params({"render": render_key,
+                                 "generate_background": generate_background,
+                                 "background_database": None if generate_background else mi.BackgroundIndex.database_key(background_database, n_of_pixels),
+                                 "adjust_brightness": adjust_brightness,
+                                 "merge_seed": merge_seed,
+                                 "background_bank_size": background_bank_size,
+                                 "index_backgrounds": index_backgrounds,
+                                 "composite_batch_size": composite_batch_size,
+                                 "encoder": [encoder.name, encoder.quality],
+                                 "shard_size": shard_size})
+        merge_changed = manifest.start_merge(merge_key)
+        if shard_size > 0:
+            # the shards are a single stream over all products, they are written again
+            manifest.reset_merge(merge_key)
+        if merge_changed or shard_size > 0:
+            destroy_folders(work_dir, ['final_folder'])
+        validate_folders(work_dir, data_folders)
+        if merge_seed is None:
+            # the seed drawn by the interrupted run, so the merged images match
+            if manifest.merge_seed is None:
+                manifest.merge_seed = mi.run_seed()
+            merge_seed = manifest.merge_seed
+
+    shard_writer = None
+    if shard_size > 0:
+        shard_writer = ShardWriter(os.path.join(final_folder, "shards"), final_im, shard_size)
+        encoder.sink = shard_writer
+
+    background_bank = None
+    if generate_background and background_bank_size > 0:
+        if background_bank_folder is None:
+            background_bank_folder = os.path.join(work_dir, "background_bank")
+        background_bank = BackgroundBank.open_or_create(background_bank_folder, background_bank_size, n_of_pixels, merge_seed)
+
+    background_index = None
+    if not generate_background and index_backgrounds:
+        try:
+            background_index = mi.BackgroundIndex.open_or_build(background_database, n_of_pixels, os.path.join(work_dir, "background_index"))
+        except mi.ImageError as e:
+            raise RenderPipelineError("Could not index the background database: " + str(e))
 
     """----------------- Generating object poses ---------------"""
     src_path = os.path.join(project_path, "src")
-    generate_poses(src_path, blender_path, obj_set, obj_poses, renders_per_class, blender_attributes, visualize_dump, dry_run_mode, n_of_pixels, render_samples)
+    schedule_folder = None
+    if render_schedule:
+        schedule_folder = os.path.join(work_dir, "render_schedule")
+        # products with a schedule from an interrupted run keep it
+        write_schedules(obj_set, schedule_folder, renders_per_class, blender_attributes, render_seed, sampling=render_sampling)
+
+    def render(products=None, render_offset=0):
+        renders = renders_per_class - render_offset
+        if render_server is not None:
+            render_server.generate_poses(obj_set, obj_poses, renders, blender_attributes, visualize_dump, dry_run_mode, n_of_pixels, render_samples, products, render_offset, render_seed,
+                                         render_schedule=schedule_folder, batch_views=batch_views,
+                                         render_quality=render_quality)
+        elif render_workers > 1:
+            generate_poses_parallel(src_path, blender_path, obj_set, obj_poses, renders, blender_attributes, visualize_dump, dry_run_mode, n_of_pixels, render_samples, render_workers, split_renders,
+                                    products=products, render_offset=render_offset, render_seed=render_seed,
+                                    render_cache=render_cache, render_cache_size=render_cache_size,
+                                    render_schedule=schedule_folder, model_cache=model_cache,
+                                    scene_template=scene_template, batch_views=batch_views,
+                                    render_quality=render_quality)
+        else:
+            generate_poses(src_path, blender_path, obj_set, obj_poses, renders, blender_attributes, visualize_dump, dry_run_mode, n_of_pixels, render_samples, products, render_offset,
+                           render_seed, render_cache, render_cache_size, schedule_folder, model_cache, scene_template,
+                           batch_views, render_quality)
+
+    if stream_merge:
+        print(' ============================ RENDERING AND GENERATING FINAL IMAGES ============================')
+        all_bbox = stream_merge_poses(render, obj_poses, final_im, generate_background, background_database,
+                                      adjust_brightness, n_of_pixels, merge_workers, seed=merge_seed,
+                                      background_bank=background_bank, background_index=background_index, encoder=encoder)
+    elif manifest is not None:
+        # products grouped by the render they resume at
+        offsets = {}
+        for product in sorted(os.listdir(obj_set)):
+            product_folder = os.path.join(obj_set, product)
+            if not os.path.isdir(product_folder):
+                continue
+            inputs = hash_folder(product_folder)
+            render_folder = os.path.join(obj_poses, product)
+            if manifest.rendered(product, inputs) and os.path.isdir(os.path.join(render_folder, "stats")):
+                continue
+            offset = 0
+            if manifest.render_inputs(product) == inputs and os.path.isdir(render_folder):
+                offset = resume_offset(render_folder, batch_views)
+            elif os.path.isdir(render_folder):
+                rmtree(render_folder)
+            manifest.begin_render(product, inputs)
+            offsets.setdefault(offset, []).append(product)
+        for offset, products in sorted(offsets.items()):
+            print("Rendering {} from render {} on".format(products, offset))
+            render(products, offset)
+            for product in products:
+                if os.path.isdir(os.path.join(obj_poses, product, "stats")):
+                    manifest.finish_render(product)
+    else:
+        render()
 
     #now we need to take Ong' stats and move them into final folder
     for folder in os.listdir(obj_poses):
@@ -335,44 +1484,42 @@ def full_run( obj_set, blender_path, renders_per_class=10, work_dir=workspace, g
 
         if(os.path.isdir(orig_stats)):
             final_name= folder + "_stats"
-            sh_move(orig_stats, os.path.join(work_dir,"final_folder" ,final_name))
+            if resume:
+                # the stats mark the renders of the product as complete, keep them
+                rmtree(os.path.join(final_folder, final_name), ignore_errors=True)
+                copytree(orig_stats, os.path.join(final_folder, final_name))
+            else:
+                sh_move(orig_stats, os.path.join(work_dir,"final_folder" ,final_name))
+            if schedule_folder is not None:
+                schedule = os.path.join(schedule_folder, schedule_name(folder))
+                if os.path.isfile(schedule):
+                    copyfile(schedule, os.path.join(final_folder, final_name, "render_schedule.npz"))
+            dump_coverage(os.path.join(final_folder, final_name), blender_attributes)
+            times = dump_render_times(os.path.join(final_folder, final_name))
+            if times is not None:
+                print("{}: {} renders in {:.1f}s, {:.2f}s per render, {} from the render cache".format(
+                    folder, times['renders'], times['seconds'], times['mean_seconds'], times['cached']))
+                if times['images_per_minute'] is not None:
+                    print("{}: {:.1f} images per minute".format(folder, times['images_per_minute']))
+                if times['mean_samples'] is not None:
+                    print("{}: {:.0f} samples per render, quality {}".format(
+                        folder, times['mean_samples'], ', '.join(times['quality']) or 'custom'))
 
     """----------------- Generating final images ---------------"""
     """
     We need to distinguish between the case of drawing backrounds
     from a database and when generating ourselves
     """
-    print(' ============================ GENERATING FINAL IMAGES ============================')
-    final_folder = os.path.join(work_dir, "final_folder")
-    final_im = os.path.join(work_dir, "final_folder/images")
-    all_bbox = {}
-    # Generate images for each class poses
-    for folder in os.listdir(obj_poses):
-        sub_obj = os.path.join(obj_poses, folder)
-        if os.path.isdir(sub_obj) is False:
-            print(sub_obj, " is not a folder")
-            continue
-
-        sub_final = os.path.join(final_im, folder)
-        os.mkdir(sub_final)
-
-        # Merge images based on the choice of background
-        if generate_background:
-            # Generate random background
-            bboxes = random_bg_for_all_objects(sub_obj, sub_final, adjust_brightness, n_of_pixels)
-
-        elif generate_background is False and background_database is None:
-            print("We need a background database")
-            raise RenderPipelineError("A background database is missing")
-        else:
-            # We draw background images from given database
-            try:
-                bboxes = mi.generate_for_all_objects(sub_obj,background_database ,sub_final, adjust_brightness, n_of_pixels)
-            except Exception as e:
-                raise RenderPipelineError("Error occured during random background generation!")
-
-        # collate all the bboxes
-        all_bbox[folder] = bboxes
+    if not stream_merge:
+        print(' ============================ GENERATING FINAL IMAGES ============================')
+        all_bbox = merge_all_products(obj_poses, final_im, generate_background, background_database, adjust_brightness, n_of_pixels, merge_workers, merge_seed, background_bank, background_index, composite_batch_size, encoder, manifest)
+    if shard_writer is not None:
+        shard_writer.close()
+        encoder.sink = None
+        # the images are in the shards, only the empty class folders are left
+        rmtree(final_im)
+    encoding = encoder.stats.summary()
+    print("Encoded {images} images with {0}: {ms_per_image} ms and {bytes_per_image} bytes per image".format(encoder.name, **encoding))
 
     # Dump the parameters used for rendering and merging
     for folder in os.listdir(obj_poses):
@@ -385,6 +1532,10 @@ def full_run( obj_set, blender_path, renders_per_class=10, work_dir=workspace, g
                  "background_database": os.path.split(background_database)[-1],
                  "number_of_pixels": n_of_pixels,
                  "brightness_adjusted": adjust_brightness,
+                 "background_bank_size": len(background_bank) if background_bank is not None else 0,
+                 "encoder": encoder.name,
+                 "encoding": encoding,
+                 "shard_size": shard_size,
                  "all_bboxes": all_bbox.__str__()
                  }
     dump_file = os.path.join(final_folder, 'mergeparams_dump.json')
@@ -400,11 +1551,21 @@ def full_run( obj_set, blender_path, renders_per_class=10, work_dir=workspace, g
         back_parameter = os.path.split(background_database)[-1]
     zip_name = os.path.join(work_dir,"final_zip",os.path.split(obj_set)[-1] + "_" + back_parameter + "_" + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S").replace(" ","_").replace(":","_"))
 
-    make_archive(zip_name, 'zip', final_folder)
+    if shard_writer is not None:
+        # the shards are read as they are, there is nothing to zip
+        sh_move(final_folder, zip_name)
+        final_result = zip_name
+    else:
+        make_archive(zip_name, 'zip', final_folder)
+        final_result = zip_name + ".zip"
     # Clean up all generated files, apart from the zip file
-    destroy_folders(work_dir, temp_folders)
+    if manifest is not None:
+        # keep the object poses for the next run, the final images are packed
+        destroy_folders(work_dir, [folder for folder in temp_folders if folder != 'object_poses'])
+        manifest.reset_merge()
+    else:
+        destroy_folders(work_dir, temp_folders)
 
-    final_result = zip_name + ".zip"
     slack.send_message('Full run completed. Final zip file: ' + final_result, 'Rendering Run Completed', 'good')
     return final_result
 
@@ -77,6 +77,39 @@ parser.add_argument("visualize_dump", type=str2bool, default=False,
 parser.add_argument('dry_run_mode', type=str2bool, default=False,
                     help='json dump of blender attributes')
 
+parser.add_argument('--products', default=None,
+                    help='json list of product folders to render, all products are rendered if not given')
+
+parser.add_argument('--render_offset', type=int, default=0,
+                    help='index of the first render of every product')
+
+parser.add_argument('--render_cache', default=None,
+                    help='folder of a render cache, poses rendered before are copied from it')
+
+parser.add_argument('--render_cache_size', type=int, default=1024,
+                    help='size bound of the render cache in MB')
+
+parser.add_argument('--model_cache', default=None,
+                    help='folder of a model cache, .model files are extracted into it once and reused')
+
+parser.add_argument('--scene_template', action='store_true',
+                    help='keep the subjects and their materials between products, only swapping meshes and textures')
+
+parser.add_argument('--batch_views', type=int, default=1,
+                    help='views rendered per scene, every batch of views shares its lamps and is rendered as one animation')
+
+parser.add_argument('--quality', default=None, choices=['draft', 'train', 'eval'],
+                    help='quality preset of the renders, render_samples is ignored with a preset')
+
+parser.add_argument('--schedule', default=None,
+                    help='folder of render schedules, <product>.npz sets up every render of the product')
+
+parser.add_argument('--log_level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                    help='messages below this level are not printed')
+
+parser.add_argument('--seed', type=int, default=None,
+                    help='seed of the sampled poses, every render of every product is sampled from its own stream of it')
+
 args = parser.parse_args(argv)
 
 if not argv:
@@ -89,6 +122,11 @@ if not argv:
 # Ensure source directory in Blender python path
 sys.path.append(os.path.join(args.project_dir))
 import rendering.RenderInterface as Render
+from rendering import render_log
+from rendering.render_cache import RenderCache
+from rendering.model_cache import ModelCache
+from rendering.RandomLib.random_streams import stream_seed
+from rendering.render_schedule import RenderSchedule, schedule_name
 
 
 """" --------------- Blender Setup ------------- """
@@ -96,6 +134,10 @@ if args.blender_attributes:
     io = StringIO(args.blender_attributes)
     blender_attributes = json.load(io)
 
+products = None
+if args.products:
+    products = json.loads(args.products)
+
 print('Running blender with the following parameters: \n {} \n'.format(blender_attributes))
 
 
@@ -108,46 +150,62 @@ def find_model(product_folder):
 
 
 """" --------------- Rendering ------------- """
-RI = Render.RenderInterface(num_images=args.renders_per_product, resolution=args.render_resolution, samples=args.render_samples)
-
-for product in os.listdir(args.object_folder):
-    product_folder = os.path.join(args.object_folder, product)
-
-    # Validate object
-    if not os.path.isdir(product_folder):
-        print("RENDER POSES: Couldn't find {} object folder! Skipping".format(product))
-        continue
-
-    # Create product folder in object_renders
-    render_folder = os.path.join(args.output_folder, product)
-    if not os.path.isdir(render_folder):
-        print('RENDER POSES: Making render folder', render_folder)
-        os.mkdir(render_folder)
-
-    # Get model files
-    model_file = find_model(product_folder)
-
-    # Configure model paths
-    model_path = os.path.join(product_folder, model_file)
-
-    print("RENDER POSES: Detected model, using model: \n {}".format(model_path))
-    print("RENDER POSES: Render folder used : \n {} \n".format(render_folder))
-
-    # Do the blender stuff
-    RI.load_from_model(model_path, render_folder)
-
-    if blender_attributes:
-        print("RENDER POSES: the following attributes are supplied for this run: ")
-        for param in blender_attributes['attribute_distribution_params']:
-            print(param)
-            RI.set_attribute_distribution_params(param[0], param[1], param[2])
-
-        for dist in blender_attributes['attribute_distribution']:
-            print(dist)
-            RI.set_attribute_distribution(dist[0], dist[1])
-
-        print("\n")
-
-    print("RENDER POSES: begin rendering {} \n".format(product))
-    RI.render_all(dump_logs=True, visualize=args.visualize_dump, dry_run=args.dry_run_mode)
-    print("RENDER POSES: finished rendering {} \n".format(product))
\ No newline at end of file
+render_cache = None
+if args.render_cache:
+    render_cache = RenderCache(args.render_cache, args.render_cache_size * 2**20)
+model_cache = None
+if args.model_cache:
+    model_cache = ModelCache(args.model_cache)
+# messages are flushed every second by a background thread, not on every render
+log = render_log.RenderLog('blender_render.log', level=getattr(render_log, args.log_level), async_flush=True)
+RI = Render.RenderInterface(num_images=args.renders_per_product, resolution=args.render_resolution, samples=args.render_samples,
+                            render_cache=render_cache, log=log, model_cache=model_cache,
+                            scene_template=args.scene_template, quality=args.quality)
+
+# Blender output goes to blender_render.log for the whole session
+with RI.log:
+    for product in os.listdir(args.object_folder):
+        product_folder = os.path.join(args.object_folder, product)
+
+        # Only render the products assigned to this process
+        if products is not None and product not in products:
+            continue
+
+        # Validate object
+        if not os.path.isdir(product_folder):
+            RI.log.warning("RENDER POSES: Couldn't find {} object folder! Skipping".format(product))
+            continue
+
+        # Create product folder in object_renders
+        render_folder = os.path.join(args.output_folder, product)
+        if not os.path.isdir(render_folder):
+            RI.log.info('RENDER POSES: Making render folder {}'.format(render_folder))
+            os.mkdir(render_folder)
+
+        # Get model files
+        model_file = find_model(product_folder)
+
+        # Configure model paths
+        model_path = os.path.join(product_folder, model_file)
+
+        RI.log.info("RENDER POSES: Detected model, using model: \n {}".format(model_path))
+        RI.log.info("RENDER POSES: Render folder used : \n {} \n".format(render_folder))
+
+        # Do the blender stuff
+        RI.load_from_model(model_path, render_folder)
+
+        if blender_attributes:
+            RI.log.info("RENDER POSES: the following attributes are supplied for this run: ")
+            RI.set_blender_attributes(blender_attributes)
+
+        RI.log.info("RENDER POSES: begin rendering {} \n".format(product))
+        seed = None
+        if args.seed is not None:
+            seed = stream_seed(args.seed, product)
+        schedule = None
+        if args.schedule:
+            schedule = RenderSchedule.load(os.path.join(args.schedule, schedule_name(product)))
+        RI.render_all(dump_logs=True, visualize=args.visualize_dump, dry_run=args.dry_run_mode, start_index=args.render_offset, seed=seed,
+                      schedule=schedule, batch_views=args.batch_views)
+        RI.log.info("RENDER POSES: finished rendering {} \n".format(product))
+log.close()
@@ -0,0 +1,43 @@
+"""
+Named quality presets of the Cycles render settings.
+
+Every render used to get the same settings, whatever the experiment: 128
+samples, 512 pixel tiles and one light bounce. A quality preset trades
+quality for throughput instead:
+
+- 'draft': few samples, denoised, for quick looks at a dataset
+- 'train': the former settings, the default
+- 'eval': many samples and light bounces, for evaluation images
+
+Besides samples, tile size and bounces, a preset sets the noise threshold
+of adaptive sampling (None to sample every pixel fully) and whether the
+render is denoised. Blender 2.79 has no adaptive sampling, the threshold
+only applies to Cycles versions that have it. Presets do not need Blender.
+"""
+
+QUALITY_PRESETS = {
+    'draft': {'samples': 16, 'tile_size': 256, 'max_bounces': 1, 'adaptive_threshold': 0.1, 'denoise': True},
+    'train': {'samples': 128, 'tile_size': 512, 'max_bounces': 1, 'adaptive_threshold': None, 'denoise': False},
+    'eval': {'samples': 512, 'tile_size': 256, 'max_bounces': 4, 'adaptive_threshold': 0.005, 'denoise': False},
+}
+
+DEFAULT_QUALITY = 'train'
+
+
+def quality_settings(quality=None, samples=128):
+    """
+    :param quality: name of a preset in QUALITY_PRESETS, None for the
+        default preset with the given samples
+    :param samples: Cycles samples per pixel, ignored with a preset
+    :return: dictionary with the keys of a preset and 'quality', the name of
+        the preset or None
+    """
+    if quality is None:
+        settings = dict(QUALITY_PRESETS[DEFAULT_QUALITY])
+        settings['samples'] = samples
+    elif quality in QUALITY_PRESETS:
+        settings = dict(QUALITY_PRESETS[quality])
+    else:
+        raise ValueError('Quality must be one of {}'.format(sorted(QUALITY_PRESETS)))
+    settings['quality'] = quality
+    return settings
@@ -0,0 +1,204 @@
+"""
+Pre-sampled render schedules.
+
+Instead of sampling the lamps, camera and subject size of every render
+inside Blender, the pipeline can sample the parameters of all renders of a
+product up front, with the vectorized Distribution.sample_batch, and save
+them as an array with one row per render. Blender then only applies row k
+to render<k> (see BlenderRandomScene.scene_setup), so:
+
+- workers rendering parts of a product just read different rows,
+- the parameters of every image are known exactly, before rendering,
+- the renders of a product can be sampled jointly, from low-discrepancy
+  point sets (see RandomLib.low_discrepancy) that cover the views and
+  lighting of a product evenly with fewer renders than i.i.d. samples.
+
+A schedule is a .npz file holding:
+    params: float array [renders, columns], NaN for the lamps that are off
+    columns: names of the columns, see schedule_columns
+    blender_attributes: json of the attributes the schedule was sampled with
+
+Sampling and reading schedules does not need Blender.
+"""
+import json
+import os
+
+import numpy as np
+
+from .RandomLib import random_render as rnd
+from .RandomLib import low_discrepancy as ld
+from .RandomLib.random_streams import stream
+
+
+def schedule_name(product):
+    """
+    :return: file name of the schedule of product in a schedule folder
+    """
+    return product + '.npz'
+
+
+def scene_distributions(blender_attributes=None):
+    """
+    The distributions of a scene with blender_attributes applied, as
+    RenderInterface.set_blender_attributes applies them inside Blender
+    :param blender_attributes: dict in the format of
+        render_pipeline.generate_poses, or None for the defaults
+    :return: dictionary of attribute name -> Distribution
+    """
+    distributions = rnd.default_scene_distributions()
+    blender_attributes = blender_attributes or {}
+    for attr, param, val in blender_attributes.get('attribute_distribution_params', []):
+        if attr not in distributions:
+            raise KeyError('Cannot find specified attribute!')
+        distributions[attr].change_param(param, val)
+    for attr, params in blender_attributes.get('attribute_distribution', []):
+        if attr not in distributions:
+            raise KeyError('Cannot find specified attribute!')
+        distributions[attr] = rnd.DistributionFactory(**params)
+    return distributions
+
+
+def schedule_columns(max_lamps):
+    """
+    :param max_lamps: number of lamps of the scene
+    :return: list of column names of a schedule
+    """
+    columns = ['num_lamps', 'camera_loc_x', 'camera_loc_y', 'camera_loc_z', 'camera_radius', 'spin_angle', 'subject_size']
+    for l in range(max_lamps):
+        columns += ['lamp%d_%s' % (l, name) for name in ['loc_x', 'loc_y', 'loc_z', 'distance', 'energy', 'size']]
+    return columns
+
+
+class RenderSchedule(object):
+    """
+    Parameters of every render of a product, one row per render.
+    :param params: float array of shape [renders, len(columns)]
+    :param columns: list of column names, see schedule_columns
+    :param blender_attributes: attributes the schedule was sampled with
+    """
+    def __init__(self, params, columns, blender_attributes=None):
+        self.params = np.asarray(params, dtype=float)
+        self.columns = list(columns)
+        self.blender_attributes = blender_attributes or {}
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.max_lamps = sum(1 for name in self.columns if name.endswith('_distance'))
+
+    @classmethod
+    def sample(cls, n, blender_attributes=None, rng=None, sampling='iid'):
+        """
+        Samples the parameters of n renders
+        :param n: number of renders
+        :param blender_attributes: see scene_distributions
+        :param rng: numpy Generator, None uses the global numpy state
+        :param sampling: one of low_discrepancy.SAMPLING_METHODS. 'iid'
+            samples every parameter independently. Otherwise the camera
+            (location, radius, spin) and subject size of the renders are
+            drawn from one low-discrepancy point set, the lamps from
+            another, and the lamp counts are stratified
+        :return: RenderSchedule
+        """
+        if sampling not in ld.SAMPLING_METHODS:
+            raise ValueError('Sampling method must be one of {}'.format(ld.SAMPLING_METHODS))
+        distributions = scene_distributions(blender_attributes)
+        max_lamps = distributions['num_lamps'].r
+        num_lamps = distributions['num_lamps'].sample_qmc(n, 'iid' if sampling == 'iid' else 'stratified', rng)
+        if np.any(num_lamps < 0):
+            raise ValueError('number of lamps negative! aborting')
+        max_lamps = max(max_lamps, int(num_lamps.max()) if n else 0)
+
+        camera = _sample_joint(distributions, ['camera_loc', 'camera_radius', 'spin_angle', 'subject_size'], n, sampling, rng)
+        lamps = _sample_joint(distributions, ['lamp_loc', 'lamp_distance', 'lamp_energy', 'lamp_size'], n*max_lamps, sampling, rng)
+        columns = [num_lamps[:, None]] + [c.reshape(n, -1) for c in camera]
+        lamps = np.concatenate([c.reshape(n, max_lamps, -1) for c in lamps], axis=2)
+        lamps[np.arange(max_lamps) >= num_lamps[:, None]] = np.nan
+        columns.append(lamps.reshape(n, -1))
+        return cls(np.concatenate(columns, axis=1), schedule_columns(max_lamps), blender_attributes)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['params'], f['columns'].tolist(), json.loads(f['blender_attributes'].item()))
+
+    def save(self, path):
+        """
+        Saves the schedule to path, atomically
+        """
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, params=self.params, columns=np.array(self.columns),
+                 blender_attributes=np.array(json.dumps(self.blender_attributes, sort_keys=True)))
+        os.replace(tmp, path)
+
+    def __len__(self):
+        return len(self.params)
+
+    def scene(self, i):
+        """
+        Parameters of the i-th render
+        :return: dictionary in the format of BlenderRandomScene.sample_scene
+        """
+        if not 0 <= i < len(self):
+            raise IndexError('Render {} is not in the schedule of {} renders'.format(i, len(self)))
+        row = self.params[i].tolist()
+        column = lambda name: row[self.index[name]]
+        num_lamps = int(column('num_lamps'))
+        lamps = []
+        for l in range(num_lamps):
+            prefix = 'lamp%d_' % l
+            lamps.append({'loc': tuple(column(prefix + c) for c in ['loc_x', 'loc_y', 'loc_z']),
+                          'distance': column(prefix + 'distance'),
+                          'energy': column(prefix + 'energy'),
+                          'size': column(prefix + 'size')})
+        return {'num_lamps': num_lamps,
+                'lamps': lamps,
+                'camera_loc': tuple(column('camera_loc_' + c) for c in 'xyz'),
+                'camera_radius': column('camera_radius'),
+                'spin_angle': column('spin_angle'),
+                'subject_size': column('subject_size')}
+
+
+def _sample_joint(distributions, names, n, sampling, rng):
+    """
+    Samples n values of each of the named distributions, either
+    independently or from one low-discrepancy point set over all of them
+    :return: list of the arrays of samples, in the order of names
+    """
+    if sampling == 'iid':
+        return [distributions[name].sample_batch(n, rng) for name in names]
+    dims = [distributions[name].dims for name in names]
+    if None in dims:
+        raise ValueError('{} cannot be sampled with {} points'.format(names[dims.index(None)], sampling))
+    u = ld.points(sampling, n, sum(dims), rng)
+    offsets = np.cumsum([0] + dims)
+    return [distributions[name].transform_batch(u[:, offsets[i]:offsets[i + 1]]) for i, name in enumerate(names)]
+
+
+def write_schedules(object_folder, schedule_folder, renders_per_product, blender_attributes=None, seed=None, products=None, sampling='iid'):
+    """
+    Samples the schedule of every product of object_folder that has no
+    schedule in schedule_folder yet, e.g. from an interrupted run
+    :param object_folder: folder with one subfolder per product
+    :param schedule_folder: folder the schedules are saved to, created if needed
+    :param renders_per_product: number of renders per product
+    :param blender_attributes: see scene_distributions
+    :param seed: seed of the schedules, the schedule of every product is
+        sampled from the stream (seed, product). None for random schedules
+    :param products: list of the products to write schedules for, None
+        for every product
+    :param sampling: see RenderSchedule.sample
+    :return: list of the products whose schedule was written
+    """
+    if not os.path.isdir(schedule_folder):
+        os.makedirs(schedule_folder)
+    written = []
+    for product in sorted(os.listdir(object_folder)):
+        if not os.path.isdir(os.path.join(object_folder, product)):
+            continue
+        if products is not None and product not in products:
+            continue
+        path = os.path.join(schedule_folder, schedule_name(product))
+        if os.path.isfile(path):
+            continue
+        rng = np.random.default_rng() if seed is None else stream(seed, product)
+        RenderSchedule.sample(renders_per_product, blender_attributes, rng, sampling).save(path)
+        written.append(product)
+    return written
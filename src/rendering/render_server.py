@@ -0,0 +1,326 @@
+"""
+Long-lived render server that runs inside Blender.
+
+Launching Blender, setting up the scene and warming up Cycles is paid only
+once: the server keeps a single RenderInterface alive and takes render jobs
+from a local socket until it is told to shut down. The pipeline side is
+render_pipeline.BlenderRenderServer, which launches Blender with this script
+and talks to it through RenderServerClient.
+
+Run inside Blender (render_pipeline.BlenderRenderServer does this for you):
+  blender --background --python render_server.py -- project_dir port authkey [--port_file path]
+
+With port 0 the server listens on a port picked by the OS and writes it to
+port_file, which the client reads with wait_for_port. The port is bound by
+the server itself, so no other process can take it in between.
+
+Like render_poses.py this file is run by Blender as a script, so the Blender
+specific imports are done in the __main__ block only. The RenderServer and
+RenderServerClient classes do not need Blender and can be imported from the
+rendering package.
+
+A job is a dictionary:
+    {
+        "cmd": "render",
+        "model_path": path to the .model file,
+        "output_folder": folder the renders and stats are saved to,
+        "num_images": number of renders,
+        "blender_attributes": dict, same format as for generate_poses,
+        "resolution": int, "samples": int,
+        "quality": name of a quality preset (see render_quality) or None,
+        "visualize_dump": bool, "dry_run": bool, "render_offset": int,
+        "seed": int or None, seed of the sampled poses,
+        "render_cache": folder of a render cache or None,
+        "render_cache_size": size bound of the render cache in MB,
+        "model_cache": folder of a model cache or None,
+        "batch_views": views rendered per scene, see RenderInterface.render_all,
+        "schedule": path to the render schedule (.npz) of the model or None
+    }
+Other commands are "ping" and "shutdown". Every job is answered with a
+dictionary with at least a "status" key, either "ok" or "error".
+"""
+import os
+import sys
+import time
+import traceback
+from multiprocessing.connection import Listener, Client
+
+try:
+    from .render_cache import RenderCache
+    from .model_cache import ModelCache
+    from .render_schedule import RenderSchedule
+except ImportError:
+    # run by Blender as a script, imported in the __main__ block
+    RenderCache = None
+    ModelCache = None
+    RenderSchedule = None
+
+
+class RenderServerError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class RenderServer(object):
+    """
+    Executes render jobs on a RenderInterface that is kept alive between jobs.
+    Between jobs the scene distributions are reset to their defaults, so a
+    job only sees the blender attributes it was given itself.
+    """
+    def __init__(self, render_interface):
+        """
+        :param render_interface: RenderInterface (or an object providing the
+        same methods) used for all jobs
+        """
+        self.render_interface = render_interface
+        self.render_settings = None
+        self.jobs_done = 0
+        # render caches by folder, kept open between jobs
+        self.render_caches = {}
+        self.model_caches = {}
+
+    def render(self, job):
+        """
+        Renders a single model according to job, see the module docstring for
+        the job format
+        :param job: job dictionary
+        :return: reply dictionary
+        """
+        RI = self.render_interface
+        start = time.time()
+
+        render_settings = (job.get('resolution', 300), job.get('samples', 128), job.get('quality'))
+        if render_settings != self.render_settings:
+            RI.set_render(*render_settings)
+            self.render_settings = render_settings
+
+        RI.num_images = job['num_images']
+        RI.reset_distributions()
+        model_folder = job.get('model_cache')
+        if model_folder and model_folder not in self.model_caches:
+            self.model_caches[model_folder] = ModelCache(model_folder)
+        RI.model_cache = self.model_caches.get(model_folder)
+        # set before loading the model, which hashes it for the render cache
+        cache_folder = job.get('render_cache')
+        if cache_folder and cache_folder not in self.render_caches:
+            self.render_caches[cache_folder] = RenderCache(cache_folder, job.get('render_cache_size', 1024) * 2**20)
+        RI.render_cache = self.render_caches.get(cache_folder)
+        RI.load_from_model(job['model_path'], job['output_folder'])
+        blender_attributes = job.get('blender_attributes')
+        if blender_attributes:
+            print("RENDER SERVER: the following attributes are supplied for this job: ")
+            RI.set_blender_attributes(blender_attributes)
+        schedule = None
+        if job.get('schedule'):
+            schedule = RenderSchedule.load(job['schedule'])
+        RI.render_all(dump_logs=True, visualize=job.get('visualize_dump', False),
+                      dry_run=job.get('dry_run', False), start_index=job.get('render_offset', 0), seed=job.get('seed'),
+                      schedule=schedule, batch_views=job.get('batch_views', 1))
+
+        self.jobs_done += 1
+        return {'status': 'ok', 'num_images': job['num_images'], 'time': time.time() - start}
+
+    def handle(self, job):
+        """
+        Dispatches a job to the matching command. Errors during a job are
+        returned to the client instead of stopping the server.
+        :param job: job dictionary
+        :return: reply dictionary
+        """
+        cmd = job.get('cmd')
+        try:
+            if cmd == 'ping':
+                return {'status': 'ok', 'jobs_done': self.jobs_done}
+            if cmd == 'render':
+                return self.render(job)
+            if cmd == 'shutdown':
+                return {'status': 'ok'}
+            return {'status': 'error', 'message': 'Unknown command {}'.format(cmd)}
+        except Exception as e:
+            traceback.print_exc()
+            return {'status': 'error', 'message': '{}: {}'.format(type(e).__name__, e)}
+
+    def serve(self, listener):
+        """
+        Serves clients connecting to listener, one at a time, until a
+        shutdown job is received
+        :param listener: multiprocessing.connection.Listener
+        :return: None
+        """
+        while True:
+            with listener.accept() as conn:
+                while True:
+                    try:
+                        job = conn.recv()
+                    except EOFError:
+                        # client went away, wait for the next one
+                        break
+                    conn.send(self.handle(job))
+                    if job.get('cmd') == 'shutdown':
+                        return
+
+
+def write_port(port_file, port):
+    """
+    Writes the port the server listens on to port_file, atomically so that
+    wait_for_port never reads a partial file
+    """
+    tmp = port_file + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(str(port))
+    os.replace(tmp, port_file)
+
+
+def wait_for_port(port_file, timeout=60.0, poll_interval=0.5, alive=None):
+    """
+    Waits for the server to write the port it listens on, see write_port
+    :param port_file: path the server writes its port to
+    :param timeout: seconds to wait for the server to come up
+    :param poll_interval: seconds between checks
+    :param alive: optional callable returning False once the server
+    process has died, to stop waiting early
+    :return: the port
+    """
+    deadline = time.time() + timeout
+    while not os.path.isfile(port_file):
+        if alive is not None and not alive():
+            raise RenderServerError("Render server process died before listening")
+        if time.time() > deadline:
+            raise RenderServerError("Render server did not report its port in {}".format(port_file))
+        time.sleep(poll_interval)
+    with open(port_file) as f:
+        return int(f.read())
+
+
+class RenderServerClient(object):
+    """
+    Client side of the render server. Sends jobs and waits for the replies.
+    """
+    def __init__(self, address, authkey, timeout=60.0, poll_interval=0.5, alive=None):
+        """
+        Connects to a running server, retrying until timeout as Blender may
+        still be starting up.
+        :param address: (host, port) of the server
+        :param authkey: bytes, shared secret of server and client
+        :param timeout: seconds to wait for the server to come up
+        :param poll_interval: seconds between connection attempts
+        :param alive: optional callable returning False once the server
+        process has died, to stop waiting early
+        """
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.conn = Client(address, authkey=authkey)
+                break
+            except (ConnectionRefusedError, OSError):
+                if alive is not None and not alive():
+                    raise RenderServerError("Render server process died before accepting connections")
+                if time.time() > deadline:
+                    raise RenderServerError("Could not connect to render server at {}".format(address))
+                time.sleep(poll_interval)
+
+    def request(self, job):
+        """
+        Sends a job to the server and returns its reply
+        :param job: job dictionary
+        :return: reply dictionary
+        """
+        self.conn.send(job)
+        reply = self.conn.recv()
+        if reply.get('status') != 'ok':
+            raise RenderServerError(reply.get('message'))
+        return reply
+
+    def render(self, model_path, output_folder, num_images, blender_attributes=None, resolution=300, samples=128,
+               visualize_dump=False, dry_run=False, render_offset=0, seed=None, render_cache=None, render_cache_size=1024,
+               schedule=None, model_cache=None, batch_views=1, quality=None):
+        """
+        Renders num_images poses of the model into output_folder.
+        See the module docstring for the meaning of the arguments.
+        :return: reply dictionary
+        """
+        return self.request({'cmd': 'render',
+                             'model_path': model_path,
+                             'output_folder': output_folder,
+                             'num_images': num_images,
+                             'blender_attributes': blender_attributes or {},
+                             'resolution': resolution,
+                             'samples': samples,
+                             'visualize_dump': visualize_dump,
+                             'dry_run': dry_run,
+                             'render_offset': render_offset,
+                             'seed': seed,
+                             'render_cache': render_cache,
+                             'render_cache_size': render_cache_size,
+                             'schedule': schedule,
+                             'model_cache': model_cache,
+                             'batch_views': batch_views,
+                             'quality': quality})
+
+    def ping(self):
+        return self.request({'cmd': 'ping'})
+
+    def shutdown(self):
+        """
+        Asks the server to exit and closes the connection
+        """
+        try:
+            self.request({'cmd': 'shutdown'})
+        finally:
+            self.conn.close()
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    argv = sys.argv
+    if "--" not in argv:
+        argv = []  # as if no args are passed
+    else:
+        argv = argv[argv.index("--") + 1:]  # get all args after "--"
+
+    usage_text = (
+        "Run blender in background mode with this script:"
+        "  blender --background --python " + __file__ + " -- [options]"
+    )
+    parser = argparse.ArgumentParser(description=usage_text)
+    parser.add_argument('project_dir', help='path to source code')
+    parser.add_argument('port', type=int, help='local port to listen on, 0 lets the OS pick a free one')
+    parser.add_argument('authkey', help='shared secret of server and client')
+    parser.add_argument('--port_file', default=None, help='file the port listened on is written to')
+    parser.add_argument('--resolution', type=int, default=300, help='initial resolution of rendered object pose')
+    parser.add_argument('--samples', type=int, default=128, help='initial rendering samples')
+    parser.add_argument('--scene_template', action='store_true',
+                        help='keep the subjects and their materials between jobs, only swapping meshes and textures')
+    args = parser.parse_args(argv)
+
+    if not argv:
+        parser.print_help()
+        exit(-1)
+
+    # Ensure source directory in Blender python path
+    sys.path.append(os.path.join(args.project_dir))
+    import rendering.RenderInterface as Render
+    from rendering.render_cache import RenderCache
+    from rendering.model_cache import ModelCache
+    from rendering.render_schedule import RenderSchedule
+
+    RI = Render.RenderInterface(num_images=0, resolution=args.resolution, samples=args.samples,
+                                scene_template=args.scene_template)
+    server = RenderServer(RI)
+    server.render_settings = (args.resolution, args.samples, None)
+
+    # Blender output goes to blender_render.log for the whole session
+    with RI.log, Listener(('localhost', args.port), authkey=args.authkey.encode()) as listener:
+        port = listener.address[1]
+        if args.port_file:
+            write_port(args.port_file, port)
+        print("RENDER SERVER: listening on port {}".format(port), file=sys.stderr)
+        server.serve(listener)
+    print("RENDER SERVER: shutting down after {} jobs".format(server.jobs_done), file=sys.stderr)
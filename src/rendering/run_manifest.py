@@ -0,0 +1,148 @@
+"""
+Checkpoint manifest of a full_run, so an interrupted run can be resumed.
+
+The manifest is a json file in the workspace recording, per stage, a key
+hashing the parameters of the stage and which products are complete:
+
+    {
+        "render": {"key": hash of the render parameters,
+                   "products": {product: {"inputs": hash of the model folder,
+                                          "complete": bool}}},
+        "merge": {"key": hash of the render key and merge parameters,
+                  "seed": seed of the merge,
+                  "products": {product: bounding boxes of its final images}}
+    }
+
+A change of the render parameters invalidates everything, a change of the
+merge parameters only the merged images, and a changed model folder only
+the renders and merged images of its product.
+"""
+import hashlib
+import json
+import os
+
+
+def hash_folder(folder):
+    """
+    Content hash of a folder: names and contents of all files in it
+    :param folder: path to the folder
+    :return: hex digest
+    """
+    sha = hashlib.sha1()
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            sha.update(os.path.relpath(path, folder).replace(os.sep, '/').encode('utf-8'))
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(block)
+    return sha.hexdigest()
+
+
+def hash_params(params):
+    """
+    Hash of json serializable parameters
+    :param params: dictionary of parameters
+    :return: hex digest
+    """
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class RunManifest(object):
+    """
+    Manifest stored at path, created empty if there is no file yet.
+    Every change is written to disk immediately, so the manifest is up to
+    date whenever the run is interrupted.
+    :param path: path of the json file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = {'render': {'key': None, 'products': {}},
+                     'merge': {'key': None, 'seed': None, 'products': {}}}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.data = json.load(f)
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            # the bounding boxes of the final images hold numpy integers
+            json.dump(self.data, f, sort_keys=True, indent=4, separators=(',', ': '), default=int)
+        os.replace(tmp, self.path)
+
+    def start_render(self, key):
+        """
+        Starts the render stage with parameters hashing to key
+        :return: True if the key changed, i.e. no render can be reused
+        """
+        if self.data['render']['key'] == key:
+            return False
+        self.data['render'] = {'key': key, 'products': {}}
+        self.data['merge'] = {'key': None, 'seed': None, 'products': {}}
+        self.save()
+        return True
+
+    def render_inputs(self, product):
+        """
+        :return: hash of the model folder the renders of product were
+            started with, None if product was never rendered
+        """
+        return self.data['render']['products'].get(product, {}).get('inputs')
+
+    def rendered(self, product, inputs):
+        """
+        :return: True if all renders of product are complete and were made
+            from a model folder hashing to inputs
+        """
+        entry = self.data['render']['products'].get(product)
+        return entry is not None and entry['complete'] and entry['inputs'] == inputs
+
+    def begin_render(self, product, inputs):
+        """
+        Marks product as being rendered, its merged images become invalid
+        """
+        self.data['render']['products'][product] = {'inputs': inputs, 'complete': False}
+        self.data['merge']['products'].pop(product, None)
+        self.save()
+
+    def finish_render(self, product):
+        self.data['render']['products'][product]['complete'] = True
+        self.save()
+
+    def start_merge(self, key):
+        """
+        Starts the merge stage with parameters hashing to key
+        :return: True if the key changed, i.e. no merged image can be reused
+        """
+        if self.data['merge']['key'] == key:
+            return False
+        self.reset_merge(key)
+        return True
+
+    def reset_merge(self, key=None):
+        self.data['merge'] = {'key': key, 'seed': None, 'products': {}}
+        self.save()
+
+    @property
+    def merge_seed(self):
+        return self.data['merge']['seed']
+
+    @merge_seed.setter
+    def merge_seed(self, seed):
+        self.data['merge']['seed'] = seed
+        self.save()
+
+    def merged(self, product):
+        return product in self.data['merge']['products']
+
+    def merged_bboxes(self, product):
+        return self.data['merge']['products'][product]
+
+    def finish_merge(self, product, bboxes):
+        """
+        Marks all final images of product as complete
+        :param bboxes: dictionary of the bounding boxes of its images
+        """
+        self.data['merge']['products'][product] = bboxes
+        self.save()
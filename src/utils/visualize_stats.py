@@ -1,15 +1,16 @@
 import os
-import json
 from mpl_toolkits.mplot3d import Axes3D
 import matplotlib.pyplot as plt
 from ..rendering.RandomLib import random_render as rr
+from ..rendering.RandomLib.param_log import load_logs
 
 """
-Script to visualize rendering stats in the parameter output logs json generated during rendering
+Script to visualize rendering stats in the parameter output logs generated during rendering
+(randomvars_dump.npz, or randomvars_dump.json of older runs)
 """
 
 output_folder = 'D:\\PycharmProjects\\Lobster\\data\\logs\\rendering_debug_logs\\spread_cam_radius\\Anchor_stats'
-stats_file = os.path.join(output_folder, 'randomvars_dump.json')
+stats_file = os.path.join(output_folder, 'randomvars_dump.npz')
 
 def make_ring(samples=100,normal='X'):
     D = rr.CompositeShellRingDist(0, normal)
@@ -20,16 +21,13 @@ def make_ring(samples=100,normal='X'):
 
 def plot_stats(stats_file, output_folder):
 
-    with open(stats_file) as json_data:
-        logs = json.load(json_data)
+    logs = load_logs(stats_file)
 
     fig = plt.figure()
     ax = fig.add_subplot(111, projection='3d')
     camera_locations = logs['camera_loc']
 
-    X = [loc[0] for loc in camera_locations]
-    Y = [loc[1] for loc in camera_locations]
-    Z = [loc[2] for loc in camera_locations]
+    X, Y, Z = camera_locations[:, 0], camera_locations[:, 1], camera_locations[:, 2]
 
     ax.scatter(X, Y, zs=Z)
     ax.set_zlim([-1, 1])
@@ -65,9 +63,7 @@ def plot_stats(stats_file, output_folder):
     ax = fig.add_subplot(111, projection='3d')
     lamp_locations = logs['lamp_loc']
 
-    X = [loc[0] for loc in lamp_locations]
-    Y = [loc[1] for loc in lamp_locations]
-    Z = [loc[2] for loc in lamp_locations]
+    X, Y, Z = lamp_locations[:, 0], lamp_locations[:, 1], lamp_locations[:, 2]
 
     ax.scatter(X, Y, zs=Z)
     ax.set_zlim([-1, 1])